@@ -3,18 +3,30 @@
 
 import time
 import logging
-import sys
+import threading
 import os
-from datetime import datetime, timedelta
-from pathlib import Path
+from datetime import datetime
 
-from auth.gmail_auth import gmail_authenticate
-from services.gmail_service import search_messages, get_message_details
+from utils.startup_timing import startup_timer
+if __name__ == "__main__":
+    startup_timer.start()
+
+from services.accounts import load_accounts, RoundRobinScheduler
+from services.gmail_service import search_messages, get_message_details, parse_parts
+from services.attachment_store import AttachmentStore
 from services.notification_service import NotificationService
+from services.llama_service import get_llama_cascade
+from services.pipeline import Pipeline, Stage
+from services.poll_scheduler import PollScheduler
+from services.push_receiver import PushReceiver
+from services.notification_outbox import NotificationOutbox, start_outbox_workers, stop_outbox_workers
 from utils.email_parser import is_important_email, extract_email_data
-from utils.whatsapp_notifications import send_whatsapp_message
+from utils.simhash import SimHashIndex, email_fingerprint
 import config.settings as settings
 
+if __name__ == "__main__":
+    startup_timer.stop_imports()
+
 # Create directories if they don't exist
 os.makedirs('logs', exist_ok=True)
 os.makedirs('data', exist_ok=True)
@@ -32,171 +44,400 @@ logger = logging.getLogger(__name__)
 
 class GmailMonitor:
     def __init__(self):
-        self.service = None
-        self.notification_service = NotificationService({
+        self.accounts = load_accounts()
+        self.scheduler = RoundRobinScheduler()
+        self.notification_service = NotificationService(self.notification_config())
+        self.outbox = NotificationOutbox()
+        self.outbox_workers = []
+        self.fingerprints = SimHashIndex(settings.NEAR_DUPLICATE_MAX_DISTANCE, settings.NEAR_DUPLICATE_WINDOW_SECONDS)
+        self.poll_scheduler = PollScheduler()
+        self.attachment_store = None
+        self.last_poll_new_count = 0
+        # Push notifications wake the loop early for the mailboxes they name
+        self.wake_event = threading.Event()
+        self.push_receiver = None
+        self.push_lock = threading.Lock()
+        self.pushed_accounts = set()
+        self.last_push_at = None
+        self.push_suspect = False
+
+    @staticmethod
+    def notification_config():
+        """Build the notification service config from the current settings"""
+        return {
             'TELEGRAM_BOT_TOKEN': settings.TELEGRAM_BOT_TOKEN,
             'TELEGRAM_CHAT_ID': settings.TELEGRAM_CHAT_ID,
             'WHATSAPP_ENABLED': settings.WHATSAPP_ENABLED,
             'WHATSAPP_PHONE': settings.WHATSAPP_PHONE
-        })
-        self.processed_ids = set()
-        self.last_check_time = None
-        self.load_processed_ids()
-
-    def load_processed_ids(self):
-        """Load processed email IDs from file"""
-        id_file = Path('data/processed_emails.txt')
-        try:
-            if id_file.exists():
-                with open(id_file, 'r') as f:
-                    for line in f:
-                        email_id = line.strip()
-                        if email_id:
-                            self.processed_ids.add(email_id)
-                logger.info(f"Loaded {len(self.processed_ids)} processed email IDs")
-            else:
-                logger.info("No processed emails file found, starting fresh")
-        except Exception as e:
-            logger.error(f"Error loading processed email IDs: {e}")
+        }
 
-    def save_processed_id(self, email_id):
-        """Save ID of a processed email"""
-        try:
-            with open('data/processed_emails.txt', 'a') as f:
-                f.write(f"{email_id}\n")
-            self.processed_ids.add(email_id)
-        except Exception as e:
-            logger.error(f"Error saving processed email ID: {e}")
+    def authenticated_accounts(self):
+        """Return the accounts that authenticated successfully"""
+        return [account for account in self.accounts if account.service]
 
     def authenticate(self):
-        """Authenticate to Gmail API"""
+        """
+        Authenticate every monitored account
+        
+        Returns:
+            bool: True if at least one account authenticated
+        """
+        for account in self.accounts:
+            account.authenticate()
+        authenticated = self.authenticated_accounts()
+        if authenticated and len(self.accounts) > 1:
+            logger.info(f"Monitoring {len(authenticated)} of {len(self.accounts)} accounts: "
+                        f"{', '.join(account.name for account in authenticated)}")
+        return bool(authenticated)
+
+    def stop_accounts(self):
+        """Stop background token refresh for every account"""
+        for account in self.accounts:
+            account.stop()
+
+    def start_push(self):
+        """Start the push receiver and the Gmail watches when push is enabled"""
+        if not settings.PUSH_ENABLED:
+            return
+        for account in self.authenticated_accounts():
+            account.load_profile()
+        receiver = PushReceiver(self.handle_push)
         try:
-            self.service = gmail_authenticate()
-            logger.info("Authentication successful")
-            return True
-        except Exception as e:
-            logger.error(f"Authentication failed: {e}")
+            receiver.start()
+        except ValueError as e:
+            logger.error(f"Push notifications disabled: {e}")
+            return
+        self.push_receiver = receiver
+        if not settings.GMAIL_PUSH_TOPIC:
+            logger.info("No GMAIL_PUSH_TOPIC set, accepting pushes from a local publisher only")
+        self.renew_watches()
+
+    def stop_push(self):
+        """Stop the push receiver"""
+        if self.push_receiver:
+            self.push_receiver.stop()
+            self.push_receiver = None
+
+    def renew_watches(self):
+        """Renew Gmail watches that are due"""
+        if not self.push_receiver or not settings.GMAIL_PUSH_TOPIC:
+            return
+        for account in self.authenticated_accounts():
+            if account.watch_due(settings.PUSH_WATCH_RENEW_SECONDS):
+                account.start_watch(settings.GMAIL_PUSH_TOPIC)
+
+    def push_active(self):
+        """Whether pushes can be relied on, leaving polls as a safety net only"""
+        if not self.push_receiver or self.push_suspect:
             return False
+        if settings.GMAIL_PUSH_TOPIC:
+            now = time.time()
+            return all(account.watch_expires_at and account.watch_expires_at > now
+                       for account in self.authenticated_accounts())
+        # Without a watch, trust pushes only while the local publisher keeps sending them
+        return self.last_push_at is not None and time.time() - self.last_push_at <= settings.PUSH_STALE_SECONDS
+
+    def handle_push(self, email_address, history_id):
+        """Schedule an immediate sync of the mailbox a push notification names"""
+        account = next((account for account in self.authenticated_accounts()
+                        if account.email_address == email_address.lower()), None)
+        if not account:
+            logger.warning(f"Ignoring push for unmonitored mailbox {email_address}")
+            return
+        logger.info(f"Push received for account {account.name} (history {history_id})")
+        with self.push_lock:
+            self.pushed_accounts.add(account.name)
+            self.last_push_at = time.time()
+            self.push_suspect = False
+        self.wake()
+
+    def take_pushed_accounts(self):
+        """Return and clear the accounts named by pushes since the last check"""
+        with self.push_lock:
+            names, self.pushed_accounts = self.pushed_accounts, set()
+        return [account for account in self.authenticated_accounts() if account.name in names]
+
+    def wake(self):
+        """Wake the loop so the next check runs now"""
+        self.wake_event.set()
+
+    def wait_for_work(self, timeout):
+        """Sleep until the next check is due or a push or shutdown wakes the loop"""
+        self.wake_event.wait(timeout)
+
+    def list_new_messages(self, account, full_sweep=False):
+        """
+        List an account's unprocessed messages for this poll
+        
+        With push enabled, only messages added since the last synced history ID
+        are listed, narrowed to the prefilter's matches when it is on. Otherwise,
+        on a full sweep, or if that fails, the mailbox is searched.
+        
+        Returns:
+            list: Message IDs, or None if the search failed
+        """
+        message_ids = account.list_changes() if settings.PUSH_ENABLED else None
+        if message_ids is not None and not full_sweep:
+            logger.info(f"Incremental sync of account {account.name} found {len(message_ids)} new emails")
+            message_ids = [message_id for message_id in message_ids if not account.is_processed(message_id)]
+            if settings.QUERY_PREFILTER_ENABLED and message_ids:
+                # Listing the matches is one cheap call; downloading the rest is not
+                response = search_messages(account.service, account.build_search_query(), max_results=500)
+                if response is not None:
+                    matching = {message.get('id') for message in response.get('messages', [])}
+                    message_ids = [message_id for message_id in message_ids if message_id in matching]
+                    logger.info(f"{len(message_ids)} of them match the prefilter")
+            return message_ids
+        
+        query = account.build_search_query(full_sweep)
+        logger.info(f"Searching account {account.name} for emails with query: {query}")
+        # A sweep looks further back, past mail earlier polls already handled
+        response = search_messages(account.service, query, max_results=500 if full_sweep else 100)
+        if not response:
+            logger.info(f"No response or no messages found for account {account.name}")
+            return None
+        
+        messages = response.get('messages', [])
+        if full_sweep:
+            # Skip processed emails before capping, so the sweep reaches older unprocessed ones
+            message_ids = [message.get('id') for message in messages if not account.is_processed(message.get('id'))]
+            return message_ids[:settings.MAX_RESULTS_PER_QUERY]
+        # Skip emails we've already processed
+        return [message.get('id') for message in messages[:settings.MAX_RESULTS_PER_QUERY]
+                if not account.is_processed(message.get('id'))]
+
+    def build_pipeline(self):
+        """Build the fetch, parse, classify and notify pipeline for a batch of message IDs"""
+        stages = [
+            Stage('fetch', self.fetch_stage, settings.PIPELINE_FETCH_WORKERS),
+            Stage('parse', self.parse_stage, settings.PIPELINE_PARSE_WORKERS),
+            Stage('classify', self.classify_stage, settings.PIPELINE_CLASSIFY_WORKERS),
+            Stage('notify', self.notify_stage, settings.PIPELINE_NOTIFY_WORKERS)
+        ]
+        if settings.ATTACHMENTS_ENABLED:
+            self.attachment_store = AttachmentStore()
+            # A stage of its own, so large downloads never hold up notifications
+            stages.append(Stage('attachments', self.attachments_stage, settings.PIPELINE_NOTIFY_WORKERS))
+        return Pipeline(stages, queue_size=settings.PIPELINE_QUEUE_SIZE)
+
+    def fetch_stage(self, work):
+        """Pipeline stage: download the full message"""
+        account, message_id = work
+        message_data = get_message_details(account.thread_services.get(), message_id, projection='full')
+        if not message_data:
+            return None
+        return {'account': account, 'message_id': message_id, 'message_data': message_data}
+
+    def parse_stage(self, item):
+        """Pipeline stage: extract email data and fold near-duplicates of recent alerts"""
+        message_data = item['message_data']
+        
+        # Extract email data early to use in logging
+        email_data = extract_email_data(message_data)
+        logger.info(f"Processing email: {email_data['subject']} from {email_data['sender']}")
+        
+        # Fold near-duplicates of a recent alert before spending an LLM call on them
+        item['email_data'] = email_data
+        item['received_at'] = int(message_data.get('internalDate', 0)) / 1000 or time.time()
+        item['fingerprint'] = email_fingerprint(email_data) if settings.NEAR_DUPLICATE_ENABLED else None
+        if self._fold_duplicate(item):
+            return None
+        return item
+
+    def classify_stage(self, item):
+        """Pipeline stage: decide whether the email is important"""
+        email_data = item['email_data']
+        if not is_important_email(email_data):
+            logger.debug(f"Email not flagged as important: {email_data['subject']}")
+            # Mark as processed regardless of importance
+            item['account'].save_processed_id(item['message_id'])
+            return None
+        
+        logger.info(f"Important email found - Subject: {email_data['subject']}")
+        return item
 
-    def build_search_query(self):
-        """Build Gmail search query based on time"""
-        query = ""
+    def notify_stage(self, item):
+        """Pipeline stage: queue notifications for an important email"""
+        account = item['account']
+        message_id = item['message_id']
+        email_data = item['email_data']
         
-        # Add time constraint if we have a last check time
-        if self.last_check_time:
-            # Convert to Gmail's search format
-            after_date = self.last_check_time.strftime("%Y/%m/%d")
-            query += f"after:{after_date} "
-        else:
-            # Default to last 24 hours if no previous check time
-            query += "newer_than:1d "
+        # Classification runs in parallel, so check again for a duplicate alerted meanwhile
+        if self._fold_duplicate(item):
+            return None
+        if item['fingerprint']:
+            self.fingerprints.add(item['fingerprint'], account.key(message_id), item['received_at'])
         
-        # Only get unread emails
-        query += "is:unread"
+        # Queue notifications; the outbox workers deliver them in the background
+        try:
+            self.outbox.enqueue(
+                account.key(message_id),
+                self.notification_service.enabled_channels(),
+                {
+                    'subject': email_data['subject'],
+                    'body': email_data['body'],
+                    'sender': email_data['sender'],
+                    'received_time': item['message_data']['internalDate']
+                }
+            )
+            logger.info(f"Notifications queued for email {message_id}")
+        except Exception as e:
+            # Leave the email unprocessed so the next poll queues it again
+            logger.error(f"Failed to queue notifications for email {message_id}: {e}")
+            return None
         
-        return query
+        account.save_processed_id(message_id)
+        return item
+
+    def attachments_stage(self, item):
+        """Pipeline stage: save an important email's attachments"""
+        payload = item['message_data'].get('payload', {})
+        attachments = parse_parts(None, payload.get('parts'), item['message_id'])['attachments']
+        if attachments:
+            stored = self.attachment_store.download_all(item['account'].thread_services.get, item['message_id'], attachments)
+            logger.info(f"Saved {sum(1 for file in stored if file)} of {len(attachments)} attachments "
+                        f"of email {item['message_id']}")
+        return item
+
+    def _fold_duplicate(self, item):
+        """Fold an email into a recent alert it nearly duplicates, returning True if it did"""
+        if not item['fingerprint']:
+            return False
+        original = self.fingerprints.fold(item['fingerprint'], item['received_at'])
+        if not original:
+            return False
+        logger.info(f"Email {item['account'].key(item['message_id'])} is a near-duplicate of alerted email "
+                    f"{original.key} ({original.duplicates} folded so far), skipping")
+        item['account'].save_processed_id(item['message_id'])
+        return True
 
-    def check_for_new_emails(self):
-        """Check for new important emails"""
-        if not self.service:
+    def check_for_new_emails(self, accounts=None):
+        """
+        Check accounts for new important emails
+        
+        All accounts share one pipeline. Their messages are interleaved round-robin,
+        so the fetch workers, LLM and outbox are shared fairly between mailboxes.
+        
+        Args:
+            accounts: Accounts to check, defaults to every authenticated account
+        
+        Returns:
+            bool: True if every account was checked, False if any could not be
+        """
+        self.last_poll_new_count = 0
+        accounts = accounts or self.authenticated_accounts()
+        if not accounts:
             logger.warning("Not authenticated, skipping email check")
-            return
+            return False
+        
+        ok = True
+        batches = []
+        for account in accounts:
+            # Record the current time as the account's check time
+            check_time = datetime.now()
+            full_sweep = account.sweep_due(check_time)
+            if full_sweep:
+                logger.info(f"Full sweep of account {account.name} for mail the prefilter skipped")
+            try:
+                message_ids = self.list_new_messages(account, full_sweep)
+            except Exception as e:
+                logger.exception(f"Error searching account {account.name}: {e}")
+                message_ids = None
+            if message_ids is None:
+                ok = False
+                continue
+            account.last_check_time = check_time
+            if full_sweep and len(message_ids) < settings.MAX_RESULTS_PER_QUERY:
+                # A capped sweep is not done yet; the next poll sweeps again
+                account.last_sweep_time = check_time
+            if message_ids:
+                batches.append((account, message_ids))
         
-        # Record the current time as our check time
-        current_check_time = datetime.now()
+        if not batches:
+            logger.info("No new emails found")
+            return ok
         
-        # Build and execute search
-        query = self.build_search_query()
-        logger.info(f"Searching for emails with query: {query}")
+        total = sum(len(message_ids) for _, message_ids in batches)
+        self.last_poll_new_count = total
+        logger.info(f"Found {total} new emails, checking importance...")
         
         try:
-            response = search_messages(self.service, query)
-            if not response:
-                logger.info("No response or no messages found")
-                return
-                
-            messages = response.get('messages', [])
-            
-            if not messages:
-                logger.info("No new emails found")
-                return
-                
-            logger.info(f"Found {len(messages)} new emails, checking importance...")
-            
-            important_count = 0
+            pipeline = self.build_pipeline()
+            metrics = pipeline.run(self.scheduler.order(batches))
+            pipeline.log_metrics(logger)
             
-            for message in messages[:settings.MAX_RESULTS_PER_QUERY]:
-                message_id = message.get('id')
-                
-                # Skip if we've already processed this email
-                if message_id in self.processed_ids:
-                    continue
-                    
-                # Get full message details
-                message_data = get_message_details(self.service, message_id)
-                
-                if not message_data:
-                    continue
-                
-                # Extract email data early to use in logging
-                email_data = extract_email_data(message_data)
-                logger.info(f"Processing email: {email_data['subject']} from {email_data['sender']}")
-                
-                # Check if this email is important
-                if is_important_email(email_data):
-                    important_count += 1
-                    logger.info(f"Important email found - Subject: {email_data['subject']}")
-                    
-                    # Send notifications through the notification service
-                    notification_results = self.notification_service.send_notification(
-                        email_data['subject'],
-                        email_data['body'],
-                        email_data['sender'],
-                        message_data['internalDate']
-                    )
-                    
-                    if notification_results:
-                        logger.info(f"Notifications sent for email {message_id}")
-                    else:
-                        logger.warning(f"Failed to send notifications for email {message_id}")
-                else:
-                    logger.debug(f"Email not flagged as important: {email_data['subject']}")
-                    
-                # Mark as processed regardless of importance
-                self.save_processed_id(message_id)
+            important_count = metrics['notify']['processed'] - metrics['notify']['dropped']
+            logger.info(f"Found {important_count} important emails out of {total} new emails")
             
-            logger.info(f"Found {important_count} important emails out of {len(messages)} new emails")
+            llama_metrics = get_llama_cascade().get_metrics()
+            logger.info(f"Llama requests: {llama_metrics['requests']}, "
+                        f"escalation rate: {llama_metrics['escalation_rate']:.1%}")
+            return ok
             
         except Exception as e:
             logger.exception(f"Error checking emails: {e}")
-        finally:
-            # Update the last check time
-            self.last_check_time = current_check_time
+            return False
+
+    def run_cycle(self):
+        """
+        Run one check and pick the delay before the next
+        
+        After a push only the mailboxes it named are synced. Otherwise every
+        mailbox is polled. While pushes are working, polls are only a safety net
+        every PUSH_SAFETY_POLL_SECONDS. Polls resume their normal schedule when
+        a poll finds mail no push announced, or when a watch lapses.
+        
+        Returns:
+            tuple: (ok, seconds to wait before the next check)
+        """
+        self.wake_event.clear()
+        pushed = self.take_pushed_accounts()
+        ok = self.check_for_new_emails(pushed or None)
+        
+        if not pushed and self.last_poll_new_count and self.push_active():
+            logger.warning("Polling found mail no push announced, polling normally until pushes resume")
+            self.push_suspect = True
+        self.renew_watches()
+        
+        if self.push_active():
+            return ok, settings.PUSH_SAFETY_POLL_SECONDS
+        # Sleep until next check, sooner while mail is arriving
+        return ok, self.poll_scheduler.next_interval(self.last_poll_new_count > 0, ok)
 
     def run(self):
         """Run the email monitoring loop"""
-        if not self.authenticate():
+        with startup_timer.stage('authenticate'):
+            authenticated = self.authenticate()
+        if not authenticated:
             logger.error("Failed to authenticate, exiting")
             return
+        startup_timer.log_report(logger, details=settings.STARTUP_REPORT)
             
         logger.info("Starting Gmail monitor")
+        self.outbox_workers = start_outbox_workers(self.outbox, self.notification_service)
         
         try:
+            self.start_push()
             while True:
-                self.check_for_new_emails()
+                ok, interval = self.run_cycle()
                 
-                # Sleep until next check
-                logger.info(f"Sleeping for {settings.CHECK_INTERVAL_SECONDS} seconds")
-                time.sleep(settings.CHECK_INTERVAL_SECONDS)
+                logger.info(f"Sleeping for {interval:.0f} seconds")
+                self.wait_for_work(interval)
                 
         except KeyboardInterrupt:
             logger.info("Received keyboard interrupt, shutting down")
         except Exception as e:
             logger.exception(f"Unexpected error: {e}")
+        finally:
+            self.stop_push()
+            stop_outbox_workers(self.outbox_workers)
+            self.notification_service.flush_digests()
+            self.stop_accounts()
             
         logger.info("Gmail monitor stopped")
 
 if __name__ == "__main__":
     logger.info("Gmail Monitor starting up...")
-    monitor = GmailMonitor()
+    with startup_timer.stage('init'):
+        monitor = GmailMonitor()
     monitor.run()
\ No newline at end of file
@@ -0,0 +1,168 @@
+import os
+import pickle
+import tempfile
+import threading
+import logging
+from datetime import datetime, timezone
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+# If modifying these scopes, delete the token file
+SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+
+# Used when a token carries no expiry, to still check it now and then
+DEFAULT_CHECK_SECONDS = 3600
+
+def _utcnow():
+    # google-auth keeps expiry as a naive UTC datetime
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class CredentialManager:
+    """
+    Owns the Gmail OAuth credentials for the whole process
+
+    One Credentials object is shared by every API client. A background thread
+    refreshes it refresh_margin_seconds before expiry, ahead of the client
+    library's own refresh threshold, so requests never stop to refresh a token
+    themselves. Tokens are stored as JSON and written atomically; a legacy
+    pickle token is migrated on first load.
+    """
+
+    def __init__(self, token_file=None, credentials_file=None, scopes=None,
+                 refresh_margin_seconds=None, retry_seconds=None):
+        token_file = token_file or os.getenv('GMAIL_TOKEN_FILE', 'token.pickle')
+        root, extension = os.path.splitext(token_file)
+        # Older installs pointed GMAIL_TOKEN_FILE at a pickle; keep the JSON next to it
+        self.legacy_token_file = token_file if extension == '.pickle' else None
+        self.token_file = f"{root}.json" if self.legacy_token_file else token_file
+        self.credentials_file = credentials_file or os.getenv('GMAIL_CREDENTIALS_FILE', 'credentials.json')
+        self.scopes = scopes or SCOPES
+        self.refresh_margin_seconds = refresh_margin_seconds or settings.GMAIL_TOKEN_REFRESH_MARGIN_SECONDS
+        self.retry_seconds = retry_seconds or settings.GMAIL_TOKEN_REFRESH_RETRY_SECONDS
+        self.creds = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _load_stored(self):
+        from google.oauth2.credentials import Credentials
+
+        if os.path.exists(self.token_file):
+            return Credentials.from_authorized_user_file(self.token_file, self.scopes)
+        if self.legacy_token_file and os.path.exists(self.legacy_token_file):
+            logger.info(f"Migrating pickled token {self.legacy_token_file} to {self.token_file}")
+            with open(self.legacy_token_file, 'rb') as token:
+                return pickle.load(token)
+        return None
+
+    def _save(self, creds):
+        directory = os.path.dirname(os.path.abspath(self.token_file))
+        os.makedirs(directory, exist_ok=True)
+        # mkstemp creates the file readable by the owner only
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.token.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                file.write(creds.to_json())
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.token_file)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self):
+        """
+        Return the shared credentials, loading, refreshing or obtaining them on first use
+
+        Runs the interactive OAuth flow only when there is no usable refresh token.
+        """
+        with self.lock:
+            if self.creds is not None:
+                return self.creds
+
+            creds = self._load_stored()
+            if not creds or not creds.valid:
+                if creds and creds.expired and creds.refresh_token:
+                    from google.auth.transport.requests import Request
+                    creds.refresh(Request())
+                else:
+                    from google_auth_oauthlib.flow import InstalledAppFlow
+                    flow = InstalledAppFlow.from_client_secrets_file(self.credentials_file, self.scopes)
+                    # Use a specific port that matches one of your registered redirect URIs
+                    creds = flow.run_local_server(port=8080)
+                self._save(creds)
+            elif not os.path.exists(self.token_file):
+                # Freshly migrated from pickle
+                self._save(creds)
+
+            self.creds = creds
+            return creds
+
+    def seconds_until_refresh(self):
+        """Seconds until the token should be refreshed, 0 if it is due now"""
+        creds = self.get()
+        if not creds.expiry:
+            return DEFAULT_CHECK_SECONDS
+        remaining = (creds.expiry - _utcnow()).total_seconds()
+        return max(0.0, remaining - self.refresh_margin_seconds)
+
+    def refresh(self):
+        """
+        Refresh the shared credentials in place and persist them
+
+        Clients holding the credentials pick up the new token on their next request.
+
+        Returns:
+            bool: True if the refresh succeeded
+        """
+        from google.auth.transport.requests import Request
+
+        creds = self.get()
+        try:
+            with self.lock:
+                creds.refresh(Request())
+                self._save(creds)
+            logger.info(f"Refreshed Gmail credentials, valid until {creds.expiry} UTC")
+            return True
+        except Exception as e:
+            logger.error(f"Error refreshing Gmail credentials: {e}")
+            return False
+
+    def _run(self):
+        delay = self.seconds_until_refresh()
+        while not self.stop_event.wait(delay):
+            if self.refresh():
+                delay = self.seconds_until_refresh()
+            else:
+                # Keep retrying; the old token may still be valid for a while
+                delay = self.retry_seconds
+
+    def start(self):
+        """Start refreshing the credentials in the background"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.get()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='gmail-credential-refresh', daemon=True)
+        self.thread.start()
+        logger.info(f"Background credential refresh started, next in {self.seconds_until_refresh():.0f}s")
+
+    def stop(self):
+        """Stop the background refresh thread"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+_credential_manager = None
+_credential_manager_lock = threading.Lock()
+
+def get_credential_manager():
+    """Get the process-wide credential manager"""
+    global _credential_manager
+    with _credential_manager_lock:
+        if _credential_manager is None:
+            _credential_manager = CredentialManager()
+        return _credential_manager
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import threading
+import logging
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+API_NAME = 'gmail'
+API_VERSION = 'v1'
+DISCOVERY_URL = f"https://gmail.googleapis.com/$discovery/rest?version={API_VERSION}"
+
+# Discovery document shared by every client built in this process
+_discovery_document = None
+_discovery_lock = threading.Lock()
+
+def _read_cached_document(path):
+    try:
+        with open(path, 'r') as file:
+            return file.read() or None
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"Could not read cached discovery document {path}: {e}")
+        return None
+
+def _write_cached_document(path, document):
+    try:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.discovery.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            file.write(document)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not cache discovery document to {path}: {e}")
+
+def _bundled_document():
+    # google-api-python-client 2.x ships discovery documents for the Google APIs
+    try:
+        from googleapiclient import discovery_cache
+        return discovery_cache.get_static_doc(API_NAME, API_VERSION)
+    except (ImportError, AttributeError):
+        return None
+
+def _fetch_document():
+    import requests
+    response = requests.get(DISCOVERY_URL, timeout=30)
+    response.raise_for_status()
+    return response.text
+
+def load_discovery_document(offline=None):
+    """
+    Load the Gmail discovery document once per process
+
+    Sources are tried in order: the disk cache, the document bundled with
+    googleapiclient, then the network unless offline. A fetched document is
+    written to the disk cache for later runs.
+
+    Args:
+        offline: Never fetch over the network, defaults to GMAIL_DISCOVERY_OFFLINE
+
+    Returns:
+        str: The discovery document as JSON
+
+    Raises:
+        RuntimeError: If no document is available
+    """
+    global _discovery_document
+    offline = settings.GMAIL_DISCOVERY_OFFLINE if offline is None else offline
+
+    with _discovery_lock:
+        if _discovery_document:
+            return _discovery_document
+
+        document = _read_cached_document(settings.GMAIL_DISCOVERY_CACHE_FILE)
+        source = 'disk cache'
+        if not document:
+            document = _bundled_document()
+            source = 'bundled copy'
+        if not document and not offline:
+            document = _fetch_document()
+            source = 'network'
+            _write_cached_document(settings.GMAIL_DISCOVERY_CACHE_FILE, document)
+        if not document:
+            raise RuntimeError("No Gmail discovery document available offline; "
+                               f"place one at {settings.GMAIL_DISCOVERY_CACHE_FILE}")
+
+        logger.debug(f"Loaded Gmail discovery document from {source}")
+        _discovery_document = document
+        return document
+
+def build_gmail_client(creds, offline=None):
+    """
+    Build a Gmail API client from the shared discovery document
+
+    Each call returns a new client; clients are not thread-safe, so build one
+    per thread rather than sharing it.
+    """
+    from googleapiclient.discovery import build_from_document
+    # The document is passed as JSON so each client parses its own copy;
+    # the library fixes up method descriptions in place as they are first used
+    return build_from_document(load_discovery_document(offline), credentials=creds)
@@ -1,11 +1,16 @@
 import logging
-from datetime import datetime
-from auth.gmail_auth import gmail_authenticate
-from services.gmail_service import search_messages, get_message_details
+import argparse
+from utils.startup_timing import startup_timer
+if __name__ == "__main__":
+    startup_timer.start()
+
+from auth.gmail_auth import get_credentials, build_gmail_service
+from services.backfill import Backfill
 from services.notification_service import NotificationService
-from utils.email_parser import is_important_email, extract_email_data
 import config.settings as settings
-from utils.whatsapp_notifications import send_whatsapp_message
+
+if __name__ == "__main__":
+    startup_timer.stop_imports()
 
 # Configure logging
 logging.basicConfig(
@@ -17,61 +22,49 @@ logging.basicConfig(
     ]
 )
 
-def check_old_emails(query, max_results=1000):
+def check_old_emails(query, max_results=1000, restart=False, notify=True, shards=None):
+    """
+    Backfill older emails matching a query, resuming an interrupted run of the same query
+
+    Args:
+        query: Gmail search query
+        max_results: Maximum number of emails to check
+        restart: Start over instead of resuming
+        notify: Send notifications for important emails, or only report them
+        shards: Date windows to list in parallel (1 lists page by page), defaults to BACKFILL_LIST_SHARDS
+    """
     logging.info("Starting manual check for old emails")
-    service = gmail_authenticate()
-    notification_service = NotificationService({
-        'TELEGRAM_BOT_TOKEN': settings.TELEGRAM_BOT_TOKEN,
-        'TELEGRAM_CHAT_ID': settings.TELEGRAM_CHAT_ID,
-        'WHATSAPP_ENABLED': settings.WHATSAPP_ENABLED,
-        'WHATSAPP_PHONE': settings.WHATSAPP_PHONE
-    })
+    with startup_timer.stage('authenticate'):
+        credentials = get_credentials()
+    with startup_timer.stage('init'):
+        notification_service = NotificationService({
+            'TELEGRAM_BOT_TOKEN': settings.TELEGRAM_BOT_TOKEN,
+            'TELEGRAM_CHAT_ID': settings.TELEGRAM_CHAT_ID,
+            'WHATSAPP_ENABLED': settings.WHATSAPP_ENABLED,
+            'WHATSAPP_PHONE': settings.WHATSAPP_PHONE
+        })
+        backfill = Backfill(credentials, notification_service, build_gmail_service, notify=notify, shards=shards)
+    startup_timer.log_report(logging.getLogger(__name__), details=settings.STARTUP_REPORT)
 
     logging.info(f"Searching for emails with query: {query}")
-    messages = []
-    next_page_token = None
+    try:
+        result = backfill.run(query, max_results, restart=restart)
+    finally:
+        # Don't exit with alerts still buffered for a digest
+        notification_service.flush_digests()
 
-    while len(messages) < max_results:
-        result = search_messages(service, query, next_page_token)
-        if not result or 'messages' not in result:
-            break
-        messages.extend(result['messages'])
-        next_page_token = result.get('nextPageToken')
-        if not next_page_token:
-            break
-
-    if not messages:
-        logging.info("No emails found")
-    else:
-        logging.info(f"Found {len(messages)} emails, checking importance...")
-        important_emails = []
-        for msg in messages[:max_results]:
-            msg_details = get_message_details(service, msg['id'])
-            email_data = extract_email_data(msg_details)
-            if is_important_email(email_data):
-                important_emails.append(email_data)
-                logging.info(f"Important email found - ID: {msg['id']}")
-                logging.info(f"Subject: {email_data['subject']}")
-                logging.info(f"Sender: {email_data['sender']}")
-                logging.info(f"Body: {email_data['body'][:100]}...")  # Print first 100 characters of the body
-
-                # Send notifications
-                notification_service.send_notification(
-                    email_data['subject'],
-                    email_data['body'],
-                    email_data['sender'],
-                    msg_details['internalDate']
-                )
-
-                # Send WhatsApp notification if enabled
-                if settings.WHATSAPP_ENABLED:
-                    send_whatsapp_message(settings.WHATSAPP_PHONE, f"Important email from {email_data['sender']}: {email_data['subject']}")
-                    logging.info(f"WhatsApp notification sent for email {msg['id']}")
-
-        logging.info(f"Found {len(important_emails)} important emails")
+    logging.info(f"Found {result['important']} important emails")
 
 if __name__ == "__main__":
-    # Customize your query here
+    parser = argparse.ArgumentParser(description='Check older emails, resuming where an interrupted run stopped')
     # Example: Search for emails from the last 7 days
-    query = "newer_than:7d"
-    check_old_emails(query, max_results=1000)
\ No newline at end of file
+    parser.add_argument('query', nargs='?', default="newer_than:7d", help='Gmail search query')
+    parser.add_argument('--max-results', type=int, default=1000, help='Maximum number of emails to check')
+    parser.add_argument('--restart', action='store_true', help='Discard saved progress and start over')
+    parser.add_argument('--no-notify', action='store_true', help='Only report important emails, do not send alerts')
+    parser.add_argument('--shards', type=int, default=None,
+                        help='Date windows to list in parallel for time-bounded queries (1 lists page by page)')
+    args = parser.parse_args()
+
+    check_old_emails(args.query, max_results=args.max_results, restart=args.restart, notify=not args.no_notify,
+                     shards=args.shards)
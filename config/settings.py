@@ -13,6 +13,18 @@ GMAIL_USER_EMAIL = os.getenv('GMAIL_USER_EMAIL')
 GMAIL_CREDENTIALS_FILE = os.getenv('GMAIL_CREDENTIALS_FILE', 'credentials/credentials.json')
 GMAIL_TOKEN_FILE = os.getenv('GMAIL_TOKEN_FILE', 'credentials/token.json')
 GMAIL_SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
+# Mailboxes to monitor in this process: comma-separated "name=token_file" or "name=token_file|client_secrets_file".
+# Empty monitors the single account from GMAIL_TOKEN_FILE.
+GMAIL_ACCOUNTS = os.getenv('GMAIL_ACCOUNTS', '')
+# OAuth token refresh: how long before expiry the background refresh runs, and the retry delay after a failure
+GMAIL_TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv('GMAIL_TOKEN_REFRESH_MARGIN_SECONDS', '600'))
+GMAIL_TOKEN_REFRESH_RETRY_SECONDS = int(os.getenv('GMAIL_TOKEN_REFRESH_RETRY_SECONDS', '60'))
+# Gmail API discovery document: cached on disk, and never fetched over the network when offline
+GMAIL_DISCOVERY_CACHE_FILE = os.getenv('GMAIL_DISCOVERY_CACHE_FILE', 'data/gmail_discovery_v1.json')
+GMAIL_DISCOVERY_OFFLINE = os.getenv('GMAIL_DISCOVERY_OFFLINE', 'False').lower() == 'true'
+# Ask Gmail only for the response fields each read uses; checks make reads of other fields raise (for development)
+GMAIL_FIELD_MASKS = os.getenv('GMAIL_FIELD_MASKS', 'True').lower() == 'true'
+GMAIL_FIELD_MASK_CHECKS = os.getenv('GMAIL_FIELD_MASK_CHECKS', 'False').lower() == 'true'
 
 # Email importance criteria
 IMPORTANT_EMAIL_CRITERIA = {
@@ -84,17 +96,131 @@ TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 WHATSAPP_ENABLED = os.getenv('WHATSAPP_ENABLED', 'False').lower() == 'true'
 WHATSAPP_PHONE = os.getenv('WHATSAPP_PHONE')
+TELEGRAM_TIMEOUT_SECONDS = float(os.getenv('TELEGRAM_TIMEOUT_SECONDS', '10'))
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '5'))
+# Per-channel limits on how long send_notification waits for a channel
+TELEGRAM_NOTIFY_TIMEOUT_SECONDS = float(os.getenv('TELEGRAM_NOTIFY_TIMEOUT_SECONDS', '30'))
+WHATSAPP_NOTIFY_TIMEOUT_SECONDS = float(os.getenv('WHATSAPP_NOTIFY_TIMEOUT_SECONDS', '120'))
+
+# WhatsApp Web driver settings
+# Keep one headless Chrome open and reuse it for every message
+WHATSAPP_PERSISTENT_DRIVER = os.getenv('WHATSAPP_PERSISTENT_DRIVER', 'True').lower() == 'true'
+# Restart Chrome after this many sends to keep memory in check
+WHATSAPP_DRIVER_MAX_SENDS = int(os.getenv('WHATSAPP_DRIVER_MAX_SENDS', '200'))
+# Queued WhatsApp notifications sent together through one browser session
+WHATSAPP_BATCH_SIZE = int(os.getenv('WHATSAPP_BATCH_SIZE', '10'))
+WHATSAPP_LOAD_TIMEOUT_SECONDS = float(os.getenv('WHATSAPP_LOAD_TIMEOUT_SECONDS', '60'))
+# How long to wait for a sent message's tick before reporting failure
+WHATSAPP_CONFIRM_TIMEOUT_SECONDS = float(os.getenv('WHATSAPP_CONFIRM_TIMEOUT_SECONDS', '20'))
+# Fixed page-load wait for the visible-browser PyWhatKit fallback
+WHATSAPP_PYWHATKIT_WAIT_SECONDS = int(os.getenv('WHATSAPP_PYWHATKIT_WAIT_SECONDS', '20'))
+# Seconds between checks of whatsapp_session_info.json for changes by other processes
+WHATSAPP_SESSION_STAT_INTERVAL_SECONDS = float(os.getenv('WHATSAPP_SESSION_STAT_INTERVAL_SECONDS', '5'))
+
+# Notification outbox settings
+OUTBOX_DB_FILE = os.getenv('OUTBOX_DB_FILE', 'data/notification_outbox.db')
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_RETRY_BACKOFF_SECONDS = float(os.getenv('OUTBOX_RETRY_BACKOFF_SECONDS', '30'))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', '2'))
+# Delivered and dead-lettered entries are kept this long for inspection
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '30'))
+
+# Ledger of (message ID, channel) pairs already notified, shared by all entry points
+NOTIFICATION_LEDGER_FILE = os.getenv('NOTIFICATION_LEDGER_FILE', 'data/notification_ledger.db')
+NOTIFICATION_LEDGER_RETENTION_DAYS = int(os.getenv('NOTIFICATION_LEDGER_RETENTION_DAYS', '90'))
+
+# Digest mode: coalesce important emails into one notification per window
+DIGEST_ENABLED = os.getenv('DIGEST_ENABLED', 'False').lower() == 'true'
+DIGEST_WINDOW_SECONDS = float(os.getenv('DIGEST_WINDOW_SECONDS', '900'))  # Default: 15 minutes
+DIGEST_MAX_ITEMS = int(os.getenv('DIGEST_MAX_ITEMS', '10'))
+# Emails matching these subject keywords or senders skip the digest and are sent immediately
+DIGEST_PRIORITY_KEYWORDS = os.getenv('DIGEST_PRIORITY_KEYWORDS', 'interview,offer').split(',')
+DIGEST_PRIORITY_SENDERS = os.getenv('DIGEST_PRIORITY_SENDERS', '').split(',') if os.getenv('DIGEST_PRIORITY_SENDERS') else []
 
 # Email processing settings
 MAX_EMAILS_TO_CHECK = int(os.getenv('MAX_EMAILS_TO_CHECK', '1000'))
 DAYS_TO_CHECK = int(os.getenv('DAYS_TO_CHECK', '7'))
 IMPORTANCE_KEYWORDS = os.getenv('IMPORTANCE_KEYWORDS', 'urgent,important,interview,offer,job,application').split(',')
 SENDER_ALLOWLIST = os.getenv('SENDER_ALLOWLIST', '').split(',') if os.getenv('SENDER_ALLOWLIST') else []
+# Server-side prefilter: polls only list mail matching the keywords, important senders and subject terms
+QUERY_PREFILTER_ENABLED = os.getenv('QUERY_PREFILTER_ENABLED', 'False').lower() == 'true'
+# Keyword and subject matches in these inbox categories are left out (senders still match)
+QUERY_PREFILTER_EXCLUDE_CATEGORIES = os.getenv('QUERY_PREFILTER_EXCLUDE_CATEGORIES', 'promotions,social').split(',') if os.getenv('QUERY_PREFILTER_EXCLUDE_CATEGORIES', 'promotions,social') else []
+# How often a full sweep lists all unread mail so the LLM sees what the prefilter skipped (0 disables)
+QUERY_FULL_SWEEP_SECONDS = int(os.getenv('QUERY_FULL_SWEEP_SECONDS', '21600'))  # Default: 6 hours
 
 # Polling settings
 CHECK_INTERVAL_SECONDS = int(os.getenv('CHECK_INTERVAL_SECONDS', 300))  # Default: 5 minutes
 MAX_RESULTS_PER_QUERY = int(os.getenv('MAX_RESULTS_PER_QUERY', 10))
 
+# Adaptive polling: CHECK_INTERVAL_SECONDS is the starting interval. It drops to the minimum after new mail
+# and grows by the backoff factor after quiet polls, up to the maximum.
+POLL_ADAPTIVE = os.getenv('POLL_ADAPTIVE', 'True').lower() == 'true'
+POLL_MIN_INTERVAL_SECONDS = int(os.getenv('POLL_MIN_INTERVAL_SECONDS', '60'))
+POLL_MAX_INTERVAL_SECONDS = int(os.getenv('POLL_MAX_INTERVAL_SECONDS', '1800'))  # Default: 30 minutes
+POLL_BACKOFF_FACTOR = float(os.getenv('POLL_BACKOFF_FACTOR', '1.5'))
+POLL_JITTER = float(os.getenv('POLL_JITTER', '0.1'))  # Fraction each delay is randomized by
+# Quiet hours in local time, e.g. "23:00-07:00", during which polls are at least POLL_QUIET_INTERVAL_SECONDS apart
+POLL_QUIET_HOURS = os.getenv('POLL_QUIET_HOURS', '')
+POLL_QUIET_INTERVAL_SECONDS = int(os.getenv('POLL_QUIET_INTERVAL_SECONDS', '3600'))
+
+# Push notifications: an HTTP receiver for Gmail watch notifications delivered by a Pub/Sub push subscription.
+# Without GMAIL_PUSH_TOPIC no watch is created and only a local publisher (scripts/publish_push.py) sends pushes.
+PUSH_ENABLED = os.getenv('PUSH_ENABLED', 'False').lower() == 'true'
+PUSH_PORT = int(os.getenv('PUSH_PORT', '8085'))
+PUSH_PATH = os.getenv('PUSH_PATH', '/gmail/push')
+PUSH_TOKEN = os.getenv('PUSH_TOKEN', '')  # Shared secret expected as ?token=... on the push URL; required
+GMAIL_PUSH_TOPIC = os.getenv('GMAIL_PUSH_TOPIC', '')  # e.g. projects/my-project/topics/gmail
+PUSH_WATCH_RENEW_SECONDS = int(os.getenv('PUSH_WATCH_RENEW_SECONDS', '86400'))  # Watches expire after 7 days
+PUSH_SAFETY_POLL_SECONDS = int(os.getenv('PUSH_SAFETY_POLL_SECONDS', '1800'))  # Poll interval while pushes work
+# Without a watch, normal polling resumes when no push has arrived for this long
+PUSH_STALE_SECONDS = int(os.getenv('PUSH_STALE_SECONDS', '3600'))
+
+# Daemon health reporting: state file rewritten after every poll, and an optional HTTP port (0 disables it)
+HEALTH_FILE = os.getenv('HEALTH_FILE', 'data/health.json')
+HEALTH_PORT = int(os.getenv('HEALTH_PORT', '0'))
+
+# Processing pipeline: worker threads per stage and the size of the queues between them
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '50'))
+PIPELINE_FETCH_WORKERS = int(os.getenv('PIPELINE_FETCH_WORKERS', '4'))
+PIPELINE_PARSE_WORKERS = int(os.getenv('PIPELINE_PARSE_WORKERS', '1'))
+PIPELINE_CLASSIFY_WORKERS = int(os.getenv('PIPELINE_CLASSIFY_WORKERS', '2'))
+PIPELINE_NOTIFY_WORKERS = int(os.getenv('PIPELINE_NOTIFY_WORKERS', '1'))
+
+# Attachments of important emails: streamed to disk and stored once per content hash under ATTACHMENT_DIR
+ATTACHMENTS_ENABLED = os.getenv('ATTACHMENTS_ENABLED', 'False').lower() == 'true'
+ATTACHMENT_DIR = os.getenv('ATTACHMENT_DIR', 'data/attachments')
+ATTACHMENT_MAX_BYTES = int(os.getenv('ATTACHMENT_MAX_BYTES', str(25 * 1024 * 1024)))  # Gmail's own limit
+# Attachments of one email downloaded in parallel
+ATTACHMENT_WORKERS = int(os.getenv('ATTACHMENT_WORKERS', '4'))
+ATTACHMENT_TIMEOUT_SECONDS = float(os.getenv('ATTACHMENT_TIMEOUT_SECONDS', '60'))
+
+# Backfills of older mail (check_old_emails.py): checkpoint database and how often progress is logged
+BACKFILL_DB_FILE = os.getenv('BACKFILL_DB_FILE', 'data/backfill.db')
+BACKFILL_PROGRESS_SECONDS = int(os.getenv('BACKFILL_PROGRESS_SECONDS', '10'))
+# Time-bounded backfill queries are listed as this many date windows in parallel (1 lists page by page)
+BACKFILL_LIST_SHARDS = int(os.getenv('BACKFILL_LIST_SHARDS', '4'))
+# Windows estimated to hold more messages than this are split, down to the minimum width
+BACKFILL_WINDOW_TARGET = int(os.getenv('BACKFILL_WINDOW_TARGET', '1000'))
+BACKFILL_MIN_WINDOW_SECONDS = int(os.getenv('BACKFILL_MIN_WINDOW_SECONDS', '3600'))
+
+# Near-duplicate suppression: emails whose SimHash is within this many bits of a recent alert are folded into it
+NEAR_DUPLICATE_ENABLED = os.getenv('NEAR_DUPLICATE_ENABLED', 'True').lower() == 'true'
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv('NEAR_DUPLICATE_MAX_DISTANCE', '3'))
+NEAR_DUPLICATE_WINDOW_SECONDS = int(os.getenv('NEAR_DUPLICATE_WINDOW_SECONDS', '86400'))  # Default: 1 day
+
+# Llama settings
+LLAMA_URL = os.getenv('LLAMA_URL', 'http://localhost:11434')
+# Model cascade, smallest first: comma-separated "model|timeout_seconds|max_concurrent" tiers
+LLAMA_MODEL_TIERS = os.getenv('LLAMA_MODEL_TIERS', 'llama3.2:1b|15|2,llama3.2|60|1')
+# Escalate to the next tier when a classification is less confident than this (0-1)
+LLAMA_CONFIDENCE_THRESHOLD = float(os.getenv('LLAMA_CONFIDENCE_THRESHOLD', '0.75'))
+# Estimated token budgets for the email excerpt placed in each prompt
+LLAMA_CLASSIFY_TOKEN_BUDGET = int(os.getenv('LLAMA_CLASSIFY_TOKEN_BUDGET', '300'))
+LLAMA_SUMMARY_TOKEN_BUDGET = int(os.getenv('LLAMA_SUMMARY_TOKEN_BUDGET', '400'))
+
 # Logging settings
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
-LOG_FILE = os.getenv('LOG_FILE', 'logs/gmail_monitor.log')
\ No newline at end of file
+LOG_FILE = os.getenv('LOG_FILE', 'logs/gmail_monitor.log')
+# Log per-module import timings at startup, not just the summary line
+STARTUP_REPORT = os.getenv('STARTUP_REPORT', 'False').lower() == 'true'
\ No newline at end of file
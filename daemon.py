@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import json
+import signal
+import argparse
+import tempfile
+import importlib
+import threading
+import logging
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.startup_timing import startup_timer
+if __name__ == "__main__":
+    startup_timer.start()
+
+from dotenv import load_dotenv
+
+from app import GmailMonitor
+from services.llama_service import get_llama_cascade, reset_llama_cascade
+from services.telegram_client import reset_telegram_clients
+from services.notification_service import NotificationService
+from services.poll_scheduler import PollScheduler
+from services.notification_outbox import start_outbox_workers, stop_outbox_workers
+from services.health_check import max_healthy_age, check_health_file
+import config.settings as settings
+
+if __name__ == "__main__":
+    startup_timer.stop_imports()
+
+logger = logging.getLogger(__name__)
+
+class GmailDaemon:
+    """
+    Long-running Gmail monitor process
+
+    Authenticates and builds its clients once, then polls until it receives
+    SIGTERM or SIGINT, at which point it drains in-flight deliveries before
+    exiting. SIGHUP reloads .env and settings without a restart. Health state is
+    written to HEALTH_FILE after every poll and optionally served over HTTP.
+    """
+
+    def __init__(self):
+        self.monitor = GmailMonitor()
+        self.stop_event = threading.Event()
+        self.reload_event = threading.Event()
+        self.health_lock = threading.Lock()
+        self.health_server = None
+        self.health = {
+            'status': 'starting',
+            'pid': os.getpid(),
+            'started_at': datetime.now().isoformat(),
+            'last_poll_at': None,
+            'last_success_at': None,
+            'consecutive_failures': 0,
+            'polls': 0
+        }
+
+    def install_signal_handlers(self):
+        """Route SIGTERM/SIGINT to a graceful stop and SIGHUP to a config reload"""
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._handle_reload)
+
+    def _handle_stop(self, signum, frame):
+        logger.info(f"Received signal {signum}, draining and shutting down")
+        self.stop_event.set()
+        self.monitor.wake()
+
+    def _handle_reload(self, signum, frame):
+        logger.info("Received SIGHUP, configuration will be reloaded before the next poll")
+        self.reload_event.set()
+        # Wake the poll loop so the reload happens straight away
+        self.monitor.wake()
+
+    def reload_config(self):
+        """Re-read .env and settings, then rebuild notification delivery and the shared LLM and Telegram clients"""
+        load_dotenv(override=True)
+        importlib.reload(settings)
+
+        stop_outbox_workers(self.monitor.outbox_workers)
+        self.monitor.notification_service.close()
+        # Shared clients were built from the old settings
+        reset_llama_cascade()
+        reset_telegram_clients()
+        self.monitor.notification_service = NotificationService(self.monitor.notification_config())
+        self.monitor.poll_scheduler = PollScheduler()
+        self.monitor.outbox_workers = start_outbox_workers(self.monitor.outbox, self.monitor.notification_service)
+        logger.info("Configuration reloaded")
+
+    def is_healthy(self):
+        """Healthy while polls keep succeeding within a few poll intervals"""
+        with self.health_lock:
+            if self.health['status'] != 'running':
+                return False
+            last_success = self.health['last_success_at']
+            reference = last_success or self.health['started_at']
+        age = (datetime.now() - datetime.fromisoformat(reference)).total_seconds()
+        return age <= max_healthy_age()
+
+    def health_snapshot(self):
+        """Return the current health state with live outbox and LLM metrics"""
+        with self.health_lock:
+            snapshot = dict(self.health)
+        snapshot['healthy'] = self.is_healthy()
+        snapshot['accounts'] = {account.name: account.last_check_time.isoformat() if account.last_check_time else None
+                                for account in self.monitor.accounts}
+        snapshot['outbox'] = self.monitor.outbox.stats()
+        snapshot['llama'] = get_llama_cascade().get_metrics()
+        return snapshot
+
+    def _update_health(self, **changes):
+        with self.health_lock:
+            self.health.update(changes)
+        self.write_health_file()
+
+    def write_health_file(self):
+        """Atomically write the health snapshot to HEALTH_FILE"""
+        try:
+            directory = os.path.dirname(os.path.abspath(settings.HEALTH_FILE))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.health.', suffix='.tmp')
+            with os.fdopen(fd, 'w') as file:
+                json.dump(self.health_snapshot(), file, indent=2)
+            os.replace(tmp_path, settings.HEALTH_FILE)
+        except Exception as e:
+            logger.error(f"Error writing health file: {e}")
+
+    def start_health_server(self):
+        """Serve the health snapshot on HEALTH_PORT, returning 200 when healthy and 503 otherwise"""
+        daemon = self
+
+        class HealthHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/health'):
+                    self.send_error(404)
+                    return
+                snapshot = daemon.health_snapshot()
+                body = json.dumps(snapshot).encode('utf-8')
+                self.send_response(200 if snapshot['healthy'] else 503)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.health_server = ThreadingHTTPServer(('0.0.0.0', settings.HEALTH_PORT), HealthHandler)
+        threading.Thread(target=self.health_server.serve_forever, name='health-server', daemon=True).start()
+        logger.info(f"Health endpoint listening on port {settings.HEALTH_PORT}")
+
+    def poll_once(self):
+        """
+        Run one poll and record its outcome in the health state
+
+        Returns:
+            float: Seconds to wait before the next poll
+        """
+        ok, interval = self.monitor.run_cycle()
+        now = datetime.now().isoformat()
+        with self.health_lock:
+            self.health['polls'] += 1
+            self.health['last_poll_at'] = now
+            if ok:
+                self.health['last_success_at'] = now
+                self.health['consecutive_failures'] = 0
+            else:
+                self.health['consecutive_failures'] += 1
+            self.health['next_poll_in_seconds'] = round(interval)
+            self.health['push_active'] = self.monitor.push_active()
+        self.write_health_file()
+        return interval
+
+    def run(self):
+        """Start once, then poll until asked to stop"""
+        self.install_signal_handlers()
+        if settings.HEALTH_PORT:
+            self.start_health_server()
+
+        with startup_timer.stage('authenticate'):
+            authenticated = self.monitor.authenticate()
+        if not authenticated:
+            logger.error("Failed to authenticate, exiting")
+            self._update_health(status='auth_failed')
+            return 1
+        startup_timer.log_report(logger, details=settings.STARTUP_REPORT)
+
+        self.monitor.outbox_workers = start_outbox_workers(self.monitor.outbox, self.monitor.notification_service)
+        self._update_health(status='running')
+        logger.info("Gmail daemon started")
+
+        try:
+            self.monitor.start_push()
+            while True:
+                interval = self.poll_once()
+
+                logger.info(f"Sleeping for {interval:.0f} seconds")
+                self.monitor.wait_for_work(interval)
+
+                if self.stop_event.is_set():
+                    break
+                if self.reload_event.is_set():
+                    self.reload_event.clear()
+                    self.reload_config()
+        except Exception as e:
+            logger.exception(f"Unexpected error: {e}")
+        finally:
+            self._update_health(status='draining')
+            self.monitor.stop_push()
+            stop_outbox_workers(self.monitor.outbox_workers)
+            self.monitor.notification_service.close()
+            self.monitor.stop_accounts()
+            self._update_health(status='stopped')
+            if self.health_server:
+                self.health_server.shutdown()
+
+        logger.info("Gmail daemon stopped")
+        return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the Gmail monitor as a long-running daemon')
+    parser.add_argument('--health', action='store_true',
+                        help='Check the health file of a running daemon and exit (python -m services.health_check '
+                             'does the same without loading the monitor)')
+    args = parser.parse_args()
+
+    if args.health:
+        sys.exit(check_health_file())
+
+    logger.info("Gmail daemon starting up...")
+    with startup_timer.stage('init'):
+        gmail_daemon = GmailDaemon()
+    sys.exit(gmail_daemon.run())
@@ -29,8 +29,15 @@ else
     echo "Virtual environment is already active: $VIRTUAL_ENV"
 fi
 
-# Install dependencies
-pip install -r requirements.txt
+# Install dependencies only when requirements.txt changed since the last install
+REQUIREMENTS_STAMP="$VIRTUAL_ENV/.requirements.sha256"
+REQUIREMENTS_HASH=$(sha256sum requirements.txt | cut -d' ' -f1)
+if [ ! -f "$REQUIREMENTS_STAMP" ] || [ "$(cat "$REQUIREMENTS_STAMP")" != "$REQUIREMENTS_HASH" ]; then
+    echo "Installing dependencies..."
+    pip install -r requirements.txt && echo "$REQUIREMENTS_HASH" > "$REQUIREMENTS_STAMP"
+else
+    echo "Dependencies are up to date."
+fi
 
 # Check WhatsApp settings
 if [ -f ".env" ] && grep -q "WHATSAPP_ENABLED=true" .env 2>/dev/null; then
@@ -49,4 +56,4 @@ fi
 
 # Run the application
 echo "Starting Gmail Monitor..."
-python app.py
\ No newline at end of file
+exec python daemon.py
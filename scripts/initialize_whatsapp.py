@@ -20,6 +20,7 @@ from utils.whatsapp_notifications import (
     initialize_whatsapp_session,
     get_session_info,
     save_session_info,
+    delete_session_info,
     SESSION_INFO_FILE,
     CHROME_PROFILE_DIR
 )
@@ -36,8 +37,7 @@ def destroy_session():
     """Destroy the current WhatsApp session by deleting profile data"""
     try:
         # Delete the session info file
-        if os.path.exists(SESSION_INFO_FILE):
-            os.remove(SESSION_INFO_FILE)
+        if delete_session_info():
             logger.info(f"Deleted session info file: {SESSION_INFO_FILE}")
         
         # Delete the Chrome profile directory
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+
+# Import helper to set up path for imports
+import os
+import sys
+script_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(script_dir))
+
+import logging
+import argparse
+import requests
+import config.settings as settings
+from services.push_receiver import encode_push_message
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def publish_push(url, email_address, history_id, token=None):
+    """
+    Send a Gmail push notification to the receiver the way Pub/Sub would
+
+    Stands in for Google Cloud Pub/Sub so the push flow can be tested offline.
+    """
+    if token:
+        url = f"{url}{'&' if '?' in url else '?'}token={token}"
+    response = requests.post(
+        url,
+        data=encode_push_message(email_address, history_id),
+        headers={'Content-Type': 'application/json'},
+        timeout=10
+    )
+    logger.info(f"Receiver answered {response.status_code}")
+    return response.status_code in (200, 202, 204)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Publish a local Gmail push notification to the push receiver')
+    parser.add_argument('email', help='Mailbox address the notification is for')
+    parser.add_argument('--history-id', default='1', help='History ID to announce (the monitor syncs from its own)')
+    parser.add_argument('--url', default=f"http://localhost:{settings.PUSH_PORT}{settings.PUSH_PATH}",
+                        help='Push receiver URL')
+    parser.add_argument('--token', default=settings.PUSH_TOKEN, help='Shared secret expected by the receiver')
+    args = parser.parse_args()
+
+    sys.exit(0 if publish_push(args.url, args.email, args.history_id, args.token) else 1)
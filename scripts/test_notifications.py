@@ -44,6 +44,10 @@ def test_notifications():
         received_time=received_time  # Use received_time instead of timestamp
     )
     
+    for channel, channel_result in result.items():
+        status = "✅" if channel_result['success'] else f"❌ {channel_result['error']}"
+        logger.info(f"{channel}: {status} ({channel_result['elapsed']:.1f}s)")
+    
     if result:
         logger.info("✅ Notification test successful!")
     else:
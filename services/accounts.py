@@ -0,0 +1,280 @@
+import re
+import time
+import threading
+import logging
+from pathlib import Path
+from auth.credential_manager import CredentialManager, get_credential_manager
+from auth.gmail_auth import build_gmail_service
+from services.gmail_service import ThreadLocalService, get_profile, watch_mailbox, list_history
+from utils.query_compiler import prefilter_from_settings
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACCOUNT = 'default'
+DEFAULT_PROCESSED_IDS_FILE = 'data/processed_emails.txt'
+# Account names become directory names under data/accounts
+ACCOUNT_NAME_PATTERN = re.compile(r'[A-Za-z0-9_-]+')
+
+class MailboxAccount:
+    """
+    One monitored Gmail mailbox
+
+    Each account has its own credentials, processed-ID store and search
+    watermark. API clients are built per thread from the account's credentials.
+    The default account keeps the single-mailbox token and processed-ID files,
+    so existing installs carry on unchanged.
+    """
+
+    def __init__(self, name, token_file=None, credentials_file=None):
+        self.name = name
+        self.is_default = name == DEFAULT_ACCOUNT and not token_file
+        if self.is_default:
+            self.credentials = get_credential_manager()
+            self.processed_ids_file = Path(DEFAULT_PROCESSED_IDS_FILE)
+        else:
+            self.credentials = CredentialManager(token_file=token_file, credentials_file=credentials_file)
+            self.processed_ids_file = Path('data/accounts') / name / 'processed_emails.txt'
+        self.service = None
+        self.thread_services = None
+        self.last_check_time = None
+        # Start of the last poll that listed all unread mail rather than prefiltered mail
+        self.last_sweep_time = None
+        # Push notifications: the mailbox address they name, the history ID synced up to,
+        # and when the Gmail watch must be renewed by
+        self.email_address = None
+        self.history_id = None
+        self.watch_expires_at = None
+        self.watch_renewed_at = None
+        self.processed_ids = set()
+        self.processed_ids_lock = threading.Lock()
+        self.load_processed_ids()
+
+    def __repr__(self):
+        return f"MailboxAccount({self.name!r})"
+
+    def key(self, message_id):
+        """Process-wide key for a message, namespaced for every account but the default"""
+        return message_id if self.is_default else f"{self.name}:{message_id}"
+
+    def load_processed_ids(self):
+        """Load processed email IDs from file"""
+        try:
+            if self.processed_ids_file.exists():
+                with open(self.processed_ids_file, 'r') as f:
+                    for line in f:
+                        email_id = line.strip()
+                        if email_id:
+                            self.processed_ids.add(email_id)
+                logger.info(f"Loaded {len(self.processed_ids)} processed email IDs for account {self.name}")
+            else:
+                logger.info(f"No processed emails file found for account {self.name}, starting fresh")
+        except Exception as e:
+            logger.error(f"Error loading processed email IDs for account {self.name}: {e}")
+
+    def is_processed(self, email_id):
+        """Check whether an email was already processed"""
+        return email_id in self.processed_ids
+
+    def save_processed_id(self, email_id):
+        """Save ID of a processed email"""
+        try:
+            with self.processed_ids_lock:
+                self.processed_ids_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.processed_ids_file, 'a') as f:
+                    f.write(f"{email_id}\n")
+                self.processed_ids.add(email_id)
+        except Exception as e:
+            logger.error(f"Error saving processed email ID for account {self.name}: {e}")
+
+    def authenticate(self):
+        """
+        Authenticate the account and start refreshing its token in the background
+
+        Returns:
+            bool: True if authentication succeeded
+        """
+        try:
+            credentials = self.credentials.get()
+            self.service = build_gmail_service(credentials)
+            # Pipeline workers each get their own client
+            self.thread_services = ThreadLocalService(lambda: build_gmail_service(credentials))
+            self.credentials.start()
+            logger.info(f"Authentication successful for account {self.name}")
+            return True
+        except Exception as e:
+            logger.error(f"Authentication failed for account {self.name}: {e}")
+            return False
+
+    def stop(self):
+        """Stop refreshing the account's token"""
+        self.credentials.stop()
+
+    def load_profile(self):
+        """
+        Read the mailbox address and start incremental sync from its current history ID
+
+        Returns:
+            bool: True if the profile was read
+        """
+        profile = get_profile(self.service)
+        if not profile:
+            logger.error(f"Could not read the Gmail profile for account {self.name}")
+            return False
+        self.email_address = profile.get('emailAddress', '').lower()
+        self.history_id = str(profile.get('historyId')) if profile.get('historyId') else None
+        return True
+
+    def start_watch(self, topic_name):
+        """
+        Create or renew the Gmail watch that publishes this mailbox's changes to Pub/Sub
+
+        Returns:
+            bool: True if the watch is active
+        """
+        response = watch_mailbox(self.service, topic_name)
+        if not response:
+            logger.error(f"Could not start the Gmail watch for account {self.name}")
+            return False
+        self.watch_expires_at = int(response.get('expiration', 0)) / 1000 or None
+        self.watch_renewed_at = time.time()
+        if not self.history_id:
+            self.history_id = str(response.get('historyId'))
+        logger.info(f"Gmail watch active for account {self.name} until "
+                    f"{time.ctime(self.watch_expires_at) if self.watch_expires_at else 'unknown'}")
+        return True
+
+    def watch_due(self, renew_seconds, now=None):
+        """Check whether the watch should be renewed"""
+        now = now or time.time()
+        if not self.watch_renewed_at:
+            return True
+        expiring = self.watch_expires_at and self.watch_expires_at - now < renew_seconds
+        return now - self.watch_renewed_at >= renew_seconds or bool(expiring)
+
+    def list_changes(self):
+        """
+        List unread inbox messages added since the last synced history ID
+
+        Returns:
+            list: Message IDs, or None if incremental sync is unavailable and a search is needed
+        """
+        if not self.history_id:
+            return None
+        changes = list_history(self.service, self.history_id)
+        if changes is None:
+            # Usually a history ID too old to resume from; restart from the current one
+            logger.warning(f"Incremental sync failed for account {self.name}, falling back to a search")
+            self.history_id = None
+            self.load_profile()
+            return None
+        self.history_id = str(changes['history_id'])
+        return changes['message_ids']
+
+    def sweep_due(self, now):
+        """Whether this poll must list all unread mail instead of only prefiltered mail"""
+        if not settings.QUERY_PREFILTER_ENABLED:
+            return False
+        if self.last_sweep_time is None:
+            return settings.QUERY_FULL_SWEEP_SECONDS > 0
+        return 0 < settings.QUERY_FULL_SWEEP_SECONDS <= (now - self.last_sweep_time).total_seconds()
+
+    def build_search_query(self, full_sweep=False):
+        """
+        Build Gmail search query based on time
+
+        With the prefilter enabled, only mail matching the importance rules is
+        asked for. A full sweep skips the prefilter and reaches back to the
+        previous sweep, so mail the prefilter left behind is still classified.
+        """
+        query = ""
+        since = self.last_sweep_time if full_sweep else self.last_check_time
+
+        # Add time constraint if we have a last check time
+        if since:
+            # Convert to Gmail's search format
+            after_date = since.strftime("%Y/%m/%d")
+            query += f"after:{after_date} "
+        else:
+            # Default to last 24 hours if no previous check time
+            query += "newer_than:1d "
+
+        # Only get unread emails
+        query += "is:unread"
+
+        if settings.QUERY_PREFILTER_ENABLED and not full_sweep:
+            prefilter = prefilter_from_settings()
+            if prefilter:
+                query += f" {prefilter}"
+
+        return query
+
+def parse_accounts(spec):
+    """
+    Parse an account list like "personal=credentials/personal.json,work=credentials/work.json"
+
+    Each entry is name=token_file, optionally followed by |client_secrets_file when
+    the account uses its own OAuth client. Names may only use letters, digits, '_' and '-'. An empty spec means the single default account.
+    """
+    accounts = []
+    for entry in (spec or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, files = entry.partition('=')
+        token_file, _, credentials_file = files.partition('|')
+        name = name.strip()
+        if not name or not token_file.strip():
+            logger.warning(f"Ignoring invalid account entry: {entry}")
+            continue
+        if not ACCOUNT_NAME_PATTERN.fullmatch(name):
+            logger.warning(f"Ignoring account {name!r}: names may only contain letters, digits, '_' and '-'")
+            continue
+        accounts.append(MailboxAccount(name, token_file.strip(), credentials_file.strip() or None))
+
+    if not accounts:
+        accounts.append(MailboxAccount(DEFAULT_ACCOUNT))
+    return accounts
+
+def load_accounts():
+    """Build the monitored accounts from GMAIL_ACCOUNTS"""
+    return parse_accounts(settings.GMAIL_ACCOUNTS)
+
+class RoundRobinScheduler:
+    """
+    Interleaves per-account work so every mailbox gets a fair share of the shared workers
+
+    Items are taken one per account in turn, and the starting account rotates
+    between rounds, so a busy mailbox cannot starve the others or always go first.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def order(self, batches):
+        """
+        Interleave per-account batches
+
+        Args:
+            batches: List of (account, items) pairs
+
+        Returns:
+            list: (account, item) pairs in round-robin order
+        """
+        with self.lock:
+            offset = self.offset % len(batches) if batches else 0
+            self.offset += 1
+        rotated = batches[offset:] + batches[:offset]
+
+        ordered = []
+        iterators = [(account, iter(items)) for account, items in rotated]
+        while iterators:
+            remaining = []
+            for account, items in iterators:
+                item = next(items, None)
+                if item is not None:
+                    ordered.append((account, item))
+                    remaining.append((account, items))
+            iterators = remaining
+        return ordered
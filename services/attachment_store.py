@@ -0,0 +1,125 @@
+import os
+import hashlib
+import tempfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from services.gmail_service import stream_attachment_data, decode_base64_chunks
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+class AttachmentTooLarge(Exception):
+    """An attachment grew past the store's size limit while downloading"""
+
+class AttachmentStore:
+    """
+    Attachments saved by content hash
+
+    Each attachment is decoded in chunks straight into a temporary file while
+    it is hashed, so memory stays flat whatever its size. The file is then
+    moved to <root>/<first two hex digits>/<sha256>; an attachment already
+    stored under that hash, such as the same CV sent twice, is not stored again.
+    """
+
+    def __init__(self, root=None, max_bytes=None, workers=None):
+        self.root = root or settings.ATTACHMENT_DIR
+        self.max_bytes = max_bytes or settings.ATTACHMENT_MAX_BYTES
+        self.workers = max(1, workers or settings.ATTACHMENT_WORKERS)
+
+    def path_for(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def store(self, chunks, filename=None):
+        """
+        Write decoded chunks to the store
+
+        Returns:
+            dict: 'sha256', 'path', 'size', 'filename' and whether it was a 'duplicate'
+
+        Raises:
+            AttachmentTooLarge: If the data exceeds max_bytes; nothing is stored
+        """
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.attachment.', suffix='.tmp')
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise AttachmentTooLarge(f"{filename or 'Attachment'} is larger than {self.max_bytes} bytes")
+                    digest.update(chunk)
+                    file.write(chunk)
+
+            sha256 = digest.hexdigest()
+            path = self.path_for(sha256)
+            duplicate = os.path.exists(path)
+            if duplicate:
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return {'sha256': sha256, 'path': path, 'size': size, 'filename': filename, 'duplicate': duplicate}
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def download(self, service, message_id, attachment):
+        """
+        Stream one attachment of a message into the store
+
+        Args:
+            service: Gmail API client
+            message_id: ID of the message the attachment belongs to
+            attachment: Attachment as listed by parse_parts ('id', 'filename', optionally 'size')
+
+        Returns:
+            dict: The stored file, as returned by store(), or None if it was skipped or failed
+        """
+        filename = attachment.get('filename')
+        # Gmail reports the decoded size, so oversized files are skipped before any download
+        if attachment.get('size', 0) > self.max_bytes:
+            logger.warning(f"Skipping attachment {filename} of email {message_id}: "
+                           f"{attachment['size']} bytes is over the {self.max_bytes} byte limit")
+            return None
+        try:
+            stored = self.store(
+                decode_base64_chunks(stream_attachment_data(service, message_id, attachment['id'])),
+                filename
+            )
+        except AttachmentTooLarge as e:
+            logger.warning(f"Skipping attachment of email {message_id}: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Error downloading attachment {filename} of email {message_id}: {e}")
+            return None
+
+        if stored['duplicate']:
+            logger.info(f"Attachment {filename} of email {message_id} is already stored as {stored['sha256'][:12]}")
+        else:
+            logger.info(f"Stored attachment {filename} of email {message_id} ({stored['size']} bytes) at {stored['path']}")
+        return stored
+
+    def download_all(self, service_provider, message_id, attachments):
+        """
+        Download a message's attachments in parallel
+
+        Args:
+            service_provider: Returns a Gmail API client for the calling thread
+            message_id: ID of the message
+            attachments: Attachments as listed by parse_parts
+
+        Returns:
+            list: The stored file for each attachment, in order, with None for those skipped or failed
+        """
+        if not attachments:
+            return []
+        if len(attachments) == 1:
+            return [self.download(service_provider(), message_id, attachments[0])]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(attachments)),
+                                thread_name_prefix='attachment') as executor:
+            return list(executor.map(
+                lambda attachment: self.download(service_provider(), message_id, attachment), attachments
+            ))
@@ -0,0 +1,475 @@
+import time
+import hashlib
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from services.gmail_service import search_messages, get_message_details, ThreadLocalService
+from services.pipeline import Pipeline, Stage
+from services.query_planner import ShardedLister, query_time_bounds
+from utils.email_parser import is_important_email, extract_email_data
+from utils.simhash import SimHashIndex, email_fingerprint
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+# Largest page the Gmail API returns when listing messages
+LIST_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS backfill_jobs (
+    job_id TEXT PRIMARY KEY,
+    query TEXT NOT NULL,
+    max_results INTEGER NOT NULL,
+    page_token TEXT,
+    listed_before INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    important INTEGER NOT NULL DEFAULT 0,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS backfill_done (
+    job_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    PRIMARY KEY (job_id, message_id)
+) WITHOUT ROWID;
+"""
+
+def backfill_job_id(query, max_results, notify=True):
+    """Stable ID of a backfill, so the same query and limit resume the same job"""
+    # Report-only runs keep their own progress, so they never mark emails done for a notifying run
+    key = f"{query}\n{max_results}" if notify else f"{query}\n{max_results}\nreport"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+class BackfillCheckpoint:
+    """
+    Persistent progress of backfill jobs
+
+    Every finished message is recorded, so a resumed job skips exactly the work
+    already done. The job also remembers the page token of the first listing
+    page that still has unfinished messages, so listing resumes there rather
+    than from the first page.
+    """
+
+    def __init__(self, db_file=None):
+        self.db_file = db_file or settings.BACKFILL_DB_FILE
+        self.lock = threading.Lock()
+
+        Path(self.db_file).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+
+    def load(self, job_id, query, max_results, restart=False):
+        """
+        Load a job's checkpoint, creating the job if it is new
+
+        Args:
+            restart: Discard any previous progress of the job
+
+        Returns:
+            dict: The job row
+        """
+        with self.lock, self.conn:
+            if restart:
+                self.conn.execute("DELETE FROM backfill_jobs WHERE job_id = ?", (job_id,))
+                self.conn.execute("DELETE FROM backfill_done WHERE job_id = ?", (job_id,))
+            self.conn.execute(
+                "INSERT OR IGNORE INTO backfill_jobs (job_id, query, max_results, updated_at) VALUES (?, ?, ?, ?)",
+                (job_id, query, max_results, time.time())
+            )
+            cursor = self.conn.execute("SELECT * FROM backfill_jobs WHERE job_id = ?", (job_id,))
+            columns = [column[0] for column in cursor.description]
+            return dict(zip(columns, cursor.fetchone()))
+
+    def done_ids(self, job_id, message_ids):
+        """Return which of the message IDs are already finished"""
+        if not message_ids:
+            return set()
+        with self.lock:
+            placeholders = ','.join('?' * len(message_ids))
+            rows = self.conn.execute(
+                f"SELECT message_id FROM backfill_done WHERE job_id = ? AND message_id IN ({placeholders})",
+                [job_id, *message_ids]
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def mark_done(self, job_id, message_id, important=False):
+        """Record a finished message"""
+        with self.lock, self.conn:
+            added = self.conn.execute(
+                "INSERT OR IGNORE INTO backfill_done (job_id, message_id) VALUES (?, ?)",
+                (job_id, message_id)
+            ).rowcount
+            if added:
+                self.conn.execute(
+                    "UPDATE backfill_jobs SET completed = completed + 1, important = important + ?, "
+                    "updated_at = ? WHERE job_id = ?",
+                    (1 if important else 0, time.time(), job_id)
+                )
+
+    def advance(self, job_id, page_token, listed_before):
+        """Move the listing checkpoint past fully finished pages"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE backfill_jobs SET page_token = ?, listed_before = ?, updated_at = ? WHERE job_id = ?",
+                (page_token, listed_before, time.time(), job_id)
+            )
+
+    def finish(self, job_id):
+        """Mark a job as complete"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE backfill_jobs SET finished_at = ?, updated_at = ? WHERE job_id = ?",
+                (time.time(), time.time(), job_id)
+            )
+
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.conn.close()
+
+class PageTracker:
+    """
+    Tracks unfinished messages per listing page
+
+    The checkpoint can only move past a page once every message on it is
+    finished, and only in listing order, however the parallel workers finish.
+    """
+
+    def __init__(self, listed_before):
+        self.pages = []
+        self.first_page = 0
+        self.listed_before = listed_before
+        self.lock = threading.Lock()
+
+    def add_page(self, next_page_token, message_ids):
+        """Register a listed page, returning its index"""
+        with self.lock:
+            self.pages.append({
+                'remaining': set(message_ids),
+                'size': len(message_ids),
+                'next_page_token': next_page_token
+            })
+            return len(self.pages) - 1
+
+    def finish(self, page_index, message_id):
+        """
+        Mark a message finished
+
+        Returns:
+            tuple: (page_token, listed_before) to checkpoint, or None if the checkpoint did not move
+        """
+        with self.lock:
+            self.pages[page_index]['remaining'].discard(message_id)
+            moved = None
+            while self.first_page < len(self.pages) and not self.pages[self.first_page]['remaining']:
+                page = self.pages[self.first_page]
+                self.listed_before += page['size']
+                moved = (page['next_page_token'], self.listed_before)
+                self.first_page += 1
+            return moved
+
+class BackfillProgress:
+    """Counts finished messages and logs throughput and an ETA now and then"""
+
+    def __init__(self, already_done, interval_seconds=None):
+        self.already_done = already_done
+        self.interval_seconds = interval_seconds or settings.BACKFILL_PROGRESS_SECONDS
+        self.start = time.monotonic()
+        self.last_logged = self.start
+        self.finished = 0
+        self.important = 0
+        self.total = None
+        self.lock = threading.Lock()
+
+    def record(self, important=False):
+        with self.lock:
+            self.finished += 1
+            if important:
+                self.important += 1
+            now = time.monotonic()
+            due = now - self.last_logged >= self.interval_seconds
+            if due:
+                self.last_logged = now
+        if due:
+            self.log()
+
+    def rate(self):
+        """Messages finished per second in this run"""
+        elapsed = time.monotonic() - self.start
+        return self.finished / elapsed if elapsed > 0 else 0.0
+
+    def log(self, log=logger):
+        rate = self.rate()
+        done = self.already_done + self.finished
+        if self.total and rate > 0:
+            remaining = max(0, self.total - done)
+            eta = f", ETA {remaining / rate / 60:.1f} min"
+            progress = f"{done}/{self.total}"
+        else:
+            eta = ""
+            progress = f"{done}"
+        log.info(f"Backfill progress: {progress} emails, {self.important} important this run, "
+                 f"{rate:.1f} emails/s{eta}")
+
+class Backfill:
+    """
+    Resumable, parallel backfill of older mail
+
+    Message IDs are streamed page by page into the fetch, parse, classify and
+    notify pipeline, so listing and processing overlap and memory stays bounded.
+    Progress is checkpointed as messages finish; running the same query again
+    after an interruption picks up where it stopped. Time-bounded queries are
+    listed as date windows in parallel (see ShardedLister).
+    """
+
+    def __init__(self, credentials, notification_service, build_service, checkpoint=None, notify=True, shards=None):
+        self.service = build_service(credentials)
+        self.thread_services = ThreadLocalService(lambda: build_service(credentials))
+        self.notification_service = notification_service
+        self.checkpoint = checkpoint or BackfillCheckpoint()
+        self.notify = notify
+        self.fingerprints = SimHashIndex(settings.NEAR_DUPLICATE_MAX_DISTANCE, settings.NEAR_DUPLICATE_WINDOW_SECONDS)
+        self.job_id = None
+        self.tracker = None
+        self.progress = None
+        self.listing_complete = False
+        self.shards = settings.BACKFILL_LIST_SHARDS if shards is None else shards
+        self.sharded = False
+        self.advance_lock = threading.Lock()
+        # Important emails whose alerts waited in a digest and have since been finished
+        self.digested = set()
+        self.digested_lock = threading.Lock()
+
+    def iter_message_ids(self, query, max_results, page_token, listed):
+        """
+        Stream (page_index, message_id) pairs, stopping at exactly max_results listed
+
+        Pages are registered with the tracker as they are listed, and messages a
+        previous run finished are marked complete instead of being yielded.
+        """
+        while listed < max_results:
+            page_size = min(LIST_PAGE_SIZE, max_results - listed)
+            result = search_messages(self.service, query, page_token, max_results=page_size)
+            if result is None:
+                logger.error("Listing messages failed, stopping the backfill; run it again to resume")
+                return
+            if self.progress.total is None:
+                estimate = result.get('resultSizeEstimate', 0) + listed
+                self.progress.total = min(max_results, estimate) if estimate else max_results
+
+            message_ids = [message['id'] for message in result.get('messages', [])][:max_results - listed]
+            listed += len(message_ids)
+            next_page_token = result.get('nextPageToken')
+            if listed >= max_results or not next_page_token:
+                self.progress.total = listed
+            page_index = self.tracker.add_page(next_page_token, message_ids)
+            yield from self._pending(page_index, message_ids)
+
+            if not next_page_token:
+                break
+            page_token = next_page_token
+        self.listing_complete = True
+
+    def iter_sharded_message_ids(self, lister, query, bounds, max_results):
+        """
+        Stream (page_index, message_id) pairs from date windows listed in parallel
+
+        Each window is tracked as a page. Windows have no page token to resume
+        from, so a resumed run lists again and skips what the done table holds.
+        """
+        listed = 0
+        pages = lister.iter_pages(query, bounds)
+        try:
+            for message_ids in pages:
+                if lister.failed:
+                    # Later windows would push the max_results cut past the gap; resume lists them again
+                    break
+                message_ids = message_ids[:max_results - listed]
+                listed += len(message_ids)
+                page_index = self.tracker.add_page(None, message_ids)
+                yield from self._pending(page_index, message_ids)
+                if listed >= max_results:
+                    break
+        finally:
+            pages.close()
+        self.progress.total = listed
+        self.listing_complete = not lister.failed
+        logger.info(f"Listed {listed} emails from {lister.windows_listed} date windows "
+                    f"({lister.splits} dense windows split)")
+
+    def _pending(self, page_index, message_ids):
+        # Messages a previous run finished are marked complete instead of being yielded
+        done = self.checkpoint.done_ids(self.job_id, message_ids)
+        for message_id in message_ids:
+            if message_id in done:
+                self._finish(page_index, message_id, record=False)
+            else:
+                yield page_index, message_id
+
+    def _listing(self, query, max_results, job):
+        """Pick sharded listing for wide time-bounded queries, paging through the rest"""
+        bounds = query_time_bounds(query)
+        if self.shards > 1 and bounds:
+            lister = ShardedLister(self.thread_services.get, self.shards)
+            estimate = lister.estimate_total(query)
+            # One page lists it anyway, and sharding would drop a saved page token
+            if estimate and min(estimate, max_results) > LIST_PAGE_SIZE and not job['page_token']:
+                self.sharded = True
+                self.progress.total = min(max_results, estimate)
+                logger.info(f"Listing about {self.progress.total} emails in {lister.shards} parallel date windows")
+                return self.iter_sharded_message_ids(lister, query, bounds, max_results)
+        return self.iter_message_ids(query, max_results, job['page_token'], job['listed_before'])
+
+    def _finish(self, page_index, message_id, important=False, record=True):
+        if record:
+            self.checkpoint.mark_done(self.job_id, message_id, important)
+            self.progress.record(important)
+        # Held across both steps so concurrent finishes save checkpoints in order
+        with self.advance_lock:
+            moved = self.tracker.finish(page_index, message_id)
+            if moved and not self.sharded:
+                self.checkpoint.advance(self.job_id, *moved)
+
+    def _is_near_duplicate(self, item):
+        # Fold near-duplicates of an email already alerted in this run
+        original = self.fingerprints.fold(item['fingerprint'], item['received_at']) if item['fingerprint'] else None
+        if original:
+            logger.info(f"Email {item['id']} is a near-duplicate of {original.key}, skipping")
+        return original is not None
+
+    def fetch(self, work):
+        page_index, message_id = work
+        # Skip emails a previous run or the monitor already announced everywhere; a report counts them all
+        if self.notify and self.notification_service.already_notified(message_id):
+            logger.debug(f"Skipping email {message_id}, already notified on all channels")
+            self._finish(page_index, message_id)
+            return None
+        details = get_message_details(self.thread_services.get(), message_id, projection='full')
+        if not details:
+            # Left unfinished so a resumed run retries it
+            return None
+        return {'page': page_index, 'id': message_id, 'details': details}
+
+    def parse(self, item):
+        item['email_data'] = extract_email_data(item['details'])
+        item['received_at'] = int(item['details'].get('internalDate', 0)) / 1000
+        item['fingerprint'] = email_fingerprint(item['email_data']) if settings.NEAR_DUPLICATE_ENABLED else None
+        if self._is_near_duplicate(item):
+            self._finish(item['page'], item['id'])
+            return None
+        return item
+
+    def classify(self, item):
+        if is_important_email(item['email_data']):
+            return item
+        self._finish(item['page'], item['id'])
+        return None
+
+    def notify_stage(self, item):
+        # Classification runs in parallel, so check again for a duplicate alerted meanwhile
+        if self._is_near_duplicate(item):
+            self._finish(item['page'], item['id'])
+            return None
+        if item['fingerprint']:
+            self.fingerprints.add(item['fingerprint'], item['id'], item['received_at'])
+
+        email_data = item['email_data']
+        logger.info(f"Important email found - ID: {item['id']}")
+        logger.info(f"Subject: {email_data['subject']}")
+        logger.info(f"Sender: {email_data['sender']}")
+
+        if self.notify:
+            # Send notifications on every channel that hasn't announced this email yet
+            results = self.notification_service.send_notification(
+                email_data['subject'],
+                email_data['body'],
+                email_data['sender'],
+                item['details']['internalDate'],
+                message_id=item['id'],
+                on_result=lambda channel, success, error: self._digest_result(item, channel, success, error)
+            )
+            if results.failed_channels:
+                # Left unfinished so a resumed run retries the failed channels
+                logger.warning(f"Email {item['id']} not delivered on {', '.join(results.failed_channels)}")
+                return None
+            if results.deferred_channels:
+                # Finished once its digest is sent, which may already have happened
+                self._finish_digested(item)
+                return item
+        self._finish(item['page'], item['id'], important=True)
+        return item
+
+    def _digest_result(self, item, channel, success, error):
+        if not success:
+            # Left unfinished so a resumed run alerts it again
+            logger.warning(f"Digest holding email {item['id']} failed on {channel}: {error}")
+            return
+        self._finish_digested(item)
+
+    def _finish_digested(self, item):
+        # The ledger only lists the email on every channel once each of its digests was sent
+        if not self.notification_service.already_notified(item['id']):
+            return
+        with self.digested_lock:
+            if item['id'] in self.digested:
+                return
+            self.digested.add(item['id'])
+        self._finish(item['page'], item['id'], important=True)
+
+    def run(self, query, max_results, restart=False):
+        """
+        Run or resume a backfill
+
+        Args:
+            query: Gmail search query
+            max_results: Maximum number of messages to process
+            restart: Discard earlier progress of the same query and limit
+
+        Returns:
+            dict: 'completed' and 'important' totals for the job, and per-stage pipeline metrics
+        """
+        self.job_id = backfill_job_id(query, max_results, self.notify)
+        job = self.checkpoint.load(self.job_id, query, max_results, restart)
+        if job['finished_at'] and not restart:
+            logger.info(f"Backfill for '{query}' already finished ({job['completed']} emails, "
+                        f"{job['important']} important); pass --restart to run it again")
+            return {'completed': job['completed'], 'important': job['important'], 'stages': {}}
+        if job['listed_before'] and not job['page_token']:
+            # Every page was finished but the previous run stopped before recording it
+            self.checkpoint.finish(self.job_id)
+            logger.info(f"Backfill complete: {job['completed']} emails, {job['important']} important")
+            return {'completed': job['completed'], 'important': job['important'], 'stages': {}}
+        if job['completed']:
+            logger.info(f"Resuming backfill for '{query}': {job['completed']} emails already done")
+
+        self.tracker = PageTracker(job['listed_before'])
+        self.progress = BackfillProgress(job['completed'])
+        self.listing_complete = False
+        self.sharded = False
+        self.digested = set()
+        message_ids = self._listing(query, max_results, job)
+
+        pipeline = Pipeline([
+            Stage('fetch', self.fetch, settings.PIPELINE_FETCH_WORKERS),
+            Stage('parse', self.parse, settings.PIPELINE_PARSE_WORKERS),
+            Stage('classify', self.classify, settings.PIPELINE_CLASSIFY_WORKERS),
+            Stage('notify', self.notify_stage, settings.PIPELINE_NOTIFY_WORKERS)
+        ], queue_size=settings.PIPELINE_QUEUE_SIZE)
+        stages = pipeline.run(message_ids)
+        if self.notify:
+            # Send alerts still waiting in a digest so their emails can be finished below
+            self.notification_service.flush_digests()
+        pipeline.log_metrics(logger)
+        self.progress.log()
+
+        # Finished only if every listed page was fully processed
+        job = self.checkpoint.load(self.job_id, query, max_results)
+        if self.listing_complete and self.tracker.first_page == len(self.tracker.pages):
+            self.checkpoint.finish(self.job_id)
+            logger.info(f"Backfill complete: {job['completed']} emails, {job['important']} important")
+        else:
+            logger.warning("Backfill stopped with unfinished emails; run it again to resume")
+        return {'completed': job['completed'], 'important': job['important'], 'stages': stages}
@@ -1,33 +1,224 @@
 import os
+import re
 import base64
+import threading
+from functools import lru_cache
+from itertools import chain
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
 from email.mime.audio import MIMEAudio
 from email.mime.base import MIMEBase
 from mimetypes import guess_type as guess_mime_type
-from pathlib import Path
-from googleapiclient.discovery import build
 import config.settings as settings
 from base64 import urlsafe_b64encode
 
-def search_messages(service, query, page_token=None):
+class ThreadLocalService:
+    """Gives each thread its own Gmail API client, since clients are not thread-safe"""
+    
+    def __init__(self, factory):
+        self.factory = factory
+        self.local = threading.local()
+
+    def get(self):
+        service = getattr(self.local, 'service', None)
+        if service is None:
+            service = self.factory()
+            self.local.service = service
+        return service
+
+# Named partial-response projections: each read asks Gmail only for the fields its callers use
+PROJECTIONS = {
+    # Message IDs of a search, for polls and backfill listing
+    'listing': {'fields': 'messages/id,nextPageToken,resultSizeEstimate'},
+    # Headers and text parts, for parsing, classification and notifications
+    'full': {'fields': 'id,internalDate,payload(mimeType,filename,headers,body,parts)', 'format': 'full'},
+    'history': {'fields': 'history/messagesAdded/message(id,labelIds),historyId,nextPageToken'},
+    'attachment': {'fields': 'size,data'},
+    'profile': {'fields': 'emailAddress,historyId'}
+}
+
+FIELD_TOKEN_PATTERN = re.compile(r'[^,()/\s]+|[,()/]')
+# Start of the base64url 'data' string in an attachment response
+ATTACHMENT_DATA_PATTERN = re.compile(rb'"data"\s*:\s*"')
+
+# Bytes read from an attachment download at a time
+ATTACHMENT_CHUNK_SIZE = 64 * 1024
+
+class UnrequestedFieldError(KeyError):
+    """A caller read a response field its projection did not ask Gmail for"""
+
+def _select(tree, path, subtree):
+    for name in path[:-1]:
+        if tree.get(name) is True:
+            return
+        tree = tree.setdefault(name, {})
+    name = path[-1]
+    if subtree is True or tree.get(name) is True:
+        tree[name] = True
+        return
+    for child, child_subtree in subtree.items():
+        _select(tree.setdefault(name, {}), [child], child_subtree)
+
+def _parse_selection(tokens, pos):
+    tree = {}
+    while pos < len(tokens) and tokens[pos] != ')':
+        path = [tokens[pos]]
+        pos += 1
+        while pos < len(tokens) and tokens[pos] == '/':
+            path.append(tokens[pos + 1])
+            pos += 2
+        subtree = True
+        if pos < len(tokens) and tokens[pos] == '(':
+            subtree, pos = _parse_selection(tokens, pos + 1)
+            pos += 1
+        _select(tree, path, subtree)
+        if pos < len(tokens) and tokens[pos] == ',':
+            pos += 1
+    return tree, pos
+
+@lru_cache(maxsize=None)
+def parse_field_mask(fields):
+    """
+    Parse a fields= mask such as 'messages/id,payload(headers,body)'
+
+    Returns:
+        dict: Nested field names, where True selects a whole subtree
+    """
+    return _parse_selection(FIELD_TOKEN_PATTERN.findall(fields), 0)[0]
+
+class ProjectedResource(dict):
+    """
+    A Gmail API response that raises UnrequestedFieldError when a caller reads
+    a field outside its projection
+
+    Missing fields that were requested read as absent, as usual. Only used when
+    GMAIL_FIELD_MASK_CHECKS is on, so production reads stay plain dicts.
+    """
+
+    def __init__(self, data, allowed, path=''):
+        super().__init__(data)
+        self.allowed = allowed
+        self.path = path
+
+    def _check(self, key):
+        if key not in self.allowed:
+            raise UnrequestedFieldError(f"Field '{self.path}{key}' is not in the requested projection")
+
+    def _wrap(self, key, value):
+        allowed = self.allowed[key]
+        if allowed is True:
+            return value
+        if isinstance(value, dict):
+            return ProjectedResource(value, allowed, f"{self.path}{key}/")
+        if isinstance(value, list):
+            return [ProjectedResource(v, allowed, f"{self.path}{key}/") if isinstance(v, dict) else v for v in value]
+        return value
+
+    def __getitem__(self, key):
+        self._check(key)
+        return self._wrap(key, super().__getitem__(key))
+
+    def get(self, key, default=None):
+        self._check(key)
+        return self._wrap(key, super().__getitem__(key)) if super().__contains__(key) else default
+
+    def __contains__(self, key):
+        self._check(key)
+        return super().__contains__(key)
+
+def projection_params(name):
+    """Request parameters for a named projection"""
+    if not settings.GMAIL_FIELD_MASKS:
+        return {}
+    return dict(PROJECTIONS[name])
+
+def check_projection(response, name):
+    """Guard a response against reads outside its projection when checks are enabled"""
+    if response is None or not (settings.GMAIL_FIELD_MASKS and settings.GMAIL_FIELD_MASK_CHECKS):
+        return response
+    return ProjectedResource(response, parse_field_mask(PROJECTIONS[name]['fields']))
+
+def search_messages(service, query, page_token=None, max_results=100):
     try:
         response = service.users().messages().list(
             userId='me',
             q=query,
             pageToken=page_token,
-            maxResults=100  # Adjust as needed, Gmail API allows up to 500
+            maxResults=max_results,  # Gmail API allows up to 500
+            **projection_params('listing')
         ).execute()
-        return response
+        return check_projection(response, 'listing')
+    except Exception as e:
+        print(f'An error occurred: {e}')
+        return None
+
+def get_message_details(service, msg_id, projection='full'):
+    """Get a message, limited to the fields of a projection ('full' by default)"""
+    try:
+        message = service.users().messages().get(userId='me', id=msg_id, **projection_params(projection)).execute()
+        return check_projection(message, projection)
+    except Exception as e:
+        print(f'An error occurred: {e}')
+        return None
+
+def get_profile(service):
+    """Get the mailbox's email address and current history ID"""
+    try:
+        profile = service.users().getProfile(userId='me', **projection_params('profile')).execute()
+        return check_projection(profile, 'profile')
+    except Exception as e:
+        print(f'An error occurred: {e}')
+        return None
+
+def watch_mailbox(service, topic_name, label_ids=None):
+    """
+    Ask Gmail to publish mailbox changes to a Pub/Sub topic
+
+    Returns:
+        dict: The watch response with 'historyId' and 'expiration' (epoch ms), or None on error
+    """
+    try:
+        return service.users().watch(userId='me', body={
+            'topicName': topic_name,
+            'labelIds': label_ids or ['INBOX'],
+            'labelFilterBehavior': 'include'
+        }).execute()
     except Exception as e:
         print(f'An error occurred: {e}')
         return None
 
-def get_message_details(service, msg_id):
+def list_history(service, start_history_id, label_id='INBOX'):
+    """
+    List messages added to a label since a history ID
+
+    Returns:
+        dict: 'message_ids' of unread messages added, oldest first, and the
+              latest 'history_id'; None on error, including a history ID too old to use
+    """
     try:
-        message = service.users().messages().get(userId='me', id=msg_id).execute()
-        return message
+        message_ids = []
+        history_id = start_history_id
+        page_token = None
+        while True:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                labelId=label_id,
+                pageToken=page_token,
+                **projection_params('history')
+            ).execute()
+            response = check_projection(response, 'history')
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    message = added.get('message', {})
+                    if 'UNREAD' in message.get('labelIds', ['UNREAD']) and message.get('id') not in message_ids:
+                        message_ids.append(message.get('id'))
+            history_id = response.get('historyId', history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return {'message_ids': message_ids, 'history_id': history_id}
     except Exception as e:
         print(f'An error occurred: {e}')
         return None
@@ -104,27 +295,85 @@ def parse_parts(service, parts, message_id):
     
     return content
 
-def download_attachment(service, message_id, attachment_id, output_dir=None):
-    """Download an attachment from a message"""
+def _json_string_field(chunks, pattern):
+    """Yield the raw value of a JSON string field from a response read in chunks"""
+    chunks = iter(chunks)
+    buffer = b''
+    for chunk in chunks:
+        buffer += chunk
+        match = pattern.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        # Keep enough of the tail to find a field name split across chunks
+        buffer = buffer[-64:]
+    else:
+        return
+
+    # Base64url has no quotes or escapes, so the next quote ends the value
+    for chunk in chain([buffer], chunks):
+        end = chunk.find(b'"')
+        if end >= 0:
+            if end:
+                yield chunk[:end]
+            return
+        if chunk:
+            yield chunk
+
+def stream_attachment_data(service, message_id, attachment_id, chunk_size=ATTACHMENT_CHUNK_SIZE):
+    """
+    Stream an attachment's base64url data without holding the response in memory
+
+    Yields:
+        bytes: Consecutive pieces of the encoded data
+
+    Raises:
+        Exception: If the download fails; callers decide whether to retry
+    """
+    request = service.users().messages().attachments().get(
+        userId='me', messageId=message_id, id=attachment_id, **projection_params('attachment')
+    )
+    credentials = getattr(request.http, 'credentials', None)
+    if credentials is None:
+        # This client cannot be streamed from, so read the response in one go
+        yield (request.execute().get('data') or '').encode('ascii')
+        return
+
+    from google.auth.transport.requests import AuthorizedSession
+    with AuthorizedSession(credentials) as session:
+        with session.get(request.uri, stream=True, timeout=settings.ATTACHMENT_TIMEOUT_SECONDS) as response:
+            response.raise_for_status()
+            yield from _json_string_field(response.iter_content(chunk_size), ATTACHMENT_DATA_PATTERN)
+
+def decode_base64_chunks(chunks):
+    """Decode base64url data arriving in arbitrary pieces, yielding bytes as they become decodable"""
+    leftover = b''
+    for chunk in chunks:
+        data = leftover + chunk
+        usable = len(data) - len(data) % 4
+        leftover = data[usable:]
+        if usable:
+            yield base64.urlsafe_b64decode(data[:usable])
+    if leftover:
+        yield base64.urlsafe_b64decode(leftover + b'=' * (-len(leftover) % 4))
+
+def download_attachment(service, message_id, attachment_id, output_dir=None, filename=None):
+    """
+    Download an attachment from a message
+
+    With output_dir, the attachment is streamed to a content-addressed file
+    there (see AttachmentStore) and its path returned; otherwise its bytes are.
+    """
     try:
-        attachment = service.users().messages().attachments().get(
-            userId='me', messageId=message_id, id=attachment_id
-        ).execute()
-        
-        data = attachment.get('data')
-        if not data:
-            return None
-        
-        file_data = base64.urlsafe_b64decode(data)
-        
         if output_dir:
-            Path(output_dir).mkdir(parents=True, exist_ok=True)
-            file_path = os.path.join(output_dir, filename)
-            with open(file_path, 'wb') as f:
-                f.write(file_data)
-            return file_path
-        else:
-            return file_data
+            from services.attachment_store import AttachmentStore
+            stored = AttachmentStore(output_dir).download(
+                service, message_id, {'id': attachment_id, 'filename': filename or 'attachment'}
+            )
+            return stored['path'] if stored else None
+
+        file_data = b''.join(decode_base64_chunks(stream_attachment_data(service, message_id, attachment_id)))
+        return file_data or None
             
     except Exception as e:
         print(f"Error downloading attachment: {e}")
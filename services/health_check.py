@@ -0,0 +1,41 @@
+import os
+import sys
+import json
+import time
+from services.poll_scheduler import PollScheduler
+import config.settings as settings
+
+# Kept free of the Gmail, Llama and notification stacks: Docker runs this every health check interval
+
+def max_healthy_age():
+    """Seconds without a successful poll after which the daemon counts as unhealthy"""
+    # Allow a couple of missed polls at the longest interval the scheduler can choose
+    longest = PollScheduler().longest_interval
+    if settings.PUSH_ENABLED:
+        longest = max(longest, settings.PUSH_SAFETY_POLL_SECONDS)
+    return 3 * longest + 60
+
+def check_health_file(max_age_seconds=None):
+    """
+    Check the health file written by a running daemon
+
+    Returns:
+        int: 0 if the daemon reports itself healthy and the file is fresh, 1 otherwise
+    """
+    max_age_seconds = max_age_seconds or max_healthy_age()
+    try:
+        with open(settings.HEALTH_FILE, 'r') as file:
+            snapshot = json.load(file)
+        age = time.time() - os.path.getmtime(settings.HEALTH_FILE)
+    except (OSError, ValueError) as e:
+        print(f"Health file unavailable: {e}")
+        return 1
+
+    if not snapshot.get('healthy') or age > max_age_seconds:
+        print(f"Unhealthy: status={snapshot.get('status')}, file age {age:.0f}s")
+        return 1
+    print(f"Healthy: {snapshot.get('polls')} polls, last success {snapshot.get('last_success_at')}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(check_health_file())
@@ -0,0 +1,224 @@
+import re
+import time
+import threading
+import logging
+import requests
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+CLASSIFICATION_PATTERN = re.compile(r'\b(NOT[_ ]IMPORTANT|IMPORTANT)\b', re.IGNORECASE)
+CONFIDENCE_PATTERN = re.compile(r'(\d{1,3}(?:\.\d+)?)\s*%?')
+
+class ModelTier:
+    """A single model in the cascade with its own timeout and concurrency limit"""
+
+    def __init__(self, model, timeout, concurrency):
+        self.model = model
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.slots = threading.BoundedSemaphore(concurrency)
+
+    def __repr__(self):
+        return f"ModelTier({self.model!r}, timeout={self.timeout}, concurrency={self.concurrency})"
+
+def parse_model_tiers(spec):
+    """
+    Parse a tier specification into ModelTier objects
+
+    Args:
+        spec: Comma-separated tiers, smallest model first, each as
+              "model|timeout_seconds|max_concurrent" (timeout and concurrency optional)
+
+    Returns:
+        list: ModelTier objects in escalation order
+    """
+    tiers = []
+    for entry in spec.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        fields = [field.strip() for field in entry.split('|')]
+        model = fields[0]
+        timeout = float(fields[1]) if len(fields) > 1 and fields[1] else 60.0
+        concurrency = int(fields[2]) if len(fields) > 2 and fields[2] else 1
+        tiers.append(ModelTier(model, timeout, max(1, concurrency)))
+    return tiers
+
+def parse_classification(text):
+    """
+    Parse an IMPORTANT/NOT_IMPORTANT answer and its confidence from a model response
+
+    Returns:
+        tuple: (decision, confidence) where decision is True, False or None if
+               unparseable, and confidence is a float between 0 and 1
+    """
+    match = CLASSIFICATION_PATTERN.search(text or '')
+    if not match:
+        return None, 0.0
+
+    decision = not match.group(1).upper().startswith('NOT')
+
+    confidence_match = CONFIDENCE_PATTERN.search(text[match.end():])
+    if not confidence_match:
+        # An answer without a confidence score is treated as a coin flip
+        return decision, 0.5
+
+    confidence = float(confidence_match.group(1))
+    if confidence > 1:
+        confidence /= 100.0
+    return decision, min(max(confidence, 0.0), 1.0)
+
+class LlamaCascade:
+    """Route prompts through a cascade of models, escalating when the smaller model is unsure"""
+
+    def __init__(self, tiers, base_url, confidence_threshold=0.75):
+        if not tiers:
+            raise ValueError("At least one model tier is required")
+        self.tiers = tiers
+        self.generate_url = f"{base_url.rstrip('/')}/api/generate"
+        self.confidence_threshold = confidence_threshold
+        self.session = requests.Session()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            'requests': 0,
+            'escalations': 0,
+            'tiers': {tier.model: {'calls': 0, 'failures': 0, 'total_latency': 0.0} for tier in tiers}
+        }
+
+    def _record(self, tier, latency, failed):
+        with self._metrics_lock:
+            stats = self._metrics['tiers'][tier.model]
+            stats['calls'] += 1
+            stats['total_latency'] += latency
+            if failed:
+                stats['failures'] += 1
+
+    def _generate(self, tier, prompt):
+        """Run a prompt on one tier, returning the response text or None on failure"""
+        # Waiting for a free slot counts against the tier's timeout
+        if not tier.slots.acquire(timeout=tier.timeout):
+            logger.warning(f"No free slot for model {tier.model} within {tier.timeout}s")
+            self._record(tier, 0.0, failed=True)
+            return None
+
+        start = time.monotonic()
+        try:
+            response = self.session.post(
+                self.generate_url,
+                json={"model": tier.model, "prompt": prompt, "stream": False},
+                timeout=tier.timeout
+            )
+            if response.status_code != 200:
+                logger.error(f"Error calling Llama API with model {tier.model}: {response.status_code}")
+                self._record(tier, time.monotonic() - start, failed=True)
+                return None
+            self._record(tier, time.monotonic() - start, failed=False)
+            return response.json().get("response", "").strip()
+        except Exception as e:
+            logger.error(f"Exception calling Llama API with model {tier.model}: {str(e)}")
+            self._record(tier, time.monotonic() - start, failed=True)
+            return None
+        finally:
+            tier.slots.release()
+
+    def _count_request(self, escalations):
+        with self._metrics_lock:
+            self._metrics['requests'] += 1
+            if escalations:
+                self._metrics['escalations'] += 1
+
+    def classify(self, prompt):
+        """
+        Classify a prompt, escalating to larger models while confidence is low
+
+        Returns:
+            tuple: (decision, confidence, model) where decision is None if no tier answered
+        """
+        best = (None, 0.0, None)
+        escalations = 0
+
+        for index, tier in enumerate(self.tiers):
+            if index > 0:
+                escalations += 1
+                logger.debug(f"Escalating classification to model {tier.model}")
+
+            text = self._generate(tier, prompt)
+            if text is None:
+                continue
+
+            decision, confidence = parse_classification(text)
+            if decision is None:
+                continue
+
+            if confidence >= best[1] or best[0] is None:
+                best = (decision, confidence, tier.model)
+            if confidence >= self.confidence_threshold:
+                break
+
+        self._count_request(escalations)
+        return best
+
+    def generate(self, prompt):
+        """
+        Generate free text, escalating only when a tier fails or returns nothing
+
+        Returns:
+            tuple: (text, model) where text is None if every tier failed
+        """
+        escalations = 0
+
+        for index, tier in enumerate(self.tiers):
+            if index > 0:
+                escalations += 1
+            text = self._generate(tier, prompt)
+            if text:
+                self._count_request(escalations)
+                return text, tier.model
+
+        self._count_request(escalations)
+        return None, None
+
+    def get_metrics(self):
+        """Return a snapshot of request, escalation and per-tier latency metrics"""
+        with self._metrics_lock:
+            requests_count = self._metrics['requests']
+            tiers = {}
+            for model, stats in self._metrics['tiers'].items():
+                calls = stats['calls']
+                tiers[model] = {
+                    'calls': calls,
+                    'failures': stats['failures'],
+                    'mean_latency': stats['total_latency'] / calls if calls else 0.0
+                }
+            return {
+                'requests': requests_count,
+                'escalations': self._metrics['escalations'],
+                'escalation_rate': self._metrics['escalations'] / requests_count if requests_count else 0.0,
+                'tiers': tiers
+            }
+
+_cascade = None
+_cascade_lock = threading.Lock()
+
+def get_llama_cascade():
+    """Return the process-wide model cascade built from settings"""
+    global _cascade
+    if _cascade is None:
+        with _cascade_lock:
+            if _cascade is None:
+                _cascade = LlamaCascade(
+                    parse_model_tiers(settings.LLAMA_MODEL_TIERS),
+                    settings.LLAMA_URL,
+                    settings.LLAMA_CONFIDENCE_THRESHOLD
+                )
+                logger.info(f"Llama cascade initialized with tiers: {_cascade.tiers}")
+    return _cascade
+
+def reset_llama_cascade():
+    """Drop the process-wide cascade so the next use rebuilds it from the current settings"""
+    global _cascade
+    with _cascade_lock:
+        cascade, _cascade = _cascade, None
+    if cascade:
+        cascade.session.close()
@@ -0,0 +1,80 @@
+import time
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sent_notifications (
+    message_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    sent_at REAL NOT NULL,
+    PRIMARY KEY (message_id, channel)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sent_notifications_sent_at ON sent_notifications (sent_at);
+"""
+
+# Old entries are pruned after this many new records
+PRUNE_EVERY = 1000
+
+class NotificationLedger:
+    """
+    Record of which emails have already been notified on which channel
+
+    Shared by every entry point (the monitor, outbox workers and backfills) so an
+    email is never announced twice on the same channel, even across runs.
+    Entries older than the retention period are pruned.
+    """
+
+    def __init__(self, db_file=None, retention_days=None):
+        self.db_file = db_file or settings.NOTIFICATION_LEDGER_FILE
+        self.retention_days = retention_days or settings.NOTIFICATION_LEDGER_RETENTION_DAYS
+        self.lock = threading.Lock()
+        self.records_since_prune = 0
+
+        Path(self.db_file).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+        self.prune()
+
+    def has_sent(self, message_id, channel):
+        """Check whether a notification for this email was already sent on the channel"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM sent_notifications WHERE message_id = ? AND channel = ?",
+                (message_id, channel)
+            ).fetchone()
+        return row is not None
+
+    def record(self, message_id, channel):
+        """Record that a notification for this email was sent on the channel"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sent_notifications (message_id, channel, sent_at) VALUES (?, ?, ?)",
+                (message_id, channel, time.time())
+            )
+            self.records_since_prune += 1
+            should_prune = self.records_since_prune >= PRUNE_EVERY
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        """Delete entries older than the retention period"""
+        cutoff = time.time() - self.retention_days * 86400
+        with self.lock, self.conn:
+            removed = self.conn.execute(
+                "DELETE FROM sent_notifications WHERE sent_at < ?", (cutoff,)
+            ).rowcount
+            self.records_since_prune = 0
+        if removed:
+            logger.info(f"Pruned {removed} notification ledger entries older than {self.retention_days} days")
+
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,350 @@
+import json
+import time
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from services.notification_service import DELIVERY_DEFERRED, CHANNEL_WHATSAPP
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_DELIVERING = 'delivering'
+# Buffered in an in-memory digest; settled once the digest is sent, retried if the process dies first
+STATUS_DEFERRED = 'deferred'
+STATUS_DELIVERED = 'delivered'
+STATUS_DEAD = 'dead'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    message_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (message_id, channel)
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (channel, status, next_attempt_at);
+"""
+
+# Finished entries are pruned after this many deliveries
+PRUNE_EVERY = 1000
+
+class NotificationOutbox:
+    """
+    Persistent SQLite queue of notifications waiting to be delivered per channel
+
+    Delivered and dead-lettered entries are pruned once older than the retention period.
+    """
+
+    def __init__(self, db_file=None, max_attempts=None, backoff_seconds=None, max_backoff_seconds=3600,
+                 retention_days=None):
+        self.db_file = db_file or settings.OUTBOX_DB_FILE
+        self.max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        self.backoff_seconds = backoff_seconds or settings.OUTBOX_RETRY_BACKOFF_SECONDS
+        self.max_backoff_seconds = max_backoff_seconds
+        self.retention_days = retention_days or settings.OUTBOX_RETENTION_DAYS
+        self.lock = threading.Lock()
+        self.finished_since_prune = 0
+
+        Path(self.db_file).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.lock, self.conn:
+            self.conn.executescript(SCHEMA)
+            # Anything left mid-delivery or in an unsent digest by a previous run is retried
+            recovered = self.conn.execute(
+                "UPDATE outbox SET status = ? WHERE status IN (?, ?)",
+                (STATUS_PENDING, STATUS_DELIVERING, STATUS_DEFERRED)
+            ).rowcount
+        if recovered:
+            logger.info(f"Recovered {recovered} notifications interrupted mid-delivery")
+        self.prune()
+
+    def enqueue(self, message_id, channels, payload):
+        """
+        Queue a notification for each channel
+
+        Args:
+            message_id: Gmail message ID the notification is about
+            channels: Channel names to deliver on
+            payload: JSON-serializable notification content
+
+        Returns:
+            int: Number of new outbox entries (duplicates are ignored)
+        """
+        now = time.time()
+        data = json.dumps(payload)
+        with self.lock, self.conn:
+            added = 0
+            for channel in channels:
+                added += self.conn.execute(
+                    "INSERT OR IGNORE INTO outbox "
+                    "(message_id, channel, payload, status, next_attempt_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (message_id, channel, data, STATUS_PENDING, now, now, now)
+                ).rowcount
+        return added
+
+    def claim(self, channel):
+        """
+        Claim the oldest due notification for a channel
+
+        Returns:
+            dict: Entry with id, message_id, attempts and payload, or None if nothing is due
+        """
+        entries = self.claim_batch(channel, 1)
+        return entries[0] if entries else None
+
+    def claim_batch(self, channel, limit):
+        """
+        Claim up to limit due notifications for a channel, oldest first
+
+        Returns:
+            list: Entries as returned by claim, empty if nothing is due
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT id, message_id, attempts, payload FROM outbox "
+                "WHERE channel = ? AND status = ? AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at, id LIMIT ?",
+                (channel, STATUS_PENDING, now, max(1, limit))
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE outbox SET status = ?, updated_at = ? WHERE id = ?",
+                [(STATUS_DELIVERING, now, row[0]) for row in rows]
+            )
+        return [{
+            'id': row[0],
+            'message_id': row[1],
+            'attempts': row[2],
+            'payload': json.loads(row[3])
+        } for row in rows]
+
+    def mark_delivered(self, entry_id):
+        """Mark an entry as delivered"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = NULL, updated_at = ? "
+                "WHERE id = ?",
+                (STATUS_DELIVERED, time.time(), entry_id)
+            )
+        self._count_finished()
+
+    def mark_deferred(self, entry_id):
+        """Park a claimed entry until the digest it was buffered into is sent"""
+        with self.lock, self.conn:
+            # Skipped if the digest already went out and settled the entry
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (STATUS_DEFERRED, time.time(), entry_id, STATUS_DELIVERING)
+            )
+
+    def mark_failed(self, entry_id, error):
+        """
+        Record a failed attempt, scheduling a retry with exponential backoff
+
+        Returns:
+            bool: True if the entry was dead-lettered after exhausting its attempts
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            attempts = self.conn.execute(
+                "SELECT attempts FROM outbox WHERE id = ?", (entry_id,)
+            ).fetchone()[0] + 1
+
+            if attempts >= self.max_attempts:
+                self.conn.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                    (STATUS_DEAD, attempts, str(error), now, entry_id)
+                )
+                dead = True
+            else:
+                delay = min(self.backoff_seconds * (2 ** (attempts - 1)), self.max_backoff_seconds)
+                self.conn.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (STATUS_PENDING, attempts, str(error), now + delay, now, entry_id)
+                )
+                dead = False
+        if dead:
+            self._count_finished()
+        return dead
+
+    def dead_letter_disabled_channels(self, enabled_channels):
+        """
+        Dead-letter unfinished entries for channels that are no longer enabled
+
+        Nothing would ever deliver them, so they are closed out instead of
+        staying pending forever.
+
+        Returns:
+            int: Number of entries dead-lettered
+        """
+        enabled_channels = list(enabled_channels)
+        placeholders = ', '.join('?' for _ in enabled_channels)
+        channel_filter = f" AND channel NOT IN ({placeholders})" if enabled_channels else ""
+        with self.lock, self.conn:
+            abandoned = self.conn.execute(
+                "UPDATE outbox SET status = ?, last_error = ?, updated_at = ? "
+                f"WHERE status IN (?, ?, ?){channel_filter}",
+                (STATUS_DEAD, 'channel disabled', time.time(), STATUS_PENDING, STATUS_DELIVERING, STATUS_DEFERRED,
+                 *enabled_channels)
+            ).rowcount
+        if abandoned:
+            logger.warning(f"Dead-lettered {abandoned} notifications queued for channels that are no longer enabled")
+        return abandoned
+
+    def _count_finished(self):
+        with self.lock:
+            self.finished_since_prune += 1
+            should_prune = self.finished_since_prune >= PRUNE_EVERY
+        if should_prune:
+            self.prune()
+
+    def prune(self):
+        """Delete delivered and dead-lettered entries older than the retention period"""
+        cutoff = time.time() - self.retention_days * 86400
+        with self.lock, self.conn:
+            removed = self.conn.execute(
+                "DELETE FROM outbox WHERE status IN (?, ?) AND updated_at < ?",
+                (STATUS_DELIVERED, STATUS_DEAD, cutoff)
+            ).rowcount
+            self.finished_since_prune = 0
+        if removed:
+            logger.info(f"Pruned {removed} finished outbox entries older than {self.retention_days} days")
+
+    def stats(self):
+        """Return entry counts grouped by channel and status"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT channel, status, COUNT(*) FROM outbox GROUP BY channel, status"
+            ).fetchall()
+        result = {}
+        for channel, status, count in rows:
+            result.setdefault(channel, {})[status] = count
+        return result
+
+    def close(self):
+        """Close the database connection"""
+        with self.lock:
+            self.conn.close()
+
+class OutboxWorker(threading.Thread):
+    """
+    Background thread that drains one channel of the outbox
+
+    Due entries are claimed batch_size at a time and handed to deliver in one
+    call, so a channel with a costly session (WhatsApp starts a browser) pays
+    for it once per batch rather than once per message.
+    """
+
+    def __init__(self, outbox, channel, deliver, poll_seconds=None, batch_size=1):
+        super().__init__(name=f"outbox-{channel}", daemon=True)
+        self.outbox = outbox
+        self.channel = channel
+        self.deliver = deliver
+        self.poll_seconds = poll_seconds or settings.OUTBOX_POLL_SECONDS
+        self.batch_size = max(1, batch_size)
+        self.stop_event = threading.Event()
+
+    def process_due(self):
+        """
+        Deliver a batch of due entries
+
+        deliver(entries, callbacks) returns a (result, error) pair per entry.
+        An entry the channel buffers for a digest stays in the outbox, deferred,
+        until the digest reports back through its callback; only then is it
+        delivered or retried.
+
+        Returns:
+            bool: True if entries were processed, False if the channel had nothing due
+        """
+        entries = self.outbox.claim_batch(self.channel, self.batch_size)
+        if not entries:
+            return False
+
+        callbacks = [self._settler(entry) for entry in entries]
+        try:
+            results = self.deliver(entries, callbacks)
+        except Exception as e:
+            results = [(False, e)] * len(entries)
+
+        for entry, settle, (result, error) in zip(entries, callbacks, results):
+            if result == DELIVERY_DEFERRED:
+                self.outbox.mark_deferred(entry['id'])
+                logger.debug(f"Deferred {self.channel} notification for email {entry['message_id']} to a digest")
+            elif result:
+                settle(True)
+            else:
+                settle(False, error or "Channel reported delivery failure")
+        return True
+
+    def _settler(self, entry):
+        def settle(success, error=None):
+            if success:
+                self.outbox.mark_delivered(entry['id'])
+                logger.info(f"Delivered {self.channel} notification for email {entry['message_id']}")
+            else:
+                self._failed(entry, error)
+        return settle
+
+    def _failed(self, entry, error):
+        if self.outbox.mark_failed(entry['id'], error):
+            logger.error(f"Dead-lettered {self.channel} notification for email "
+                         f"{entry['message_id']} after {entry['attempts'] + 1} attempts: {error}")
+        else:
+            logger.warning(f"Failed to deliver {self.channel} notification for email "
+                           f"{entry['message_id']}, will retry: {error}")
+
+    def run(self):
+        logger.info(f"Outbox worker for {self.channel} started")
+        while not self.stop_event.is_set():
+            try:
+                if not self.process_due():
+                    self.stop_event.wait(self.poll_seconds)
+            except Exception as e:
+                logger.exception(f"Unexpected error in {self.channel} outbox worker: {e}")
+                self.stop_event.wait(self.poll_seconds)
+        logger.info(f"Outbox worker for {self.channel} stopped")
+
+    def stop(self):
+        self.stop_event.set()
+
+def start_outbox_workers(outbox, notification_service):
+    """Start one delivery worker per configured notification channel"""
+    outbox.dead_letter_disabled_channels(notification_service.enabled_channels())
+    workers = []
+    for channel in notification_service.enabled_channels():
+        def deliver(entries, callbacks, channel=channel):
+            return notification_service.notify_channel_batch(channel, [
+                {
+                    'subject': entry['payload']['subject'],
+                    'body': entry['payload']['body'],
+                    'sender': entry['payload']['sender'],
+                    'received_time': entry['payload']['received_time'],
+                    'message_id': entry['message_id'],
+                    'on_result': on_result
+                }
+                for entry, on_result in zip(entries, callbacks)
+            ])
+
+        batch_size = settings.WHATSAPP_BATCH_SIZE if channel == CHANNEL_WHATSAPP else 1
+        worker = OutboxWorker(outbox, channel, deliver, batch_size=batch_size)
+        worker.start()
+        workers.append(worker)
+    return workers
+
+def stop_outbox_workers(workers, timeout=30):
+    """Signal workers to stop and wait for in-flight deliveries to finish"""
+    for worker in workers:
+        worker.stop()
+    for worker in workers:
+        worker.join(timeout)
@@ -1,10 +1,16 @@
-import os
-import requests
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from collections import OrderedDict
 from datetime import datetime
-from pathlib import Path
 import logging
 from utils.email_parser import extract_job_title, extract_company, extract_location, extract_salary
-from utils.whatsapp_notifications import send_whatsapp_message, is_session_valid
+from utils.whatsapp_notifications import send_whatsapp_message, send_whatsapp_message_batch, is_session_valid
+from services.llama_service import get_llama_cascade
+from services.telegram_client import get_telegram_client
+from services.notification_ledger import NotificationLedger
+from utils.prompt_builder import build_email_excerpt
+import config.settings as settings
 
 # Configure logging
 logging.basicConfig(
@@ -13,35 +19,116 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Notification channels
+CHANNEL_TELEGRAM = 'telegram'
+CHANNEL_WHATSAPP = 'whatsapp'
+CHANNEL_LABELS = {
+    CHANNEL_TELEGRAM: 'Telegram',
+    CHANNEL_WHATSAPP: 'WhatsApp'
+}
+
+# Number of formatted messages kept so each channel doesn't re-run the summary
+FORMATTED_MESSAGE_CACHE_SIZE = 64
+
+# Timeout for a channel without its own setting
+DEFAULT_CHANNEL_TIMEOUT_SECONDS = 60
+
+# notify_channel result for an alert buffered for a later digest; its on_result callback reports the outcome
+DELIVERY_DEFERRED = 'deferred'
+
 # Initialize Llama 3.2 integration
-def generate_summary_with_llama(content, max_length=150):
-    """Generate a summary of email content using Llama 3.2"""
+def generate_summary_with_llama(content, max_length=150, subject=None):
+    """Generate a summary of email content using the Llama model cascade"""
     try:
+        excerpt = build_email_excerpt(subject, None, content, token_budget=settings.LLAMA_SUMMARY_TOKEN_BUDGET)
         prompt = f"""
         Summarize the following email content in a concise way (max 2-3 sentences):
 
-        {content[:1000]}
+        {excerpt}
         """
         
-        payload = {
-            "model": "llama3.2",
-            "prompt": prompt,
-            "stream": False
-        }
-        
-        response = requests.post("http://localhost:11434/api/generate", json=payload)
+        summary, model = get_llama_cascade().generate(prompt)
         
-        if response.status_code == 200:
-            result = response.json()
-            summary = result["response"].strip()
+        if summary:
+            logger.debug(f"Summary generated with model {model}")
             return summary[:max_length] + ("..." if len(summary) > max_length else "")
         else:
-            logger.error(f"Error calling Llama API: {response.status_code}")
+            logger.error("No Llama model returned a summary")
             return content[:max_length] + "..."
     except Exception as e:
         logger.error(f"Exception in generate_summary_with_llama: {str(e)}")
         return content[:max_length] + "..."
 
+class DigestBuffer:
+    """
+    Collects alerts for one channel and flushes them as a single digest
+
+    The buffer only lives in memory, so each entry carries an on_result
+    callback that its owner uses to keep the alert durable until the digest
+    containing it has actually been sent.
+    """
+    
+    def __init__(self, channel, send_digest, window_seconds, max_items):
+        self.channel = channel
+        self.send_digest = send_digest
+        self.window_seconds = window_seconds
+        self.max_items = max_items
+        self.entries = []
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def _take(self):
+        # Must be called with the lock held
+        entries, self.entries = self.entries, []
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        return entries
+
+    def _start_timer(self):
+        # Must be called with the lock held
+        if self.timer is None and self.entries:
+            self.timer = threading.Timer(self.window_seconds, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def add(self, entry):
+        """Buffer an alert, flushing straight away once the buffer is full"""
+        with self.lock:
+            self.entries.append(entry)
+            entries = self._take() if len(self.entries) >= self.max_items else None
+            if entries is None:
+                self._start_timer()
+        if entries:
+            self.send_digest(self.channel, entries)
+
+    def flush(self):
+        """Send everything buffered so far"""
+        with self.lock:
+            entries = self._take()
+        if entries:
+            self.send_digest(self.channel, entries)
+
+class NotificationResults(dict):
+    """
+    Per-channel notification results
+    
+    Maps channel name to a dict with 'success', 'deferred', 'error' and 'elapsed'
+    (seconds). A deferred channel buffered the alert for a digest that has not
+    been sent yet. Truthy if at least one channel succeeded or deferred.
+    """
+    
+    def __bool__(self):
+        return any(result['success'] for result in self.values())
+
+    @property
+    def failed_channels(self):
+        return [channel for channel, result in self.items() if not result['success']]
+
+    @property
+    def deferred_channels(self):
+        return [channel for channel, result in self.items() if result.get('deferred')]
+
 class NotificationService:
     """Service for sending notifications to different platforms"""
     
@@ -53,26 +140,86 @@ class NotificationService:
         self.whatsapp_phone = config.get('WHATSAPP_PHONE')
         self.use_llama = config.get('USE_LLAMA', True)  # Add config option for Llama
         self.logger = logger
+        self._formatted_cache = OrderedDict()
+        self._formatted_cache_lock = threading.Lock()
+        
+        # Digest mode: buffer alerts and send one combined message per window
+        self.digest_enabled = config.get('DIGEST_ENABLED', settings.DIGEST_ENABLED)
+        self.digest_window_seconds = config.get('DIGEST_WINDOW_SECONDS', settings.DIGEST_WINDOW_SECONDS)
+        self.digest_max_items = config.get('DIGEST_MAX_ITEMS', settings.DIGEST_MAX_ITEMS)
+        self.digest_priority_keywords = [k.strip().lower() for k in
+                                         config.get('DIGEST_PRIORITY_KEYWORDS', settings.DIGEST_PRIORITY_KEYWORDS)]
+        self.digest_priority_senders = [s.strip().lower() for s in
+                                        config.get('DIGEST_PRIORITY_SENDERS', settings.DIGEST_PRIORITY_SENDERS)]
+        self._digest_buffers = {}
+        self._digest_buffers_lock = threading.Lock()
+        
+        # Concurrent fan-out across channels
+        self.channel_timeouts = {
+            CHANNEL_TELEGRAM: config.get('TELEGRAM_NOTIFY_TIMEOUT_SECONDS', settings.TELEGRAM_NOTIFY_TIMEOUT_SECONDS),
+            CHANNEL_WHATSAPP: config.get('WHATSAPP_NOTIFY_TIMEOUT_SECONDS', settings.WHATSAPP_NOTIFY_TIMEOUT_SECONDS)
+        }
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='notify')
+        
+        # Cross-run record of sent notifications, shared by every entry point
+        self._owns_ledger = not config.get('NOTIFICATION_LEDGER')
+        self.ledger = config.get('NOTIFICATION_LEDGER') or NotificationLedger()
+
+    def close(self):
+        """Send buffered digests, then stop the delivery threads and close the ledger this service opened"""
+        self.flush_digests()
+        self._executor.shutdown(wait=True)
+        if self._owns_ledger:
+            self.ledger.close()
+
+    def enabled_channels(self):
+        """Return the names of all configured notification channels"""
+        channels = []
+        if self.telegram_bot_token and self.telegram_chat_id:
+            channels.append(CHANNEL_TELEGRAM)
+        if self.whatsapp_enabled and self.whatsapp_phone:
+            channels.append(CHANNEL_WHATSAPP)
+        return channels
+
+    def get_formatted_message(self, subject, body, sender, received_time):
+        """Format a message once and reuse it for every channel that delivers it"""
+        key = (subject, sender, str(received_time))
+        with self._formatted_cache_lock:
+            if key in self._formatted_cache:
+                self._formatted_cache.move_to_end(key)
+                return self._formatted_cache[key]
+        
+        message = self.format_message(subject, body, sender, received_time)
+        
+        with self._formatted_cache_lock:
+            self._formatted_cache[key] = message
+            while len(self._formatted_cache) > FORMATTED_MESSAGE_CACHE_SIZE:
+                self._formatted_cache.popitem(last=False)
+        return message
+
+    def format_received_time(self, received_time, time_format="%Y-%m-%d %H:%M:%S"):
+        """Format a Gmail internalDate (ms since epoch, int or str) as a readable time"""
+        # Get timestamp - handle both string and int types
+        try:
+            if isinstance(received_time, str):
+                # Try to convert string to int if it's numeric
+                if received_time.isdigit():
+                    received_time = int(received_time)
+                else:
+                    # If it's not numeric, use current time
+                    received_time = int(datetime.now().timestamp() * 1000)
+            
+            # Now proceed with timestamp conversion
+            received_dt = datetime.fromtimestamp(received_time / 1000)
+            return received_dt.strftime(time_format)
+        except (ValueError, TypeError):
+            # Fallback to current time if conversion fails
+            return datetime.now().strftime(time_format)
 
     def format_message(self, subject, body, sender, received_time):
         """Format message for notifications with relevant details and stylish formatting"""
         try:
-            # Get timestamp - handle both string and int types
-            try:
-                if isinstance(received_time, str):
-                    # Try to convert string to int if it's numeric
-                    if received_time.isdigit():
-                        received_time = int(received_time)
-                    else:
-                        # If it's not numeric, use current time
-                        received_time = int(datetime.now().timestamp() * 1000)
-                
-                # Now proceed with timestamp conversion
-                received_dt = datetime.fromtimestamp(received_time / 1000)
-                time_str = received_dt.strftime("%Y-%m-%d %H:%M:%S")
-            except (ValueError, TypeError):
-                # Fallback to current time if conversion fails
-                time_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            time_str = self.format_received_time(received_time)
                 
             # Extract job details if available
             job_title = extract_job_title(body) if body else None
@@ -101,7 +248,7 @@ class NotificationService:
                 message += f"\n*Summary:* "
                 if self.use_llama:
                     try:
-                        summary = generate_summary_with_llama(body)
+                        summary = generate_summary_with_llama(body, subject=subject)
                         message += f"_{summary}_\n"
                     except Exception as e:
                         # Fallback to simple preview if Llama fails
@@ -118,45 +265,268 @@ class NotificationService:
             logger.error(f"Error formatting message: {e}")
             return f"New email from {sender}: {subject}"
 
-    def send_notification(self, subject, body, sender, received_time):
-        """Send notification through all configured channels"""
-        success = False
-        formatted_message = self.format_message(subject, body, sender, received_time)
+    def format_digest(self, entries):
+        """Format buffered alerts as one digest message with a line per email"""
+        message = f"📬 *Important Email Digest* ({len(entries)} emails)\n\n"
+        for index, entry in enumerate(entries, 1):
+            time_str = self.format_received_time(entry['received_time'], "%H:%M")
+            message += f"{index}. *{entry['subject']}* — _{entry['sender']}_ ({time_str})\n"
+        return message
+
+    def is_priority(self, subject, sender):
+        """Check whether an alert is top priority and should bypass the digest"""
+        subject = (subject or '').lower()
+        sender = (sender or '').lower()
+        if any(keyword and keyword in subject for keyword in self.digest_priority_keywords):
+            return True
+        return any(priority_sender and priority_sender in sender for priority_sender in self.digest_priority_senders)
+
+    def _get_digest_buffer(self, channel):
+        with self._digest_buffers_lock:
+            buffer = self._digest_buffers.get(channel)
+            if buffer is None:
+                buffer = DigestBuffer(channel, self._send_digest, self.digest_window_seconds, self.digest_max_items)
+                self._digest_buffers[channel] = buffer
+            return buffer
+
+    def _send_digest(self, channel, entries):
+        """Deliver a digest and report the outcome to each alert's owner"""
+        try:
+            if self.send_to_channel(channel, self.format_digest(entries)):
+                logger.info(f"{CHANNEL_LABELS[channel]} digest with {len(entries)} emails sent successfully")
+                if self.ledger:
+                    for entry in entries:
+                        if entry.get('message_id'):
+                            self.ledger.record(entry['message_id'], channel)
+                self._report_digest(entries, True, None)
+                return
+            error = "channel reported delivery failure"
+        except Exception as e:
+            error = str(e)
         
-        # Try Telegram if configured
-        if self.telegram_bot_token and self.telegram_chat_id:
+        logger.error(f"Failed to send {CHANNEL_LABELS[channel]} digest with {len(entries)} emails: {error}")
+        self._report_digest(entries, False, error)
+
+    def _report_digest(self, entries, success, error):
+        unowned = 0
+        for entry in entries:
+            if entry.get('on_result') is None:
+                unowned += 1
+                continue
             try:
-                self.send_telegram_notification(formatted_message)
-                success = True
-                logger.info("Telegram notification sent successfully")
+                entry['on_result'](success, error)
             except Exception as e:
-                logger.error(f"Failed to send Telegram notification: {str(e)}")
-        else:
+                logger.exception(f"Error reporting digest result for email {entry.get('message_id')}: {e}")
+        if unowned and not success:
+            logger.error(f"{unowned} digest alerts had no owner to retry them and were dropped")
+
+    def flush_digests(self):
+        """Send any buffered digests immediately"""
+        with self._digest_buffers_lock:
+            buffers = list(self._digest_buffers.values())
+        for buffer in buffers:
+            buffer.flush()
+
+    def already_notified(self, message_id):
+        """Check whether every configured channel has already been notified about an email"""
+        channels = self.enabled_channels()
+        return bool(channels) and all(self.ledger.has_sent(message_id, channel) for channel in channels)
+
+    def notify_channel(self, channel, subject, body, sender, received_time, message_id=None, on_result=None,
+                       deadline=None):
+        """
+        Notify a single channel about an email
+        
+        In digest mode the alert is buffered and sent later as part of a combined
+        message, unless it is top priority. When a message ID is given, emails
+        already notified on this channel (by any run) are skipped.
+        
+        Args:
+            on_result: Called as on_result(success, error) once the digest holding
+                       a buffered alert has been sent or has failed
+            deadline: time.monotonic() value by which a direct send gives up
+        
+        Returns:
+            True if the alert was sent or had already been sent, DELIVERY_DEFERRED
+            if it was buffered for a digest, False if sending failed
+        """
+        if message_id and self.ledger and self.ledger.has_sent(message_id, channel):
+            logger.info(f"Skipping {CHANNEL_LABELS[channel]} notification for email {message_id}, already sent")
+            return True
+        
+        if self.digest_enabled and not self.is_priority(subject, sender):
+            self._get_digest_buffer(channel).add({
+                'message_id': message_id,
+                'subject': subject,
+                'sender': sender,
+                'received_time': received_time,
+                'on_result': on_result
+            })
+            return DELIVERY_DEFERRED
+        
+        message = self.get_formatted_message(subject, body, sender, received_time)
+        success = self.send_to_channel(channel, message, deadline)
+        if success and message_id and self.ledger:
+            self.ledger.record(message_id, channel)
+        return success
+
+    def notify_channel_batch(self, channel, alerts):
+        """
+        Notify a single channel about several emails
+        
+        Each alert is a dict of notify_channel's arguments. Alerts are skipped or
+        buffered for a digest exactly as notify_channel would, and the WhatsApp
+        alerts left to send go out together through one browser session.
+        
+        Returns:
+            list: A (result, error) pair per alert, in order, with results as from notify_channel
+        """
+        if channel != CHANNEL_WHATSAPP:
+            results = []
+            for alert in alerts:
+                try:
+                    results.append((self.notify_channel(channel, **alert), None))
+                except Exception as e:
+                    results.append((False, str(e)))
+            return results
+        
+        results = [None] * len(alerts)
+        direct = []
+        for index, alert in enumerate(alerts):
+            message_id = alert.get('message_id')
+            if message_id and self.ledger and self.ledger.has_sent(message_id, channel):
+                logger.info(f"Skipping WhatsApp notification for email {message_id}, already sent")
+                results[index] = (True, None)
+            elif self.digest_enabled and not self.is_priority(alert['subject'], alert['sender']):
+                results[index] = (self.notify_channel(channel, **alert), None)
+            else:
+                direct.append(index)
+        
+        if direct:
+            messages = [self.get_formatted_message(alerts[index]['subject'], alerts[index]['body'],
+                                                   alerts[index]['sender'], alerts[index]['received_time'])
+                        for index in direct]
+            for index, outcome in zip(direct, self.send_whatsapp_batch(messages)):
+                message_id = alerts[index].get('message_id')
+                if outcome['success'] and message_id and self.ledger:
+                    self.ledger.record(message_id, channel)
+                results[index] = (outcome['success'], outcome['error'])
+        return results
+
+    def send_notification(self, subject, body, sender, received_time, message_id=None, on_result=None):
+        """
+        Send notification through all configured channels concurrently
+        
+        Each channel runs in its own thread with its own timeout, so a slow channel
+        never delays the others. Pass the Gmail message ID to skip channels that
+        were already notified about this email. Channels that buffer the alert for
+        a digest call on_result(channel, success, error) once the digest is sent.
+        
+        Returns:
+            NotificationResults: Per-channel results; truthy if any channel succeeded
+        """
+        results = NotificationResults()
+        
+        if not (self.telegram_bot_token and self.telegram_chat_id):
             logger.warning("Telegram notifications not configured. Add TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID to .env file.")
         
-        # Try WhatsApp if enabled and configured
-        if self.whatsapp_enabled and self.whatsapp_phone:
+        channels = self.enabled_channels()
+        if not channels:
+            return results
+        
+        # Format once up front so concurrent channels share the summary instead of racing to build it
+        if not self.digest_enabled or self.is_priority(subject, sender):
+            self.get_formatted_message(subject, body, sender, received_time)
+        
+        start = time.monotonic()
+        futures = {
+            channel: self._executor.submit(self._notify_channel_timed, channel, subject, body, sender, received_time,
+                                           message_id, self._channel_callback(on_result, channel),
+                                           start + self._channel_timeout(channel))
+            for channel in channels
+        }
+        
+        for channel, future in futures.items():
+            label = CHANNEL_LABELS[channel]
+            timeout = self._channel_timeout(channel)
+            remaining = max(0.0, start + timeout - time.monotonic())
             try:
-                self.send_whatsapp_notification(formatted_message)
-                success = True
-                logger.info("WhatsApp notification sent successfully")
+                result, elapsed = future.result(timeout=remaining)
+                results[channel] = {'success': bool(result), 'deferred': result == DELIVERY_DEFERRED,
+                                    'error': None if result else 'delivery failed', 'elapsed': elapsed}
+            except FutureTimeoutError:
+                # Not started yet: never send it. Already running: the send gives up at the same deadline
+                future.cancel()
+                results[channel] = {'success': False, 'error': f'timed out after {timeout}s', 'elapsed': timeout}
             except Exception as e:
-                logger.error(f"Failed to send WhatsApp notification: {str(e)}")
+                results[channel] = {'success': False, 'error': str(e), 'elapsed': time.monotonic() - start}
+            
+            if results[channel].get('deferred'):
+                logger.info(f"{label} notification buffered for the next digest")
+            elif results[channel]['success']:
+                logger.info(f"{label} notification sent successfully in {results[channel]['elapsed']:.1f}s")
+            else:
+                logger.error(f"Failed to send {label} notification: {results[channel]['error']}")
         
-        return success
+        return results
+
+    @staticmethod
+    def _channel_callback(on_result, channel):
+        if on_result is None:
+            return None
+        return lambda success, error: on_result(channel, success, error)
+
+    def _channel_timeout(self, channel):
+        return self.channel_timeouts.get(channel, DEFAULT_CHANNEL_TIMEOUT_SECONDS)
+
+    def _notify_channel_timed(self, channel, subject, body, sender, received_time, message_id, on_result, deadline):
+        start = time.monotonic()
+        result = self.notify_channel(channel, subject, body, sender, received_time, message_id, on_result, deadline)
+        return result if result == DELIVERY_DEFERRED else bool(result), time.monotonic() - start
 
-    def send_telegram_notification(self, message):
+    def send_to_channel(self, channel, message, deadline=None):
+        """
+        Send an already formatted message through a single channel
+        
+        A deadline (time.monotonic() value) bounds how long the channel may take.
+        
+        Returns:
+            bool: True if the channel accepted the message
+        
+        Raises:
+            Exception: Whatever the underlying channel raised on failure
+        """
+        if channel == CHANNEL_TELEGRAM:
+            self.send_telegram_notification(message, deadline)
+            return True
+        if channel == CHANNEL_WHATSAPP:
+            return bool(self.send_whatsapp_notification(message, deadline))
+        raise ValueError(f"Unknown notification channel: {channel}")
+
+    def send_telegram_notification(self, message, deadline=None):
         """Send a notification via Telegram"""
-        url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
-        data = {
-            'chat_id': self.telegram_chat_id,
-            'text': message,
-            'parse_mode': 'Markdown'  # Enable Markdown formatting
-        }
-        response = requests.post(url, data=data)
-        response.raise_for_status()
+        client = get_telegram_client(self.telegram_bot_token)
+        client.send_message(
+            self.telegram_chat_id,
+            message,
+            parse_mode='Markdown',  # Enable Markdown formatting
+            deadline=deadline
+        )
+
+    def send_whatsapp_batch(self, messages):
+        """
+        Send several WhatsApp notifications, starting the browser once for all of them
+        
+        Returns:
+            list: Per-message dicts with 'success' and 'error'
+        """
+        if not is_session_valid():
+            # Re-authenticating needs the visible browser, which sends one message at a time
+            return [{'success': bool(send_whatsapp_message(self.whatsapp_phone, message, use_headless=False)),
+                     'error': None} for message in messages]
+        return send_whatsapp_message_batch([(self.whatsapp_phone, message) for message in messages])
 
-    def send_whatsapp_notification(self, message):
+    def send_whatsapp_notification(self, message, deadline=None):
         """Send a notification via WhatsApp"""
         # Check if session is valid, if not, use visible browser
         use_headless = is_session_valid()
@@ -165,5 +535,6 @@ class NotificationService:
         return send_whatsapp_message(
             phone_number=self.whatsapp_phone,
             message=message,
-            use_headless=use_headless  # Will use headless mode if session is valid, otherwise visible browser
+            use_headless=use_headless,  # Will use headless mode if session is valid, otherwise visible browser
+            timeout=max(0.0, deadline - time.monotonic()) if deadline is not None else None
         )
\ No newline at end of file
@@ -0,0 +1,154 @@
+import time
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the input on a stage's queue
+_STOP = object()
+
+class Stage:
+    """
+    One step of a pipeline with its own worker pool
+
+    The handler takes an item and returns the item for the next stage, or None
+    to drop it. Exceptions are logged and the item is dropped.
+    """
+
+    def __init__(self, name, handler, workers=1):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.input = None
+        self.output = None
+        self.next_workers = 0
+        self.threads = []
+        self.active_workers = 0
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+
+    def _record(self, elapsed, dropped=False, error=False):
+        with self.lock:
+            self.processed += 1
+            self.busy_seconds += elapsed
+            if dropped:
+                self.dropped += 1
+            if error:
+                self.errors += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.input.qsize())
+
+    def _work(self):
+        while True:
+            item = self.input.get()
+            if item is _STOP:
+                break
+
+            start = time.monotonic()
+            try:
+                result = self.handler(item)
+            except Exception as e:
+                logger.exception(f"Error in pipeline stage {self.name}: {e}")
+                self._record(time.monotonic() - start, dropped=True, error=True)
+                continue
+
+            self._record(time.monotonic() - start, dropped=result is None)
+            if result is not None and self.output is not None:
+                # Blocks while the next stage is full, pushing back on this one
+                self.output.put(result)
+
+        with self.lock:
+            self.active_workers -= 1
+            last = self.active_workers == 0
+        if last and self.output is not None:
+            for _ in range(self.next_workers):
+                self.output.put(_STOP)
+
+    def start(self):
+        self.active_workers = self.workers
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'busy_seconds': self.busy_seconds,
+                'mean_seconds': self.busy_seconds / self.processed if self.processed else 0.0,
+                'queue_depth': self.input.qsize() if self.input else 0,
+                'max_queue_depth': self.max_queue_depth
+            }
+
+class Pipeline:
+    """
+    Chain of stages connected by bounded queues
+
+    Each stage runs on its own worker threads. A full queue blocks the stage
+    feeding it, so throughput is set by the slowest stage and memory stays bounded.
+    """
+
+    def __init__(self, stages, queue_size=50):
+        self.stages = stages
+        for index, stage in enumerate(stages):
+            stage.input = queue.Queue(maxsize=queue_size)
+            if index > 0:
+                stages[index - 1].output = stage.input
+                stages[index - 1].next_workers = stage.workers
+        self.started = False
+        self.start_time = None
+
+    def start(self):
+        """Start every stage's workers"""
+        for stage in self.stages:
+            stage.start()
+        self.started = True
+        self.start_time = time.monotonic()
+
+    def put(self, item):
+        """Feed an item into the first stage, blocking while it is full"""
+        self.stages[0].input.put(item)
+
+    def close(self):
+        """Signal the end of the input and wait for every stage to drain"""
+        first = self.stages[0]
+        for _ in range(first.workers):
+            first.input.put(_STOP)
+        for stage in self.stages:
+            for thread in stage.threads:
+                thread.join()
+
+    def run(self, items):
+        """
+        Push all items through the pipeline and wait for it to finish
+
+        Returns:
+            dict: Per-stage metrics
+        """
+        if not self.started:
+            self.start()
+        for item in items:
+            self.put(item)
+        self.close()
+        return self.metrics()
+
+    def metrics(self):
+        """Return metrics for every stage, keyed by stage name"""
+        return {stage.name: stage.metrics() for stage in self.stages}
+
+    def log_metrics(self, log=logger):
+        """Log a one-line summary per stage"""
+        elapsed = time.monotonic() - self.start_time if self.start_time else 0.0
+        for name, stats in self.metrics().items():
+            log.info(f"Stage {name}: {stats['processed']} processed, {stats['dropped']} dropped, "
+                     f"{stats['errors']} errors, {stats['mean_seconds']:.2f}s mean, "
+                     f"max queue {stats['max_queue_depth']} ({stats['workers']} workers)")
+        log.info(f"Pipeline finished in {elapsed:.1f}s")
@@ -0,0 +1,102 @@
+import random
+import logging
+from datetime import datetime, timedelta
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+def parse_quiet_hours(spec):
+    """
+    Parse a quiet-hours window like "23:00-07:00"
+
+    Returns:
+        tuple: (start, end) as minutes after midnight, or None if no window is set
+    """
+    if not spec or not spec.strip():
+        return None
+    try:
+        start, end = (part.strip() for part in spec.split('-'))
+        start_hour, start_minute = (int(value) for value in start.split(':'))
+        end_hour, end_minute = (int(value) for value in end.split(':'))
+    except ValueError:
+        logger.warning(f"Ignoring invalid quiet hours: {spec}")
+        return None
+    return start_hour * 60 + start_minute, end_hour * 60 + end_minute
+
+class PollScheduler:
+    """
+    Picks the delay before the next poll from recent mail volume and time of day
+
+    A poll that finds new mail drops the interval to min_interval, since more
+    mail tends to follow. Each quiet or failed poll multiplies it by
+    backoff_factor, up to max_interval. During quiet hours polls are at least
+    quiet_interval apart, but never sleep past the end of the window. Every delay
+    is randomized by +/- jitter so several instances do not poll in lockstep.
+    """
+
+    def __init__(self, base_interval=None, min_interval=None, max_interval=None, backoff_factor=None,
+                 jitter=None, quiet_hours=None, quiet_interval=None, adaptive=None):
+        self.base_interval = base_interval or settings.CHECK_INTERVAL_SECONDS
+        self.min_interval = min_interval or settings.POLL_MIN_INTERVAL_SECONDS
+        self.max_interval = max(max_interval or settings.POLL_MAX_INTERVAL_SECONDS, self.min_interval)
+        self.backoff_factor = backoff_factor or settings.POLL_BACKOFF_FACTOR
+        self.jitter = settings.POLL_JITTER if jitter is None else jitter
+        self.quiet_hours = parse_quiet_hours(settings.POLL_QUIET_HOURS if quiet_hours is None else quiet_hours)
+        self.quiet_interval = quiet_interval or settings.POLL_QUIET_INTERVAL_SECONDS
+        self.adaptive = settings.POLL_ADAPTIVE if adaptive is None else adaptive
+        self.interval = self.base_interval
+
+    @property
+    def longest_interval(self):
+        """Longest delay the scheduler can return, before jitter"""
+        if not self.adaptive:
+            return self.base_interval
+        longest = max(self.max_interval, self.base_interval)
+        if self.quiet_hours:
+            longest = max(longest, self.quiet_interval)
+        return longest
+
+    def seconds_until_quiet_end(self, now):
+        """Seconds until the quiet-hours window ends, or None if now is outside it"""
+        if not self.quiet_hours:
+            return None
+        start, end = self.quiet_hours
+        minute = now.hour * 60 + now.minute
+        # The window may wrap past midnight, e.g. 23:00-07:00
+        inside = start <= minute < end if start <= end else minute >= start or minute < end
+        if not inside:
+            return None
+        end_time = now.replace(hour=end // 60, minute=end % 60, second=0, microsecond=0)
+        if end_time <= now:
+            end_time += timedelta(days=1)
+        return (end_time - now).total_seconds()
+
+    def next_interval(self, found_new, ok=True, now=None):
+        """
+        Record a poll's outcome and return the delay before the next one
+
+        Args:
+            found_new: Whether the poll found new mail
+            ok: Whether the poll completed; failures back off like quiet polls
+            now: Current time, for testing
+
+        Returns:
+            float: Seconds to wait
+        """
+        if not self.adaptive:
+            return self.base_interval
+
+        if found_new and ok:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, max(self.min_interval, self.interval * self.backoff_factor))
+
+        delay = self.interval
+        quiet_remaining = self.seconds_until_quiet_end(now or datetime.now())
+        if quiet_remaining is not None:
+            # Wake when quiet hours end so the morning's mail is picked up promptly
+            delay = min(max(delay, self.quiet_interval), quiet_remaining)
+
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(1.0, delay)
@@ -0,0 +1,122 @@
+import json
+import base64
+import hmac
+import threading
+import logging
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+def decode_push_message(body):
+    """
+    Decode a Pub/Sub push request carrying a Gmail notification
+
+    The request body is {"message": {"data": base64(JSON), ...}, "subscription": ...}
+    where the data is {"emailAddress": ..., "historyId": ...}.
+
+    Returns:
+        dict: 'email_address' and 'history_id', or None if the body is not a Gmail notification
+    """
+    try:
+        envelope = json.loads(body)
+        data = envelope['message']['data']
+        notification = json.loads(base64.b64decode(data + '=' * (-len(data) % 4)))
+        return {
+            'email_address': notification['emailAddress'],
+            'history_id': str(notification['historyId'])
+        }
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring malformed push message: {e}")
+        return None
+
+def encode_push_message(email_address, history_id, message_id='local-1'):
+    """Build a Pub/Sub push request body, as the local publisher sends it"""
+    data = json.dumps({'emailAddress': email_address, 'historyId': int(history_id)})
+    return json.dumps({
+        'message': {
+            'data': base64.b64encode(data.encode('utf-8')).decode('ascii'),
+            'messageId': message_id
+        },
+        'subscription': 'projects/local/subscriptions/gmail-push'
+    })
+
+class PushReceiver:
+    """
+    HTTP endpoint for Gmail push notifications delivered by a Pub/Sub push subscription
+
+    Requests are acknowledged immediately and handed to on_push(email_address,
+    history_id), which should only schedule the sync. The subscription's push
+    URL must carry the shared token as ?token=...; without a token the
+    receiver refuses to start.
+    """
+
+    def __init__(self, on_push, port=None, path=None, token=None, host='0.0.0.0'):
+        self.on_push = on_push
+        self.port = port or settings.PUSH_PORT
+        self.path = path or settings.PUSH_PATH
+        self.token = settings.PUSH_TOKEN if token is None else token
+        self.host = host
+        self.server = None
+        self.received = 0
+
+    def _authorized(self, query):
+        # Without a shared secret anyone who can reach the port could trigger syncs
+        if not self.token:
+            return False
+        supplied = parse_qs(query).get('token', [''])[0]
+        return hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8'))
+
+    def handle(self, path, body):
+        """
+        Handle one push request
+
+        Returns:
+            int: HTTP status to answer with
+        """
+        url = urlparse(path)
+        if url.path != self.path:
+            return 404
+        if not self._authorized(url.query):
+            return 403
+
+        notification = decode_push_message(body)
+        # Acknowledge malformed messages too, or Pub/Sub redelivers them forever
+        if notification:
+            self.received += 1
+            self.on_push(notification['email_address'], notification['history_id'])
+        return 204
+
+    def start(self):
+        """
+        Start serving in a background thread
+
+        Raises:
+            ValueError: If no token is configured
+        """
+        if not self.token:
+            raise ValueError("PUSH_TOKEN must be set to receive push notifications")
+        receiver = self
+
+        class PushHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                status = receiver.handle(self.path, self.rfile.read(length))
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), PushHandler)
+        threading.Thread(target=self.server.serve_forever, name='push-receiver', daemon=True).start()
+        logger.info(f"Push receiver listening on port {self.port} at {self.path}")
+
+    def stop(self):
+        """Stop serving"""
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,205 @@
+import re
+import time
+import math
+import logging
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from services.gmail_service import search_messages
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+# Largest page the Gmail API returns when listing messages
+LIST_PAGE_SIZE = 500
+
+# Approximate lengths of Gmail's relative date units; windows are padded, so exact calendar math is not needed
+UNIT_SECONDS = {'d': 86400, 'm': 31 * 86400, 'y': 366 * 86400}
+
+# Matched against whole top-level terms of a query, see _top_level_terms
+NEWER_THAN_PATTERN = re.compile(r'newer_than:(\d+)([dmy])', re.IGNORECASE)
+OLDER_THAN_PATTERN = re.compile(r'older_than:(\d+)([dmy])', re.IGNORECASE)
+AFTER_PATTERN = re.compile(r'(?:after|newer):(\S+)', re.IGNORECASE)
+BEFORE_PATTERN = re.compile(r'(?:before|older):(\S+)', re.IGNORECASE)
+
+# Windows are padded by a day so they cover the query's own range however Gmail rounds dates
+PADDING_SECONDS = 86400
+
+def _parse_date(value):
+    if value.isdigit():
+        return int(value)
+    for fmt in ('%Y/%m/%d', '%Y-%m-%d', '%m/%d/%Y'):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    return None
+
+def _top_level_terms(query):
+    """
+    Split a query into the terms it ANDs together at the top level
+
+    Groups in () or {} and quoted phrases stay whole, so a date term inside
+    them is never mistaken for a limit on the whole query.
+
+    Returns:
+        list: The terms, or None if the top level is an OR, which no single term bounds
+    """
+    terms, term, depth, quoted = [], '', 0, False
+    for char in query:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char in '({':
+            depth += 1
+        elif not quoted and char in ')}':
+            depth = max(0, depth - 1)
+        elif not quoted and not depth and char.isspace():
+            if term:
+                terms.append(term)
+            term = ''
+            continue
+        term += char
+    if term:
+        terms.append(term)
+    if 'OR' in terms or '|' in terms:
+        return None
+    return terms
+
+def query_time_bounds(query, now=None):
+    """
+    Work out the time range a query is limited to
+
+    Only top-level terms that are not negated count: -newer_than:7d or a date
+    inside an OR group does not bound what the query matches.
+
+    Returns:
+        tuple: (start, end) epoch seconds, padded to cover the query's range,
+               or None if the query has no lower time bound
+    """
+    now = int(now or time.time())
+    terms = _top_level_terms(query)
+    if terms is None:
+        return None
+
+    starts, ends = [], []
+    for term in terms:
+        newer_than = NEWER_THAN_PATTERN.fullmatch(term)
+        older_than = OLDER_THAN_PATTERN.fullmatch(term)
+        after = AFTER_PATTERN.fullmatch(term)
+        before = BEFORE_PATTERN.fullmatch(term)
+        if newer_than:
+            starts.append(now - int(newer_than.group(1)) * UNIT_SECONDS[newer_than.group(2).lower()])
+        elif older_than:
+            ends.append(now - int(older_than.group(1)) * UNIT_SECONDS[older_than.group(2).lower()])
+        elif after and _parse_date(after.group(1)) is not None:
+            starts.append(_parse_date(after.group(1)))
+        elif before and _parse_date(before.group(1)) is not None:
+            ends.append(_parse_date(before.group(1)))
+
+    if not starts:
+        return None
+    start = max(starts) - PADDING_SECONDS
+    end = min(ends + [now]) + PADDING_SECONDS
+    return (start, end) if start < end else None
+
+def window_query(query, start, end):
+    """Narrow a query to the epoch-second window [start, end)"""
+    # after: and before: both exclude their own second, so start - 1 keeps windows gap-free
+    # The query is grouped so a top-level OR in it cannot swallow the window
+    return f"({query}) after:{start - 1} before:{end}"
+
+class ShardedLister:
+    """
+    Lists a time-bounded query as disjoint date windows in parallel
+
+    Page tokens chain, so one query can only be listed a page at a time. This
+    splits the query's time range into windows listed concurrently, newest
+    first. A window whose first page shows more than window_target messages is
+    split in proportion to its density before it is paged through, so busy
+    periods get narrow windows and quiet ones stay wide. Results are yielded
+    in window order without duplicates.
+    """
+
+    def __init__(self, service_provider, shards=None, window_target=None, min_window_seconds=None):
+        self.service_provider = service_provider
+        self.shards = max(1, shards or settings.BACKFILL_LIST_SHARDS)
+        self.window_target = window_target or settings.BACKFILL_WINDOW_TARGET
+        self.min_window_seconds = min_window_seconds or settings.BACKFILL_MIN_WINDOW_SECONDS
+        self.failed = False
+        self.windows_listed = 0
+        self.splits = 0
+
+    def estimate_total(self, query):
+        """Gmail's estimate of how many messages match the whole query"""
+        result = search_messages(self.service_provider(), query, max_results=1)
+        return result.get('resultSizeEstimate') if result else None
+
+    def _list_window(self, query, window):
+        start, end = window
+        service = self.service_provider()
+        result = search_messages(service, window_query(query, start, end), max_results=LIST_PAGE_SIZE)
+        if result is None:
+            return 'failed', None
+
+        estimate = result.get('resultSizeEstimate', 0)
+        if result.get('nextPageToken') and estimate > self.window_target and end - start > self.min_window_seconds:
+            parts = min(math.ceil(estimate / self.window_target), math.ceil((end - start) / self.min_window_seconds))
+            step = math.ceil((end - start) / parts)
+            # Newest first, like the windows themselves
+            subwindows = [(max(start, edge - step), edge) for edge in range(end, start, -step)]
+            return 'split', subwindows
+
+        message_ids = [message['id'] for message in result.get('messages', [])]
+        page_token = result.get('nextPageToken')
+        while page_token:
+            result = search_messages(service, window_query(query, start, end), page_token, max_results=LIST_PAGE_SIZE)
+            if result is None:
+                return 'failed', None
+            message_ids.extend(message['id'] for message in result.get('messages', []))
+            page_token = result.get('nextPageToken')
+        return 'listed', message_ids
+
+    def iter_pages(self, query, bounds):
+        """
+        Yield the message IDs of each window, newest window first
+
+        Stop consuming early to cancel the remaining windows. Windows that fail
+        to list are skipped and set failed.
+        """
+        start, end = bounds
+        step = math.ceil((end - start) / self.shards)
+        pending = deque((max(start, edge - step), edge) for edge in range(end, start, -step))
+        seen = set()
+
+        with ThreadPoolExecutor(max_workers=self.shards, thread_name_prefix='list') as executor:
+            futures = deque()
+            try:
+                while pending or futures:
+                    # Keep every worker busy, in window order
+                    while pending and len(futures) < self.shards:
+                        window = pending.popleft()
+                        futures.append((window, executor.submit(self._list_window, query, window)))
+
+                    window, future = futures.popleft()
+                    outcome, value = future.result()
+                    if outcome == 'split':
+                        self.splits += 1
+                        logger.debug(f"Splitting dense window {window} into {len(value)} windows")
+                        # The parts take the dense window's place, ahead of the later windows already running
+                        futures.extendleft(reversed([
+                            (part, executor.submit(self._list_window, query, part)) for part in value
+                        ]))
+                        continue
+                    if outcome == 'failed':
+                        logger.error(f"Listing window {window} failed")
+                        self.failed = True
+                        continue
+
+                    self.windows_listed += 1
+                    message_ids = [message_id for message_id in value if message_id not in seen]
+                    seen.update(message_ids)
+                    if message_ids:
+                        yield message_ids
+            finally:
+                for _, future in futures:
+                    future.cancel()
@@ -0,0 +1,187 @@
+import time
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+import config.settings as settings
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+
+# Bot API limits: about one message per second per chat and 30 per second overall
+PER_CHAT_RATE = 1.0
+GLOBAL_RATE = 30.0
+
+class TokenBucket:
+    """Thread-safe token bucket that blocks callers until a token is available"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """
+        Take one token, sleeping until one is available
+
+        Returns:
+            bool: True once a token was taken, False if none is available before
+                  the deadline (a time.monotonic() value)
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Drain the bucket so no token is handed out for the given number of seconds"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = -seconds * self.rate
+            self.updated = now
+
+class TelegramClient:
+    """Telegram Bot API client with a pooled keep-alive session and rate limiting"""
+
+    def __init__(self, bot_token, pool_size=10, timeout=10, max_retries=5, backoff_seconds=1.0):
+        self.bot_token = bot_token
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+
+        self.global_bucket = TokenBucket(GLOBAL_RATE)
+        self.chat_buckets = {}
+        self.chat_buckets_lock = threading.Lock()
+
+    def _chat_bucket(self, chat_id):
+        with self.chat_buckets_lock:
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(PER_CHAT_RATE)
+                self.chat_buckets[chat_id] = bucket
+            return bucket
+
+    @staticmethod
+    def _retry_after(response):
+        """Read the retry delay from a 429 response body or header"""
+        try:
+            retry_after = response.json().get('parameters', {}).get('retry_after')
+            if retry_after is not None:
+                return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            return float(response.headers.get('Retry-After', 1))
+        except (TypeError, ValueError):
+            return 1.0
+
+    @staticmethod
+    def _wait(delay, deadline):
+        """Sleep before a retry, giving up if the retry would start after the deadline"""
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            raise requests.Timeout("Telegram send deadline reached before the next retry")
+        time.sleep(delay)
+
+    def send_message(self, chat_id, text, parse_mode='Markdown', deadline=None):
+        """
+        Send a message, waiting for rate limits and retrying 429/5xx responses
+
+        Args:
+            chat_id: Telegram chat ID
+            text: Message text
+            parse_mode: Telegram parse mode for the text
+            deadline: time.monotonic() value by which to give up, rate-limit waits,
+                      requests and retries included
+
+        Returns:
+            dict: Parsed Bot API response
+
+        Raises:
+            requests.RequestException: If the message could not be delivered after all
+                retries or before the deadline
+        """
+        url = f"{TELEGRAM_API_URL}/bot{self.bot_token}/sendMessage"
+        data = {
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': parse_mode
+        }
+        chat_bucket = self._chat_bucket(chat_id)
+
+        for attempt in range(self.max_retries + 1):
+            if not (chat_bucket.acquire(deadline) and self.global_bucket.acquire(deadline)):
+                raise requests.Timeout("Telegram send deadline reached while rate limited")
+            timeout = self.timeout
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    raise requests.Timeout("Telegram send deadline reached")
+
+            try:
+                response = self.session.post(url, data=data, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_seconds * (2 ** attempt)
+                logger.warning(f"Telegram request failed ({e}), retrying in {delay:.1f}s")
+                self._wait(delay, deadline)
+                continue
+
+            if response.status_code == 429 and attempt < self.max_retries:
+                delay = self._retry_after(response)
+                logger.warning(f"Telegram rate limit hit, retrying in {delay:.1f}s")
+                # Hold back every other sender to this chat for the same period
+                chat_bucket.pause(delay)
+                continue
+
+            if response.status_code >= 500 and attempt < self.max_retries:
+                delay = self.backoff_seconds * (2 ** attempt)
+                logger.warning(f"Telegram server error {response.status_code}, retrying in {delay:.1f}s")
+                self._wait(delay, deadline)
+                continue
+
+            response.raise_for_status()
+            return response.json()
+
+    def close(self):
+        """Close the pooled HTTP session"""
+        self.session.close()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_telegram_client(bot_token):
+    """Return the shared client for a bot token so all senders share its rate limits"""
+    with _clients_lock:
+        client = _clients.get(bot_token)
+        if client is None:
+            client = TelegramClient(
+                bot_token,
+                timeout=settings.TELEGRAM_TIMEOUT_SECONDS,
+                max_retries=settings.TELEGRAM_MAX_RETRIES
+            )
+            _clients[bot_token] = client
+        return client
+
+def reset_telegram_clients():
+    """Close the shared clients so the next use rebuilds them from the current settings"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from services.backfill import Backfill, BackfillCheckpoint, backfill_job_id
+from services.notification_service import NotificationResults
+
+QUERY = 'newer_than:7d'
+
+# Two listing pages: token None lists the first, 'page-2' the second
+PAGES = {
+    None: (['m1', 'm2', 'm3'], 'page-2'),
+    'page-2': (['m4', 'm5'], None)
+}
+IMPORTANT = {'m1', 'm2', 'm4'}
+
+class FakeGmail:
+    """Serves the listing pages and message details, failing the IDs in fail_fetch"""
+
+    def __init__(self, fail_fetch=()):
+        self.fail_fetch = set(fail_fetch)
+        self.fetched = []
+
+    def search_messages(self, service, query, page_token=None, max_results=100):
+        message_ids, next_page_token = PAGES[page_token]
+        return {
+            'messages': [{'id': message_id} for message_id in message_ids],
+            'nextPageToken': next_page_token,
+            'resultSizeEstimate': 5
+        }
+
+    def get_message_details(self, service, message_id, projection='full'):
+        self.fetched.append(message_id)
+        if message_id in self.fail_fetch:
+            return None
+        return {'id': message_id, 'internalDate': '0'}
+
+class FakeNotifications:
+    """Records alerts in a ledger; fail holds IDs whose delivery fails, digest buffers alerts until flushed"""
+
+    def __init__(self, fail=(), digest=False, notified=()):
+        self.fail = set(fail)
+        self.digest = digest
+        self.ledger = set(notified)
+        self.sent = []
+        self.buffered = []
+        self.fail_digest = False
+
+    def already_notified(self, message_id):
+        return message_id in self.ledger
+
+    def send_notification(self, subject, body, sender, received_time, message_id=None, on_result=None):
+        results = NotificationResults()
+        if message_id in self.fail:
+            results['telegram'] = {'success': False, 'error': 'delivery failed'}
+        elif self.digest:
+            self.buffered.append((message_id, on_result))
+            results['telegram'] = {'success': True, 'deferred': True}
+        else:
+            self.sent.append(message_id)
+            self.ledger.add(message_id)
+            results['telegram'] = {'success': True, 'deferred': False}
+        return results
+
+    def flush_digests(self):
+        buffered, self.buffered = self.buffered, []
+        for message_id, on_result in buffered:
+            if not self.fail_digest:
+                self.sent.append(message_id)
+                self.ledger.add(message_id)
+            on_result('telegram', not self.fail_digest, 'digest failed' if self.fail_digest else None)
+
+def extract_email_data(details):
+    return {'subject': f"Subject {details['id']}", 'body': 'Body', 'sender': 'hr@example.com'}
+
+def is_important_email(email_data):
+    return email_data['subject'].split()[-1] in IMPORTANT
+
+class BackfillResumeTest(unittest.TestCase):
+    """A backfill interrupted by failures finishes only the rest when run again"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = BackfillCheckpoint(os.path.join(self.directory, 'backfill.db'))
+        patches = [
+            mock.patch('services.backfill.extract_email_data', extract_email_data),
+            mock.patch('services.backfill.is_important_email', is_important_email),
+            mock.patch('services.backfill.settings.NEAR_DUPLICATE_ENABLED', False),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.checkpoint.close()
+        shutil.rmtree(self.directory)
+
+    def run_backfill(self, gmail, notifications, notify=True, max_results=100):
+        backfill = Backfill(None, notifications, lambda credentials: object(), checkpoint=self.checkpoint,
+                            notify=notify, shards=1)
+        with mock.patch('services.backfill.search_messages', gmail.search_messages), \
+                mock.patch('services.backfill.get_message_details', gmail.get_message_details):
+            return backfill.run(QUERY, max_results)
+
+    def job(self, notify=True, max_results=100):
+        return self.checkpoint.load(backfill_job_id(QUERY, max_results, notify), QUERY, max_results)
+
+    def test_resume_after_fetch_failure(self):
+        notifications = FakeNotifications()
+        result = self.run_backfill(FakeGmail(fail_fetch={'m2'}), notifications)
+        self.assertEqual(result['completed'], 4)
+        job = self.job()
+        self.assertIsNone(job['finished_at'])
+        # The first page still has m2 unfinished, so listing resumes from it
+        self.assertIsNone(job['page_token'])
+        self.assertEqual(job['listed_before'], 0)
+
+        gmail = FakeGmail()
+        result = self.run_backfill(gmail, notifications)
+        self.assertEqual(gmail.fetched, ['m2'])
+        self.assertEqual(result['completed'], 5)
+        self.assertEqual(result['important'], 3)
+        self.assertIsNotNone(self.job()['finished_at'])
+        self.assertEqual(sorted(notifications.sent), ['m1', 'm2', 'm4'])
+
+    def test_resume_after_notification_failure(self):
+        notifications = FakeNotifications(fail={'m4'})
+        self.run_backfill(FakeGmail(), notifications)
+        job = self.job()
+        self.assertIsNone(job['finished_at'])
+        self.assertEqual(job['page_token'], 'page-2')
+        self.assertEqual(job['listed_before'], 3)
+
+        notifications.fail.clear()
+        gmail = FakeGmail()
+        result = self.run_backfill(gmail, notifications)
+        self.assertEqual(gmail.fetched, ['m4'])
+        self.assertEqual(result['important'], 3)
+        self.assertEqual(sorted(notifications.sent), ['m1', 'm2', 'm4'])
+        self.assertIsNotNone(self.job()['finished_at'])
+
+    def test_finished_job_is_not_run_again(self):
+        notifications = FakeNotifications()
+        self.run_backfill(FakeGmail(), notifications)
+        gmail = FakeGmail()
+        self.run_backfill(gmail, notifications)
+        self.assertEqual(gmail.fetched, [])
+        self.assertEqual(len(notifications.sent), 3)
+
+    def test_digested_emails_finish_once_the_digest_is_sent(self):
+        notifications = FakeNotifications(digest=True)
+        result = self.run_backfill(FakeGmail(), notifications)
+        self.assertEqual(result['important'], 3)
+        self.assertIsNotNone(self.job()['finished_at'])
+
+    def test_failed_digest_leaves_emails_for_resume(self):
+        notifications = FakeNotifications(digest=True)
+        notifications.fail_digest = True
+        result = self.run_backfill(FakeGmail(), notifications)
+        self.assertEqual(result['completed'], 2)
+        self.assertIsNone(self.job()['finished_at'])
+
+        notifications.fail_digest = False
+        gmail = FakeGmail()
+        result = self.run_backfill(gmail, notifications)
+        self.assertEqual(sorted(gmail.fetched), ['m1', 'm2', 'm4'])
+        self.assertEqual(result['important'], 3)
+        self.assertIsNotNone(self.job()['finished_at'])
+
+    def test_report_only_counts_already_notified_emails(self):
+        notifications = FakeNotifications(notified={'m1', 'm2', 'm4'})
+        gmail = FakeGmail()
+        result = self.run_backfill(gmail, notifications, notify=False)
+        self.assertEqual(len(gmail.fetched), 5)
+        self.assertEqual(result['important'], 3)
+        self.assertEqual(notifications.sent, [])
+        # A later notifying run keeps its own progress
+        self.assertEqual(self.job()['completed'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from services.notification_service import DELIVERY_DEFERRED
+from services.notification_outbox import (
+    NotificationOutbox,
+    OutboxWorker,
+    STATUS_PENDING,
+    STATUS_DELIVERING,
+    STATUS_DEFERRED,
+    STATUS_DELIVERED,
+    STATUS_DEAD
+)
+
+PAYLOAD = {'subject': 'Interview', 'body': 'Body', 'sender': 'hr@example.com', 'received_time': '0'}
+
+class OutboxStateTest(unittest.TestCase):
+    """Entries move pending -> delivering -> delivered, deferred, back to pending, or dead"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.directory, 'outbox.db')
+        self.outbox = self.open_outbox()
+
+    def tearDown(self):
+        self.outbox.close()
+        shutil.rmtree(self.directory)
+
+    def open_outbox(self):
+        # A millisecond backoff keeps failed entries due again almost at once
+        return NotificationOutbox(self.db_file, max_attempts=3, backoff_seconds=0.001, retention_days=30)
+
+    def status(self, message_id, channel='telegram'):
+        with self.outbox.lock:
+            return self.outbox.conn.execute(
+                "SELECT status, attempts FROM outbox WHERE message_id = ? AND channel = ?", (message_id, channel)
+            ).fetchone()
+
+    def claim(self, channel='telegram'):
+        time.sleep(0.01)
+        return self.outbox.claim(channel)
+
+    def test_enqueue_ignores_duplicates(self):
+        self.assertEqual(self.outbox.enqueue('m1', ['telegram', 'whatsapp'], PAYLOAD), 2)
+        self.assertEqual(self.outbox.enqueue('m1', ['telegram'], PAYLOAD), 0)
+        self.assertEqual(self.status('m1'), (STATUS_PENDING, 0))
+
+    def test_claim_then_deliver(self):
+        self.outbox.enqueue('m1', ['telegram'], PAYLOAD)
+        entry = self.claim()
+        self.assertEqual(entry['payload'], PAYLOAD)
+        self.assertEqual(self.status('m1'), (STATUS_DELIVERING, 0))
+        self.assertIsNone(self.outbox.claim('telegram'))
+
+        self.outbox.mark_delivered(entry['id'])
+        self.assertEqual(self.status('m1'), (STATUS_DELIVERED, 1))
+
+    def test_failures_retry_then_dead_letter(self):
+        self.outbox.enqueue('m1', ['telegram'], PAYLOAD)
+        self.assertFalse(self.outbox.mark_failed(self.claim()['id'], 'timeout'))
+        self.assertEqual(self.status('m1'), (STATUS_PENDING, 1))
+        self.assertFalse(self.outbox.mark_failed(self.claim()['id'], 'timeout'))
+        self.assertTrue(self.outbox.mark_failed(self.claim()['id'], 'timeout'))
+        self.assertEqual(self.status('m1'), (STATUS_DEAD, 3))
+        self.assertIsNone(self.claim())
+
+    def test_backoff_delays_retry(self):
+        self.outbox.close()
+        self.outbox = NotificationOutbox(self.db_file, max_attempts=3, backoff_seconds=60, retention_days=30)
+        self.outbox.enqueue('m1', ['telegram'], PAYLOAD)
+        self.outbox.mark_failed(self.outbox.claim('telegram')['id'], 'timeout')
+        self.assertIsNone(self.outbox.claim('telegram'))
+
+    def test_claim_batch_takes_oldest_first(self):
+        for message_id in ('m1', 'm2', 'm3'):
+            self.outbox.enqueue(message_id, ['whatsapp'], PAYLOAD)
+        entries = self.outbox.claim_batch('whatsapp', 2)
+        self.assertEqual([entry['message_id'] for entry in entries], ['m1', 'm2'])
+        self.assertEqual(self.status('m3', 'whatsapp'), (STATUS_PENDING, 0))
+
+    def test_deferred_waits_for_digest(self):
+        self.outbox.enqueue('m1', ['telegram'], PAYLOAD)
+        self.outbox.enqueue('m2', ['telegram'], PAYLOAD)
+        callbacks = []
+
+        def deliver(entries, settle):
+            callbacks.extend(settle)
+            return [(DELIVERY_DEFERRED, None)] * len(entries)
+
+        worker = OutboxWorker(self.outbox, 'telegram', deliver, batch_size=2)
+        self.assertTrue(worker.process_due())
+        self.assertEqual(self.status('m1'), (STATUS_DEFERRED, 0))
+        self.assertIsNone(self.outbox.claim('telegram'))
+
+        callbacks[0](True)
+        callbacks[1](False, 'digest failed')
+        self.assertEqual(self.status('m1'), (STATUS_DELIVERED, 1))
+        self.assertEqual(self.status('m2'), (STATUS_PENDING, 1))
+
+    def test_digest_settled_before_deferral_stays_delivered(self):
+        self.outbox.enqueue('m1', ['telegram'], PAYLOAD)
+
+        def deliver(entries, settle):
+            # A full digest buffer flushes while the alert is still being added
+            settle[0](True)
+            return [(DELIVERY_DEFERRED, None)]
+
+        OutboxWorker(self.outbox, 'telegram', deliver).process_due()
+        self.assertEqual(self.status('m1'), (STATUS_DELIVERED, 1))
+
+    def test_worker_records_per_entry_results(self):
+        for message_id in ('m1', 'm2'):
+            self.outbox.enqueue(message_id, ['whatsapp'], PAYLOAD)
+        worker = OutboxWorker(self.outbox, 'whatsapp', lambda entries, settle: [(True, None), (False, 'blocked')],
+                              batch_size=2)
+        worker.process_due()
+        self.assertEqual(self.status('m1', 'whatsapp'), (STATUS_DELIVERED, 1))
+        self.assertEqual(self.status('m2', 'whatsapp'), (STATUS_PENDING, 1))
+
+    def test_worker_failure_exception_retries_whole_batch(self):
+        self.outbox.enqueue('m1', ['telegram'], PAYLOAD)
+
+        def deliver(entries, settle):
+            raise RuntimeError("browser crashed")
+
+        OutboxWorker(self.outbox, 'telegram', deliver).process_due()
+        self.assertEqual(self.status('m1'), (STATUS_PENDING, 1))
+
+    def test_restart_recovers_unfinished_entries(self):
+        self.outbox.enqueue('m1', ['telegram'], PAYLOAD)
+        self.outbox.enqueue('m2', ['telegram'], PAYLOAD)
+        self.outbox.claim('telegram')
+        self.outbox.mark_deferred(self.outbox.claim('telegram')['id'])
+
+        self.outbox.close()
+        self.outbox = self.open_outbox()
+        self.assertEqual(self.status('m1'), (STATUS_PENDING, 0))
+        self.assertEqual(self.status('m2'), (STATUS_PENDING, 0))
+
+    def test_disabled_channels_are_dead_lettered(self):
+        self.outbox.enqueue('m1', ['telegram', 'whatsapp'], PAYLOAD)
+        self.assertEqual(self.outbox.dead_letter_disabled_channels(['telegram']), 1)
+        self.assertEqual(self.status('m1', 'whatsapp')[0], STATUS_DEAD)
+        self.assertEqual(self.status('m1', 'telegram')[0], STATUS_PENDING)
+
+    def test_prune_removes_only_old_finished_entries(self):
+        self.outbox.enqueue('m1', ['telegram'], PAYLOAD)
+        self.outbox.enqueue('m2', ['telegram'], PAYLOAD)
+        self.outbox.mark_delivered(self.outbox.claim('telegram')['id'])
+        with self.outbox.lock, self.outbox.conn:
+            self.outbox.conn.execute("UPDATE outbox SET updated_at = 0")
+        self.outbox.prune()
+        self.assertIsNone(self.status('m1'))
+        self.assertEqual(self.status('m2'), (STATUS_PENDING, 0))
+
+if __name__ == '__main__':
+    unittest.main()
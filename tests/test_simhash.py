@@ -0,0 +1,32 @@
+import unittest
+from utils.simhash import SimHashIndex, simhash
+
+DAY = 86400
+
+class SimHashIndexTest(unittest.TestCase):
+    """Near-duplicates are found within the window, and the window bounds the index either way"""
+
+    def test_finds_near_duplicate_within_window(self):
+        index = SimHashIndex(max_distance=3, window_seconds=DAY)
+        fingerprint = simhash("Your application for Senior Engineer at Acme has been received")
+        index.add(fingerprint, 'm1', 1000)
+        self.assertEqual(index.fold(fingerprint ^ 0b101, 2000).key, 'm1')
+        self.assertIsNone(index.find(fingerprint, 1000 + 2 * DAY))
+
+    def test_evicts_when_mail_is_walked_oldest_first(self):
+        index = SimHashIndex(max_distance=3, window_seconds=DAY)
+        for step in range(100):
+            index.add(step * 7919, f"m{step}", step * DAY / 4)
+        self.assertLessEqual(len(index), 5)
+
+    def test_evicts_when_mail_is_walked_newest_first(self):
+        index = SimHashIndex(max_distance=3, window_seconds=DAY)
+        for step in range(100, 0, -1):
+            index.add(step * 7919, f"m{step}", step * DAY / 4)
+        self.assertLessEqual(len(index), 5)
+        # Evicted entries are gone from the bands too
+        for band in index.bands:
+            self.assertEqual(sum(len(bucket) for bucket in band.values()), len(index))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,13 @@
 import re
 import config.settings as settings
 import logging
-import requests
+from services.llama_service import get_llama_cascade
+from utils.prompt_builder import build_email_excerpt
 
 logger = logging.getLogger(__name__)
 
 def classify_importance_with_llama(text):
-    """Use Llama 3.2 to determine if an email is important"""
+    """Use the Llama model cascade to determine if an email is important"""
     try:
         prompt = f"""
         Analyze this email and determine if it's important. Important emails typically:
@@ -15,29 +16,22 @@ def classify_importance_with_llama(text):
         - Require immediate action or response
         - Contain critical information
         
-        Return only "IMPORTANT" or "NOT_IMPORTANT".
+        Return only "IMPORTANT" or "NOT_IMPORTANT", followed by your confidence from 0 to 100.
+        For example: "IMPORTANT 85"
         
         Email text:
         {text}
         """
         
-        payload = {
-            "model": "llama3.2",
-            "prompt": prompt,
-            "stream": False
-        }
+        decision, confidence, model = get_llama_cascade().classify(prompt)
         
-        response = requests.post("http://localhost:11434/api/generate", json=payload)
-        
-        if response.status_code == 200:
-            result = response.json()
-            if "IMPORTANT" in result["response"].upper():
-                return True
-            else:
-                return False
-        else:
-            logger.error(f"Error calling Llama API: {response.status_code}")
+        if decision is None:
+            logger.error("No Llama model returned a usable classification")
             return False
+        
+        logger.debug(f"Model {model} classified email as {'important' if decision else 'not important'} "
+                     f"with confidence {confidence:.2f}")
+        return decision
     except Exception as e:
         logger.error(f"Exception in classify_importance_with_llama: {str(e)}")
         return False
@@ -160,8 +154,13 @@ def is_important_email(email_data):
             logger.info(f"Found important keyword: '{keyword}' in email from {sender}")
             return True
     
-    # Then use Llama 3.2 for more sophisticated analysis
-    combined_text = f"Subject: {subject}\n\nFrom: {sender}\n\n{body[:1000]}"  # Limit text length
+    # Then use Llama 3.2 for more sophisticated analysis on a token-budgeted excerpt
+    combined_text = build_email_excerpt(
+        email_data.get('subject', ''),
+        email_data.get('sender', ''),
+        email_data.get('body', ''),
+        token_budget=settings.LLAMA_CLASSIFY_TOKEN_BUDGET
+    )
     is_important = classify_importance_with_llama(combined_text)
     
     if is_important:
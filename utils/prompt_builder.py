@@ -0,0 +1,125 @@
+import re
+import math
+
+URL_PATTERN = re.compile(r'https?://[^\s<>"\')\]]+', re.IGNORECASE)
+HTML_TAG_PATTERN = re.compile(r'<[^>]+>')
+HORIZONTAL_SPACE_PATTERN = re.compile(r'[ \t\u00a0\u200b]+')
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+
+# Lines that mark the start of a boilerplate footer; everything after them is dropped
+FOOTER_MARKERS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in [
+        r'^--\s*$',                                   # Standard signature delimiter
+        r'\bunsubscribe\b',
+        r'you (are )?receiv(ed|ing) this (email|message)',
+        r'this (email|message) was sent to',
+        r'(manage|update) (your )?(email )?(preferences|notification settings)',
+        r'^\s*(©|\(c\)|copyright)\s*\d{4}',
+        r'\bprivacy policy\b',
+        r'^sent from my (iphone|android|mobile)',
+    ]
+]
+
+# Footers are only recognised after this many lines so a short mail is never emptied
+MIN_LINES_BEFORE_FOOTER = 3
+
+def estimate_tokens(text):
+    """Cheaply estimate the number of model tokens in text"""
+    if not text:
+        return 0
+    # Words and punctuation marks, with headroom for sub-word splits
+    return math.ceil(len(TOKEN_PATTERN.findall(text)) * 1.3)
+
+def collapse_url(match):
+    """Replace a URL with its host so links keep their meaning without tracking noise"""
+    url = match.group(0)
+    host = url.split('://', 1)[-1].split('/', 1)[0].split('?', 1)[0]
+    if host.lower().startswith('www.'):
+        host = host[4:]
+    return f"[link: {host}]"
+
+def normalize_content(text):
+    """
+    Normalize email content for prompting
+
+    Strips HTML tags, collapses URLs to their host, drops boilerplate footers and
+    removes redundant whitespace and repeated lines.
+    """
+    if not text:
+        return ""
+
+    text = HTML_TAG_PATTERN.sub(' ', text)
+    text = URL_PATTERN.sub(collapse_url, text)
+
+    lines = []
+    for raw_line in text.splitlines():
+        line = HORIZONTAL_SPACE_PATTERN.sub(' ', raw_line).strip()
+
+        if len(lines) >= MIN_LINES_BEFORE_FOOTER and any(marker.search(line) for marker in FOOTER_MARKERS):
+            break
+
+        # Collapse runs of blank lines and repeated lines
+        if not line and (not lines or not lines[-1]):
+            continue
+        if line and lines and line == lines[-1]:
+            continue
+        lines.append(line)
+
+    return "\n".join(lines).strip()
+
+def fit_to_budget(text, token_budget):
+    """Return the longest prefix of text that fits the token budget, cut on a word boundary"""
+    if token_budget <= 0 or not text:
+        return ""
+    if estimate_tokens(text) <= token_budget:
+        return text
+
+    kept = []
+    used = 0
+    for line in text.split("\n"):
+        line_tokens = estimate_tokens(line)
+        if used + line_tokens <= token_budget:
+            kept.append(line)
+            used += line_tokens
+            continue
+
+        # Take as many whole words of the last line as still fit
+        words = []
+        for word in line.split(' '):
+            word_tokens = estimate_tokens(word)
+            if used + word_tokens > token_budget:
+                break
+            words.append(word)
+            used += word_tokens
+        if words:
+            kept.append(' '.join(words) + ' ...')
+        break
+
+    return "\n".join(kept).strip()
+
+def build_email_excerpt(subject=None, sender=None, body=None, token_budget=300):
+    """
+    Build a dense, token-budgeted excerpt of an email for an LLM prompt
+
+    Args:
+        subject: Email subject, always placed first
+        sender: Email sender, placed after the subject
+        body: Email body, normalized and filled in from the top until the budget runs out
+        token_budget: Estimated token budget for the whole excerpt
+
+    Returns:
+        str: The excerpt text
+    """
+    header_lines = []
+    if subject:
+        header_lines.append(f"Subject: {normalize_content(subject)}")
+    if sender:
+        header_lines.append(f"From: {sender.strip()}")
+    header = "\n".join(header_lines)
+
+    remaining = token_budget - estimate_tokens(header)
+    body_text = fit_to_budget(normalize_content(body), remaining)
+
+    if header and body_text:
+        return f"{header}\n\n{body_text}"
+    return header or body_text
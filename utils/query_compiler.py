@@ -0,0 +1,61 @@
+import re
+import config.settings as settings
+
+# Characters with a meaning in Gmail search syntax; stripped from configured terms
+SPECIAL_CHARACTERS = re.compile(r'[(){}"]')
+
+def quote_term(term):
+    """Turn a configured word or phrase into a Gmail search term, or '' if nothing is left"""
+    term = ' '.join(SPECIAL_CHARACTERS.sub(' ', term or '').split())
+    if not term:
+        return ''
+    # Phrases and terms Gmail would read as operators (OR, AND, a:b, -x) are quoted
+    if ' ' in term or ':' in term or term.startswith('-') or term.upper() in ('OR', 'AND'):
+        return f'"{term}"'
+    return term
+
+def any_of(terms, operator=None):
+    """OR a list of terms together, scoped to an operator such as from: or subject:"""
+    terms = list(dict.fromkeys(term for term in (quote_term(term) for term in terms) if term))
+    if not terms:
+        return ''
+    group = terms[0] if len(terms) == 1 else f"({' OR '.join(terms)})"
+    return f"{operator}:{group}" if operator else group
+
+def compile_prefilter(keywords=(), senders=(), subjects=(), exclude_categories=()):
+    """
+    Compile importance rules into a Gmail search expression
+
+    Mail from a listed sender always matches. Otherwise the subject must
+    contain a listed subject term, or the message a listed keyword anywhere,
+    and it must not be in one of the excluded inbox categories.
+
+    Args:
+        keywords: Words or phrases matched against subject and body
+        senders: Addresses or domains matched against From
+        subjects: Words or phrases matched against the subject only
+        exclude_categories: Inbox categories to leave out, e.g. promotions
+
+    Returns:
+        str: A single search term to AND onto a query, or '' if there are no rules
+    """
+    content = [part for part in (any_of(subjects, 'subject'), any_of(keywords)) if part]
+    content_filter = content[0] if len(content) == 1 else f"({' OR '.join(content)})" if content else ''
+    exclusions = ' '.join(f"-category:{category}" for category in map(quote_term, exclude_categories) if category)
+    if content_filter and exclusions:
+        content_filter = f"({content_filter} {exclusions})"
+
+    branches = [part for part in (any_of(senders, 'from'), content_filter) if part]
+    if len(branches) > 1:
+        return f"({' OR '.join(branches)})"
+    return branches[0] if branches else ''
+
+def prefilter_from_settings():
+    """Compile the configured importance keywords, senders and subject terms"""
+    senders = settings.SENDER_ALLOWLIST + settings.IMPORTANT_EMAIL_SENDERS + settings.DIGEST_PRIORITY_SENDERS
+    return compile_prefilter(
+        keywords=settings.IMPORTANCE_KEYWORDS,
+        senders=senders,
+        subjects=settings.IMPORTANT_EMAIL_KEYWORDS,
+        exclude_categories=settings.QUERY_PREFILTER_EXCLUDE_CATEGORIES
+    )
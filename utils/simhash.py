@@ -0,0 +1,147 @@
+import re
+import time
+import hashlib
+import threading
+from collections import deque
+from utils.prompt_builder import normalize_content
+
+FINGERPRINT_BITS = 64
+SHINGLE_SIZE = 3
+
+WORD_PATTERN = re.compile(r'\w+')
+DIGITS_PATTERN = re.compile(r'\d+')
+
+def _hash_token(token):
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def simhash(text, bits=FINGERPRINT_BITS):
+    """
+    Compute a SimHash fingerprint of text
+
+    Similar texts get fingerprints that differ in only a few bits, so near-duplicates
+    can be found by Hamming distance.
+    """
+    # Numbers are mostly IDs and dates, which differ between copies of the same mail
+    words = WORD_PATTERN.findall(DIGITS_PATTERN.sub('0', text.lower()))
+    if not words:
+        return 0
+
+    if len(words) < SHINGLE_SIZE:
+        shingles = [' '.join(words)]
+    else:
+        shingles = [' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+
+    weights = [0] * bits
+    for shingle in shingles:
+        value = _hash_token(shingle)
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def hamming_distance(a, b):
+    """Count the bits that differ between two fingerprints"""
+    return bin(a ^ b).count('1')
+
+def email_fingerprint(email_data):
+    """Fingerprint an email from its normalized subject and body"""
+    subject = normalize_content(email_data.get('subject', ''))
+    body = normalize_content(email_data.get('body', ''))
+    return simhash(f"{subject}\n{body}")
+
+class FingerprintEntry:
+    """A fingerprinted email and the near-duplicates folded into it"""
+
+    def __init__(self, key, fingerprint, seen_at):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.seen_at = seen_at
+        self.duplicates = 0
+
+class SimHashIndex:
+    """
+    Rolling index of recent fingerprints with fast Hamming-distance lookup
+
+    Fingerprints are split into max_distance + 1 bands. Two fingerprints within
+    max_distance bits of each other must agree on at least one whole band, so only
+    entries sharing a band value are compared. Entries more than window_seconds
+    away from the mail being checked, in either direction, are evicted.
+    """
+
+    def __init__(self, max_distance=3, window_seconds=86400, bits=FINGERPRINT_BITS):
+        self.max_distance = max_distance
+        self.window_seconds = window_seconds
+        self.band_count = max_distance + 1
+        self.band_bits = -(-bits // self.band_count)
+        self.band_mask = (1 << self.band_bits) - 1
+        self.bands = [{} for _ in range(self.band_count)]
+        self.entries = deque()
+        self.lock = threading.Lock()
+
+    def _band_values(self, fingerprint):
+        return [(fingerprint >> (i * self.band_bits)) & self.band_mask for i in range(self.band_count)]
+
+    def _evict(self, now):
+        # Must be called with the lock held. Entries are kept in the order they were added,
+        # which follows mail time forwards when polling and backwards during a backfill, so
+        # either way the oldest addition is the one furthest from now
+        while self.entries and abs(now - self.entries[0].seen_at) > self.window_seconds:
+            entry = self.entries.popleft()
+            for band, value in zip(self.bands, self._band_values(entry.fingerprint)):
+                bucket = band.get(value)
+                if bucket:
+                    bucket.remove(entry)
+                    if not bucket:
+                        del band[value]
+
+    def find(self, fingerprint, now=None):
+        """
+        Find the closest recent entry within max_distance bits
+
+        Returns:
+            FingerprintEntry: The matching entry, or None
+        """
+        now = now if now is not None else time.time()
+        with self.lock:
+            self._evict(now)
+            best, best_distance = None, self.max_distance + 1
+            for band, value in zip(self.bands, self._band_values(fingerprint)):
+                for entry in band.get(value, ()):
+                    # Backfills walk mail newest first, so the window applies in both directions
+                    if abs(now - entry.seen_at) > self.window_seconds:
+                        continue
+                    distance = hamming_distance(fingerprint, entry.fingerprint)
+                    if distance < best_distance:
+                        best, best_distance = entry, distance
+            return best
+
+    def add(self, fingerprint, key, now=None):
+        """Add a fingerprint to the index"""
+        now = now if now is not None else time.time()
+        entry = FingerprintEntry(key, fingerprint, now)
+        with self.lock:
+            self._evict(now)
+            self.entries.append(entry)
+            for band, value in zip(self.bands, self._band_values(fingerprint)):
+                band.setdefault(value, []).append(entry)
+        return entry
+
+    def fold(self, fingerprint, now=None):
+        """
+        Fold a near-duplicate into the recent entry it matches
+
+        Returns:
+            FingerprintEntry: The entry it was folded into, or None if it is not a near-duplicate
+        """
+        entry = self.find(fingerprint, now)
+        if entry:
+            with self.lock:
+                entry.duplicates += 1
+        return entry
+
+    def __len__(self):
+        return len(self.entries)
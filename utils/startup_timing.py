@@ -0,0 +1,89 @@
+import sys
+import time
+import builtins
+import threading
+from contextlib import contextmanager
+
+class StartupTimer:
+    """
+    Measures where an entry point spends its startup time
+
+    While recording, every module imported for the first time is timed, both
+    inclusive of and excluding the modules it imports in turn. Initialization
+    steps are timed with the stage() context manager.
+    """
+
+    def __init__(self):
+        self.started_at = None
+        self.imports = {}
+        self.stages = []
+        self._stack = []
+        self._original_import = None
+        self._thread = None
+
+    def start(self):
+        """Start timing imports made from the current thread"""
+        if self._original_import is not None:
+            return
+        self.started_at = time.perf_counter()
+        self._thread = threading.get_ident()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def stop_imports(self):
+        """Stop timing imports and record the total as the 'imports' stage"""
+        if self._original_import is None:
+            return
+        builtins.__import__ = self._original_import
+        self._original_import = None
+        self.stages.append(('imports', time.perf_counter() - self.started_at))
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import
+        # Only first, absolute imports on the startup thread are worth timing
+        if level or name in sys.modules or threading.get_ident() != self._thread:
+            return original(name, globals, locals, fromlist, level)
+
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._stack.pop()
+            self.imports[name] = (elapsed, elapsed - nested)
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    @contextmanager
+    def stage(self, name):
+        """Time an initialization step"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def log_report(self, log, top=15, details=True):
+        """
+        Log total startup time, each stage, and the slowest imports
+
+        Args:
+            log: Logger to write to
+            top: Number of imports to list, slowest first by their own time
+            details: If False, only the one-line summary is logged
+        """
+        if self.started_at is None:
+            return
+        total = time.perf_counter() - self.started_at
+        summary = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.stages)
+        log.info(f"Startup took {total:.2f}s ({summary})")
+        if not details:
+            return
+
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        for name, (inclusive, own) in slowest:
+            log.info(f"  import {name}: {own * 1000:.1f}ms own, {inclusive * 1000:.1f}ms including dependencies")
+
+# Shared by the entry points; each starts it before its own imports
+startup_timer = StartupTimer()
@@ -1,15 +1,12 @@
-import time
 import urllib.parse
-import os
-import json
 import datetime
 import logging
-import pywhatkit as pwk
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import config.settings as settings
+from utils.whatsapp_session import SessionStateManager
+
+# Selenium and pywhatkit are imported inside the functions that drive a browser.
+# pywhatkit in particular is slow to import and needs a display, so importing this
+# module stays cheap when WhatsApp is disabled or only the session file is checked.
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -19,20 +16,60 @@ SESSION_INFO_FILE = "whatsapp_session_info.json"
 SESSION_EXPIRY_DAYS = 14  # WhatsApp sessions typically last around 14 days
 CHROME_PROFILE_DIR = "./chrome_profile"
 
+# Shared cache of the session info file for every caller in this process
+_session_state = SessionStateManager(SESSION_INFO_FILE, stat_interval=settings.WHATSAPP_SESSION_STAT_INTERVAL_SECONDS)
+
+# WhatsApp Web element locators, using Selenium's By strategy names ("xpath" is By.XPATH)
+MESSAGE_BOX = ("xpath", "//div[@contenteditable='true'][@data-tab='10']")
+SEND_BUTTON = ("xpath", "//button[@aria-label='Send']")
+
+# Insert text through the editor instead of send_keys, which cannot type emoji
+INSERT_TEXT_SCRIPT = "arguments[0].focus(); document.execCommand('insertText', false, arguments[1]);"
+
+# Delivery tick icons on outgoing message bubbles, mapped to the status they confirm
+MESSAGE_STATUS_ICONS = {
+    "msg-check": "sent",
+    "msg-dblcheck": "delivered",
+    "msg-dblcheck-ack": "read"
+}
+
+# Marks every outgoing bubble already on screen so the next new one can be told apart
+MARK_OUTGOING_SCRIPT = """
+document.querySelectorAll('div.message-out').forEach(el => el.setAttribute('data-gm-seen', '1'));
+"""
+
+# Resolves with the tick icon of the first new outgoing bubble as soon as one appears
+WAIT_FOR_TICK_SCRIPT = """
+const icons = arguments[0];
+const timeoutMs = arguments[1];
+const done = arguments[arguments.length - 1];
+function currentIcon() {
+    const bubble = document.querySelector('div.message-out:not([data-gm-seen])');
+    const icon = bubble && bubble.querySelector('span[data-icon]');
+    const name = icon && icon.getAttribute('data-icon');
+    return icons.includes(name) ? name : null;
+}
+const initial = currentIcon();
+if (initial) { done(initial); return; }
+const observer = new MutationObserver(() => {
+    const name = currentIcon();
+    if (name) { observer.disconnect(); clearTimeout(timer); done(name); }
+});
+const timer = setTimeout(() => { observer.disconnect(); done(null); }, timeoutMs);
+observer.observe(document.body, {childList: true, subtree: true, attributes: true, attributeFilter: ['data-icon']});
+"""
+
 def get_session_info():
-    """Get WhatsApp session information from the JSON file"""
-    if os.path.exists(SESSION_INFO_FILE):
-        try:
-            with open(SESSION_INFO_FILE, 'r') as file:
-                return json.load(file)
-        except:
-            return {"last_auth_date": None}
-    return {"last_auth_date": None}
+    """Get WhatsApp session information, cached in memory until the file changes"""
+    return _session_state.get()
 
 def save_session_info(session_info):
-    """Save WhatsApp session information to the JSON file"""
-    with open(SESSION_INFO_FILE, 'w') as file:
-        json.dump(session_info, file)
+    """Atomically save WhatsApp session information to the JSON file"""
+    _session_state.save(session_info)
+
+def delete_session_info():
+    """Delete the WhatsApp session information file, returning True if it existed"""
+    return _session_state.delete()
 
 def is_session_valid():
     """Check if the WhatsApp session is still valid"""
@@ -68,6 +105,13 @@ def initialize_whatsapp_session(force=False):
     
     logger.info("Initializing WhatsApp Web session...")
     
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    
     # Setup Chrome options - NOT headless for initial setup
     chrome_options = Options()
     chrome_options.add_argument("--start-maximized")
@@ -101,8 +145,13 @@ def initialize_whatsapp_session(force=False):
             logger.info("Session initialized successfully.")
             logger.info("You can now close this browser.")
             
-            # Wait a bit before closing
-            time.sleep(3)
+            # Close once the chat list has rendered, which means the session is stored
+            try:
+                WebDriverWait(driver, 10).until(
+                    EC.presence_of_element_located((By.ID, "pane-side"))
+                )
+            except TimeoutException:
+                logger.debug("Chat list did not render before closing the browser")
             return True
             
         except Exception as e:
@@ -124,23 +173,40 @@ def check_and_reinitialize_session():
         return initialize_whatsapp_session()
     return True
 
-def send_whatsapp_message_headless(phone_number, message):
+def mark_outgoing_messages(driver):
+    """Mark the outgoing messages currently shown so confirmation only watches new ones"""
+    driver.execute_script(MARK_OUTGOING_SCRIPT)
+
+def wait_for_message_confirmation(driver, timeout=None):
     """
-    Send WhatsApp message using a headless browser with saved session
+    Wait for the newest outgoing message to show a sent or delivered tick
+    
+    Call mark_outgoing_messages before sending. A MutationObserver in the page
+    reports the tick the moment it appears, so fast sends return immediately.
     
     Args:
-        phone_number: Phone number with country code but without + or spaces
-        message: Message to send
+        driver: WebDriver showing the chat the message was sent in
+        timeout: Seconds to wait, defaults to WHATSAPP_CONFIRM_TIMEOUT_SECONDS
     
     Returns:
-        bool: True if message sent successfully, False otherwise
+        str: "sent", "delivered" or "read", or None if no tick appeared in time
     """
-    # Check and reinitialize session if needed
-    if not check_and_reinitialize_session():
-        logger.error("Failed to initialize or verify session. Message not sent.")
-        return False
+    from selenium.common.exceptions import WebDriverException
+    
+    timeout = timeout or settings.WHATSAPP_CONFIRM_TIMEOUT_SECONDS
+    # Leave the in-page timer room to resolve before Selenium gives up on the script
+    driver.set_script_timeout(timeout + 5)
+    try:
+        icon = driver.execute_async_script(WAIT_FOR_TICK_SCRIPT, list(MESSAGE_STATUS_ICONS), int(timeout * 1000))
+    except WebDriverException as e:
+        logger.error(f"Error waiting for message confirmation: {str(e)}")
+        return None
+    return MESSAGE_STATUS_ICONS.get(icon)
+
+def build_headless_chrome_options():
+    """Build Chrome options for headless WhatsApp Web using the saved profile"""
+    from selenium.webdriver.chrome.options import Options
     
-    # Setup Chrome options
     chrome_options = Options()
     chrome_options.add_argument("--headless=new")  # New headless mode
     chrome_options.add_argument("--no-sandbox")
@@ -150,60 +216,121 @@ def send_whatsapp_message_headless(phone_number, message):
     chrome_options.add_argument("--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36")
     chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
     chrome_options.add_experimental_option("useAutomationExtension", False)
+    return chrome_options
+
+def send_whatsapp_message_headless(phone_number, message):
+    """
+    Send WhatsApp message using a headless browser with saved session
     
-    # Strip the "+" if present
-    if phone_number.startswith("+"):
-        phone_number = phone_number[1:]
+    Args:
+        phone_number: Phone number with country code but without + or spaces
+        message: Message to send
+    
+    Returns:
+        bool: True if message sent successfully, False otherwise
+    """
+    return send_whatsapp_messages([(phone_number, message)])[0]['success']
+
+def send_whatsapp_messages(batch):
+    """
+    Send several WhatsApp messages in a single headless browser session
+    
+    Chrome and WhatsApp Web are started once for the whole batch. Consecutive
+    messages to the same number are typed into the already open chat.
+    
+    Args:
+        batch: List of (phone_number, message) pairs
+    
+    Returns:
+        list: One dict per message with 'phone', 'success', 'status' and 'error',
+              in the same order as the batch
+    """
+    results = [{'phone': phone, 'success': False, 'status': None, 'error': None} for phone, _ in batch]
+    if not batch:
+        return results
+    
+    # Check and reinitialize session if needed
+    if not check_and_reinitialize_session():
+        logger.error("Failed to initialize or verify session. Messages not sent.")
+        for result in results:
+            result['error'] = "WhatsApp session not initialized"
+        return results
+    
+    from selenium import webdriver
+    from selenium.common.exceptions import WebDriverException, TimeoutException
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
     
     # Initialize the driver
-    driver = webdriver.Chrome(options=chrome_options)
+    driver = webdriver.Chrome(options=build_headless_chrome_options())
+    current_chat = None
     
     try:
-        # URL encode the message
-        encoded_message = urllib.parse.quote(message)
-        
-        # Create the WhatsApp URL with the phone number and message
-        url = f"https://web.whatsapp.com/send?phone={phone_number}&text={encoded_message}"
-        
-        # Open the URL
-        driver.get(url)
-        
-        logger.info(f"Sending message to {phone_number}...")
-        
-        # Wait for the message input box to load
-        input_box = WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.XPATH, "//div[@contenteditable='true'][@data-tab='10']"))
-        )
-        
-        # Wait for send button to be clickable
-        send_button = WebDriverWait(driver, 10).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[@aria-label='Send']"))
-        )
-        
-        # Click the send button
-        send_button.click()
-        
-        # Wait a moment for the message to be sent
-        time.sleep(2)
-        
-        logger.info(f"Message sent to {phone_number} successfully!")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error sending message: {str(e)}")
-        # Take screenshot for debugging
-        driver.save_screenshot('error_screenshot.png')
-        # If we get authentication error, let's invalidate the session
-        if "auth" in str(e).lower() or "login" in str(e).lower():
-            logger.warning("Authentication issue detected. Session might be expired.")
-            # Force session reinitialization next time
-            session_info = {"last_auth_date": None}
-            save_session_info(session_info)
-        return False
+        for (phone_number, message), result in zip(batch, results):
+            # Strip the "+" if present
+            if phone_number.startswith("+"):
+                phone_number = phone_number[1:]
+            
+            try:
+                logger.info(f"Sending message to {phone_number}...")
+                
+                input_boxes = driver.find_elements(*MESSAGE_BOX) if current_chat == phone_number else []
+                if input_boxes:
+                    # Same chat as the previous message, no need to reload the app
+                    driver.execute_script(INSERT_TEXT_SCRIPT, input_boxes[0], message)
+                else:
+                    current_chat = None
+                    # Create the WhatsApp URL with the phone number and URL-encoded message
+                    url = f"https://web.whatsapp.com/send?phone={phone_number}&text={urllib.parse.quote(message)}"
+                    driver.get(url)
+                    
+                    # Wait for the message input box to load
+                    WebDriverWait(driver, 30).until(EC.presence_of_element_located(MESSAGE_BOX))
+                    current_chat = phone_number
+                
+                # Wait for send button to be clickable
+                send_button = WebDriverWait(driver, 10).until(EC.element_to_be_clickable(SEND_BUTTON))
+                
+                # Click the send button and wait for the new message's tick
+                mark_outgoing_messages(driver)
+                send_button.click()
+                
+                status = wait_for_message_confirmation(driver)
+                if not status:
+                    raise TimeoutException(f"Message not confirmed within {settings.WHATSAPP_CONFIRM_TIMEOUT_SECONDS}s")
+                
+                result['success'] = True
+                result['status'] = status
+                logger.info(f"Message {status} to {phone_number} successfully!")
+            
+            except Exception as e:
+                logger.error(f"Error sending message to {phone_number}: {str(e)}")
+                result['error'] = str(e)
+                current_chat = None
+                # Take screenshot for debugging
+                try:
+                    driver.save_screenshot('error_screenshot.png')
+                except WebDriverException:
+                    pass
+                # On an authentication error, mark the session expired in the session info file
+                if "auth" in str(e).lower() or "login" in str(e).lower():
+                    logger.warning("Authentication issue detected. Session might be expired.")
+                    # Force session reinitialization next time
+                    save_session_info({"last_auth_date": None})
+                    break
     
     finally:
         # Close the browser
         driver.quit()
+    
+    for result in results:
+        if not result['success'] and result['error'] is None:
+            result['error'] = "not attempted after an authentication failure"
+    
+    sent = sum(1 for result in results if result['success'])
+    if len(batch) > 1:
+        logger.info(f"Sent {sent} of {len(batch)} WhatsApp messages in one browser session")
+    return results
 
 def send_whatsapp_message_pywhatkit(phone_number, message):
     """
@@ -221,13 +348,16 @@ def send_whatsapp_message_pywhatkit(phone_number, message):
         if not is_session_valid():
             logger.info("Session may be expired. PyWhatKit will open a new browser window.")
         
+        # Imported on first use: pywhatkit is slow to load and opens a display connection
+        import pywhatkit as pwk
+        
         # Send message immediately using pywhatkit
         logger.info(f"Sending message to {phone_number} using PyWhatKit...")
         pwk.sendwhatmsg_instantly(
             phone_no=phone_number,
             message=message,
             tab_close=True,  # Close browser tab after sending
-            wait_time=20     # Increased wait time to allow for page loading
+            wait_time=settings.WHATSAPP_PYWHATKIT_WAIT_SECONDS  # PyWhatKit types blind, so it needs a fixed page-load wait
         )
         
         # Update session info after successful sending
@@ -240,7 +370,31 @@ def send_whatsapp_message_pywhatkit(phone_number, message):
         logger.error(f"Error sending message using PyWhatKit: {str(e)}")
         return False
 
-def send_whatsapp_message(phone_number, message, use_headless=True):
+def send_whatsapp_message_batch(batch):
+    """
+    Send a batch of WhatsApp messages, through the persistent driver if enabled
+    
+    Args:
+        batch: List of (phone_number, message) pairs
+    
+    Returns:
+        list: Per-message result dicts, see send_whatsapp_messages
+    """
+    if not settings.WHATSAPP_PERSISTENT_DRIVER:
+        return send_whatsapp_messages(batch)
+    
+    # Imported here to avoid a circular import; the sender builds on this module
+    from utils.whatsapp_sender import get_persistent_sender
+    sender = get_persistent_sender()
+    results = []
+    for phone_number, message in batch:
+        clean_number = phone_number[1:] if phone_number.startswith("+") else phone_number
+        success = sender.send(clean_number, message)
+        results.append({'phone': phone_number, 'success': success, 'status': None,
+                        'error': None if success else "send failed"})
+    return results
+
+def send_whatsapp_message(phone_number, message, use_headless=True, timeout=None):
     """
     Send WhatsApp message using the appropriate method based on use_headless flag
     
@@ -248,6 +402,8 @@ def send_whatsapp_message(phone_number, message, use_headless=True):
         phone_number: Phone number with country code in format "+XXXXXXXXXXXX"
         message: Message to send
         use_headless: Whether to use headless browser (True) or visible browser (False)
+        timeout: Seconds the persistent driver may wait for the send; a send
+                 still queued when it runs out is dropped
         
     Returns:
         bool: True if message sent successfully, False otherwise
@@ -255,6 +411,10 @@ def send_whatsapp_message(phone_number, message, use_headless=True):
     if use_headless:
         # Remove "+" if present for the headless version
         clean_number = phone_number[1:] if phone_number.startswith("+") else phone_number
+        if settings.WHATSAPP_PERSISTENT_DRIVER:
+            # Imported here to avoid a circular import; the sender builds on this module
+            from utils.whatsapp_sender import get_persistent_sender
+            return get_persistent_sender().send(clean_number, message, timeout=timeout)
         return send_whatsapp_message_headless(clean_number, message)
     else:
         return send_whatsapp_message_pywhatkit(phone_number, message)
\ No newline at end of file
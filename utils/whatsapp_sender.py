@@ -0,0 +1,241 @@
+import queue
+import atexit
+import threading
+import urllib.parse
+import logging
+from concurrent.futures import Future
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException, TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+import config.settings as settings
+from utils.whatsapp_notifications import (
+    INSERT_TEXT_SCRIPT,
+    MESSAGE_BOX,
+    SEND_BUTTON,
+    build_headless_chrome_options,
+    check_and_reinitialize_session,
+    is_session_valid,
+    mark_outgoing_messages,
+    save_session_info,
+    wait_for_message_confirmation
+)
+
+logger = logging.getLogger(__name__)
+
+WHATSAPP_WEB_URL = "https://web.whatsapp.com/"
+
+# WhatsApp Web element locators
+CHAT_LIST = (By.ID, "pane-side")
+LOGIN_QR_CODE = (By.XPATH, "//canvas[@aria-label]")
+SEARCH_BOX = (By.XPATH, "//div[@contenteditable='true'][@data-tab='3']")
+# Only shown once the chat list has been filtered by a search
+SEARCH_RESULT = (By.XPATH, "//div[@id='pane-side']//div[@aria-label='Search results.']//div[@role='listitem']")
+
+# Replaces whatever is in the chat search box, which insertText alone would append to
+REPLACE_TEXT_SCRIPT = ("arguments[0].focus(); document.execCommand('selectAll', false, null); "
+                       "document.execCommand('insertText', false, arguments[1]);")
+
+# How long to wait for the chat list to show a searched contact before using the deep link
+SEARCH_TIMEOUT_SECONDS = 5
+
+class PersistentWhatsAppSender:
+    """
+    Keeps one authenticated headless WhatsApp Web session open and sends queued
+    messages through it back to back
+
+    Chats are opened through the app's own search box, so WhatsApp Web loads once
+    per Chrome start; the send?phone= link, which reloads it, is only the
+    fallback for numbers the search cannot find.
+
+    All driver access happens on a single worker thread, since Selenium drivers
+    are not thread-safe.
+    """
+
+    def __init__(self, max_sends=None, load_timeout=None):
+        self.max_sends = max_sends or settings.WHATSAPP_DRIVER_MAX_SENDS
+        self.load_timeout = load_timeout or settings.WHATSAPP_LOAD_TIMEOUT_SECONDS
+        self.driver = None
+        self.current_chat = None
+        self.sends_since_start = 0
+        self.jobs = queue.Queue()
+        self.worker = threading.Thread(target=self._run, name="whatsapp-sender", daemon=True)
+        self.worker.start()
+
+    def send(self, phone_number, message, timeout=None):
+        """
+        Queue a message and wait for it to be sent
+
+        Args:
+            phone_number: Phone number with country code but without + or spaces
+            message: Message to send
+            timeout: Seconds to wait for the result, or None to wait indefinitely
+
+        Returns:
+            bool: True if message sent successfully, False otherwise
+        """
+        future = Future()
+        self.jobs.put((phone_number, message, future))
+        try:
+            return future.result(timeout=timeout)
+        except Exception as e:
+            # Drop the job if it has not started, so a send reported as failed never goes out later
+            future.cancel()
+            logger.error(f"Error waiting for WhatsApp send to {phone_number}: {str(e)}")
+            return False
+
+    def close(self):
+        """Stop the worker and quit Chrome"""
+        self.jobs.put(None)
+        self.worker.join(timeout=30)
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            phone_number, message, future = job
+            if future.set_running_or_notify_cancel():
+                future.set_result(self._send_now(phone_number, message))
+        self._quit_driver()
+
+    def _quit_driver(self):
+        if self.driver:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                logger.debug(f"Error quitting Chrome: {str(e)}")
+            self.driver = None
+        self.current_chat = None
+
+    def _start_driver(self):
+        """Launch Chrome and wait for WhatsApp Web to finish loading"""
+        self._quit_driver()
+        logger.info("Starting persistent WhatsApp Web session...")
+        self.driver = webdriver.Chrome(options=build_headless_chrome_options())
+        self.sends_since_start = 0
+        self.driver.get(WHATSAPP_WEB_URL)
+
+        try:
+            WebDriverWait(self.driver, self.load_timeout).until(
+                EC.presence_of_element_located(CHAT_LIST)
+            )
+        except TimeoutException:
+            if self.driver.find_elements(*LOGIN_QR_CODE):
+                logger.warning("WhatsApp Web is asking for a QR scan. Session has expired.")
+                # Force session reinitialization next time
+                save_session_info({"last_auth_date": None})
+            self._quit_driver()
+            raise
+        logger.info("WhatsApp Web session ready")
+
+    def _is_healthy(self):
+        """Check that Chrome is alive and still showing a logged-in WhatsApp Web"""
+        if not self.driver:
+            return False
+        try:
+            return (self.driver.current_url.startswith(WHATSAPP_WEB_URL)
+                    and bool(self.driver.find_elements(*CHAT_LIST)))
+        except WebDriverException:
+            return False
+
+    def _ensure_driver(self):
+        if self.sends_since_start >= self.max_sends:
+            logger.info(f"Restarting Chrome after {self.sends_since_start} sends")
+            self._start_driver()
+        elif not self._is_healthy():
+            if self.driver:
+                logger.warning("WhatsApp Web driver is unhealthy, restarting Chrome")
+            self._start_driver()
+
+    def _open_chat(self, phone_number):
+        """Return the message box for a chat, switching to it inside the loaded app when possible"""
+        if self.current_chat == phone_number:
+            input_boxes = self.driver.find_elements(*MESSAGE_BOX)
+            if input_boxes:
+                return input_boxes[0]
+
+        self.current_chat = None
+        input_box = self._search_chat(phone_number)
+        if input_box is None:
+            # Not a saved contact: the deep link reloads the app but reuses the logged-in Chrome
+            logger.info(f"{phone_number} not found in the chat list, opening it by link")
+            self.driver.get(f"{WHATSAPP_WEB_URL}send?phone={urllib.parse.quote(phone_number)}")
+            input_box = WebDriverWait(self.driver, self.load_timeout).until(
+                EC.presence_of_element_located(MESSAGE_BOX)
+            )
+        self.current_chat = phone_number
+        return input_box
+
+    def _search_chat(self, phone_number):
+        """Open a chat through the chat search box, without reloading WhatsApp Web"""
+        try:
+            search_box = self.driver.find_element(*SEARCH_BOX)
+            self.driver.execute_script(REPLACE_TEXT_SCRIPT, search_box, phone_number)
+            WebDriverWait(self.driver, SEARCH_TIMEOUT_SECONDS).until(
+                EC.presence_of_element_located(SEARCH_RESULT)
+            )
+            # Enter opens the first match
+            search_box.send_keys(Keys.ENTER)
+            return WebDriverWait(self.driver, SEARCH_TIMEOUT_SECONDS).until(
+                EC.presence_of_element_located(MESSAGE_BOX)
+            )
+        except (TimeoutException, WebDriverException) as e:
+            logger.debug(f"Chat search for {phone_number} failed: {str(e)}")
+            return None
+
+    def _send_now(self, phone_number, message):
+        # Reinitializing opens a visible browser on the same profile, so release it first
+        if not is_session_valid():
+            self._quit_driver()
+
+        # Reuse the session checks of the one-shot sender before touching Chrome
+        if not check_and_reinitialize_session():
+            logger.error("Failed to initialize or verify session. Message not sent.")
+            return False
+
+        try:
+            self._ensure_driver()
+            logger.info(f"Sending message to {phone_number}...")
+
+            input_box = self._open_chat(phone_number)
+            self.driver.execute_script(INSERT_TEXT_SCRIPT, input_box, message)
+
+            send_button = WebDriverWait(self.driver, 10).until(EC.element_to_be_clickable(SEND_BUTTON))
+            mark_outgoing_messages(self.driver)
+            send_button.click()
+            self.sends_since_start += 1
+
+            status = wait_for_message_confirmation(self.driver)
+            if not status:
+                logger.error(f"Message to {phone_number} was not confirmed within "
+                             f"{settings.WHATSAPP_CONFIRM_TIMEOUT_SECONDS}s")
+                return False
+
+            logger.info(f"Message {status} to {phone_number} successfully!")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error sending message: {str(e)}")
+            if self.driver:
+                try:
+                    self.driver.save_screenshot('error_screenshot.png')
+                except WebDriverException:
+                    pass
+            # Start from a fresh Chrome on the next send
+            self._quit_driver()
+            return False
+
+_sender = None
+_sender_lock = threading.Lock()
+
+def get_persistent_sender():
+    """Return the process-wide persistent WhatsApp sender, starting it on first use"""
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = PersistentWhatsAppSender()
+            atexit.register(_sender.close)
+        return _sender
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; writes are then only serialized within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_INFO = {"last_auth_date": None}
+
+class SessionStateManager:
+    """
+    In-memory cache of the WhatsApp session info file
+
+    Reads are served from memory and the file is re-read only when its mtime
+    changes, checked at most once per stat_interval seconds. Writes go to a
+    temporary file that is renamed over the original, serialized by a thread
+    lock and an advisory file lock so several processes never interleave writes.
+    """
+
+    def __init__(self, path, stat_interval=5.0):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.stat_interval = stat_interval
+        self._state = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as file:
+                state = json.load(file)
+            return state if isinstance(state, dict) else dict(DEFAULT_SESSION_INFO)
+        except FileNotFoundError:
+            return dict(DEFAULT_SESSION_INFO)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read {self.path}: {str(e)}")
+            return dict(DEFAULT_SESSION_INFO)
+
+    def get(self):
+        """Return the session info, re-reading the file only if it changed on disk"""
+        with self._lock:
+            now = time.monotonic()
+            if self._state is None or now - self._checked_at >= self.stat_interval:
+                self._checked_at = now
+                mtime = self._current_mtime()
+                if self._state is None or mtime != self._mtime:
+                    self._state = self._load()
+                    self._mtime = mtime
+            return dict(self._state)
+
+    def save(self, state):
+        """Atomically replace the session info file and update the cache"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with self._lock:
+            with open(self.lock_path, 'a') as lock_file:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.session_info.', suffix='.tmp')
+                    try:
+                        with os.fdopen(fd, 'w') as file:
+                            json.dump(state, file)
+                            file.flush()
+                            os.fsync(file.fileno())
+                        os.replace(tmp_path, self.path)
+                    except BaseException:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                        raise
+                finally:
+                    if fcntl:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+            self._state = dict(state)
+            self._mtime = self._current_mtime()
+            self._checked_at = time.monotonic()
+
+    def delete(self):
+        """
+        Remove the session info file
+
+        Returns:
+            bool: True if a file was removed
+        """
+        with self._lock:
+            try:
+                os.remove(self.path)
+                removed = True
+            except FileNotFoundError:
+                removed = False
+            self._state = dict(DEFAULT_SESSION_INFO)
+            self._mtime = None
+            self._checked_at = time.monotonic()
+            return removed